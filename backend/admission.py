@@ -0,0 +1,169 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Set
+
+from env import env_float, env_int
+
+# 优先级：数值越小越先被放行，短小的总结请求优先于聊天，后台任务最后
+PRIORITY_SUMMARY = 0
+PRIORITY_CHAT = 1
+PRIORITY_BACKGROUND = 2
+
+_PRIORITY_NAMES = {PRIORITY_SUMMARY: "summary", PRIORITY_CHAT: "chat", PRIORITY_BACKGROUND: "background"}
+
+
+# 请求被拒绝（排队已满、等待超时或同一会话已有进行中的请求）
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+# 已获得的上游调用名额，release() 可以重复调用
+class AdmissionTicket:
+    def __init__(self, controller: "AdmissionController", session_key: Optional[str]):
+        self._controller = controller
+        self._session_key = session_key
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self._session_key, time.monotonic() - self._started)
+
+
+# 上游调用的准入控制：全局并发上限 + 每个会话一个进行中的聊天 + 有界的FIFO等待队列
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight: int = 32,
+        max_queue: int = 256,
+        max_wait: float = 15.0,
+    ):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._inflight = 0
+        self._queues: Dict[int, deque] = {priority: deque() for priority in _PRIORITY_NAMES}
+        self._sessions: Set[str] = set()
+        # 上游调用耗时的指数移动平均，用于估算 Retry-After
+        self._service_time = 2.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.rejected_session_busy = 0
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_inflight=env_int("ADMISSION_MAX_INFLIGHT", 32),
+            max_queue=env_int("ADMISSION_MAX_QUEUE", 256),
+            max_wait=env_float("ADMISSION_MAX_WAIT", 15.0),
+        )
+
+    def _waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _retry_after(self) -> int:
+        # 估算当前排队请求全部处理完所需的时间
+        backlog = self._waiting() + 1
+        return max(1, math.ceil(backlog * self._service_time / max(self.max_inflight, 1)))
+
+    async def acquire(self, priority: int, session_id: Optional[str] = None) -> AdmissionTicket:
+        session_key = None
+        if session_id and priority == PRIORITY_CHAT:
+            if session_id in self._sessions:
+                self.rejected_session_busy += 1
+                raise AdmissionRejected(429, "A chat request for this session is already in progress", 1)
+            session_key = session_id
+            self._sessions.add(session_key)
+        try:
+            await self._acquire_slot(priority)
+        except BaseException:
+            if session_key is not None:
+                self._sessions.discard(session_key)
+            raise
+        self.admitted += 1
+        return AdmissionTicket(self, session_key)
+
+    @asynccontextmanager
+    async def admit(self, priority: int, session_id: Optional[str] = None):
+        ticket = await self.acquire(priority, session_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    async def _acquire_slot(self, priority: int) -> None:
+        if self._inflight < self.max_inflight and self._waiting() == 0:
+            self._inflight += 1
+            return
+
+        if self._waiting() >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(503, "Server is busy, please retry later", self._retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues[priority]
+        queue.append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(queue, future)
+            self.rejected_timeout += 1
+            raise AdmissionRejected(503, "Timed out waiting for an upstream slot", self._retry_after())
+        except asyncio.CancelledError:
+            self._abandon(queue, future)
+            raise
+
+    def _abandon(self, queue: deque, future: asyncio.Future) -> None:
+        # 如果名额恰好在超时/取消时被分配给了这个等待者，需要归还
+        if future.done() and not future.cancelled():
+            self._release_slot()
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+
+    def _release(self, session_key: Optional[str], elapsed: float) -> None:
+        if session_key is not None:
+            self._sessions.discard(session_key)
+        self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        self._inflight -= 1
+        # 按优先级把名额直接交给下一个等待者
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            while queue:
+                future = queue.popleft()
+                if not future.done():
+                    self._inflight += 1
+                    future.set_result(None)
+                    return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "maxInflight": self.max_inflight,
+            "maxQueue": self.max_queue,
+            "maxWait": self.max_wait,
+            "inflight": self._inflight,
+            "waiting": {_PRIORITY_NAMES[p]: len(q) for p, q in self._queues.items()},
+            "activeSessions": len(self._sessions),
+            "avgServiceTime": round(self._service_time, 3),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejectedQueueFull": self.rejected_queue_full,
+            "rejectedTimeout": self.rejected_timeout,
+            "rejectedSessionBusy": self.rejected_session_busy,
+        }
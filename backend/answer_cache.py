@@ -0,0 +1,250 @@
+import math
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+from env import env_bool, env_float, env_int
+from persistent_cache import PersistentCache
+
+try:
+    import numpy as np
+except ImportError:  # 没有安装 numpy 时使用纯Python的稀疏向量计算相似度
+    np = None
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+# 问题的哈希n-gram词频向量 {维度: 权重}：词、相邻词对和词内的字符三元组，
+# 字符三元组让拼写差异和词形变化仍然相似；词频取对数以减弱重复词的影响
+def question_features(text: str, dimensions: int) -> Dict[int, float]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    counts: Dict[int, int] = {}
+
+    def add(feature: str) -> None:
+        index = zlib.crc32(feature.encode("utf-8")) % dimensions
+        counts[index] = counts.get(index, 0) + 1
+
+    for i, token in enumerate(tokens):
+        add("w:" + token)
+        if i > 0:
+            add("b:" + tokens[i - 1] + " " + token)
+        padded = f" {token} "
+        for j in range(len(padded) - 2):
+            add("c:" + padded[j:j + 3])
+    return {index: 1.0 + math.log(count) for index, count in counts.items()}
+
+
+class _AnswerEntry:
+    __slots__ = ("key", "scope", "question", "answer", "expires_at", "vector", "hits")
+
+    def __init__(self, key: str, scope: str, question: str, answer: str, expires_at: float, vector: Dict[int, float]):
+        self.key = key
+        self.scope = scope
+        self.question = question
+        self.answer = answer
+        self.expires_at = expires_at
+        self.vector = vector
+        self.hits = 0
+
+
+# 一个章节内的问题索引。IDF按章节内的问题统计，随问题增删增量更新；
+# 安装了 numpy 时词频向量保存在按行增长的矩阵中，一次矩阵乘法算出所有问题的相似度
+class _SectionIndex:
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self.entries: List[_AnswerEntry] = []
+        if np is not None:
+            self.matrix = np.zeros((8, dimensions), dtype=np.float32)
+            self.df = np.zeros(dimensions, dtype=np.float32)
+        else:
+            self.df_counts: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, entry: _AnswerEntry) -> None:
+        row = len(self.entries)
+        self.entries.append(entry)
+        indices = list(entry.vector)
+        if np is not None:
+            if row >= self.matrix.shape[0]:
+                grown = np.zeros((self.matrix.shape[0] * 2, self.dimensions), dtype=np.float32)
+                grown[:row] = self.matrix[:row]
+                self.matrix = grown
+            self.matrix[row, indices] = list(entry.vector.values())
+            self.df[indices] += 1
+        else:
+            for index in indices:
+                self.df_counts[index] = self.df_counts.get(index, 0) + 1
+
+    def remove(self, entry: _AnswerEntry) -> None:
+        row = self.entries.index(entry)
+        last = len(self.entries) - 1
+        indices = list(entry.vector)
+        # 用最后一行填补被删除的行，矩阵保持紧凑
+        self.entries[row] = self.entries[last]
+        self.entries.pop()
+        if np is not None:
+            self.matrix[row] = self.matrix[last]
+            self.matrix[last] = 0
+            self.df[indices] -= 1
+        else:
+            for index in indices:
+                self.df_counts[index] -= 1
+                if not self.df_counts[index]:
+                    del self.df_counts[index]
+
+    # 返回与问题向量余弦相似度（TF-IDF加权）最高的条目和相似度
+    def nearest(self, vector: Dict[int, float]) -> Tuple[Optional[_AnswerEntry], float]:
+        count = len(self.entries)
+        if not count or not vector:
+            return None, 0.0
+        if np is not None:
+            idf = np.log((1.0 + count) / (1.0 + self.df)) + 1.0
+            query = np.zeros(self.dimensions, dtype=np.float32)
+            query[list(vector)] = list(vector.values())
+            query *= idf
+            weighted = self.matrix[:count] * idf
+            norms = np.linalg.norm(weighted, axis=1) * np.linalg.norm(query)
+            similarities = (weighted @ query) / np.maximum(norms, 1e-12)
+            best = int(np.argmax(similarities))
+            return self.entries[best], float(similarities[best])
+
+        def idf(index: int) -> float:
+            return math.log((1.0 + count) / (1.0 + self.df_counts.get(index, 0))) + 1.0
+
+        weights = {index: value * idf(index) for index, value in vector.items()}
+        query_norm = math.sqrt(sum(w * w for w in weights.values()))
+        best_entry, best_similarity = None, 0.0
+        for entry in self.entries:
+            dot = 0.0
+            norm = 0.0
+            for index, value in entry.vector.items():
+                weighted = value * idf(index)
+                norm += weighted * weighted
+                if index in weights:
+                    dot += weighted * weights[index]
+            similarity = dot / max(math.sqrt(norm) * query_norm, 1e-12)
+            if similarity > best_similarity:
+                best_entry, best_similarity = entry, similarity
+        return best_entry, best_similarity
+
+
+# 按章节划分的语义答案缓存：同一章节中与已回答的首轮问题足够相似的问题直接返回缓存的答案。
+# 全局LRU + TTL淘汰，可选持久化到JSON文件（向量在加载时重新计算）
+class AnswerCache(PersistentCache):
+    cache_name = "answer cache"
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        threshold: float = 0.9,
+        max_entries: int = 2048,
+        ttl_seconds: float = 7 * 24 * 3600,
+        dimensions: int = 2048,
+        path: Optional[str] = None,
+        flush_interval: float = 60.0,
+    ):
+        super().__init__(path, flush_interval)
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.dimensions = dimensions
+        self._entries: "OrderedDict[str, _AnswerEntry]" = OrderedDict()
+        self._sections: Dict[str, _SectionIndex] = {}
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "AnswerCache":
+        return cls(
+            enabled=env_bool("ANSWER_CACHE_ENABLED", False),
+            threshold=env_float("ANSWER_CACHE_THRESHOLD", 0.9),
+            max_entries=env_int("ANSWER_CACHE_MAX_ENTRIES", 2048),
+            ttl_seconds=env_float("ANSWER_CACHE_TTL_SECONDS", 7 * 24 * 3600),
+            dimensions=env_int("ANSWER_CACHE_DIMENSIONS", 2048),
+            path=os.getenv("ANSWER_CACHE_PATH") or None,
+            flush_interval=env_float("ANSWER_CACHE_FLUSH_INTERVAL", 60.0),
+        )
+
+    # 返回 (答案, 相似度)；相似度低于阈值或最相似的答案已过期时返回None
+    def lookup(self, scope: str, question: str) -> Optional[Tuple[str, float]]:
+        index = self._sections.get(scope)
+        entry, similarity = index.nearest(question_features(question, self.dimensions)) if index else (None, 0.0)
+        if entry is not None and entry.expires_at <= time.time():
+            self._remove(entry)
+            entry = None
+        if entry is None or similarity < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        entry.hits += 1
+        self._entries.move_to_end(entry.key)
+        return entry.answer, similarity
+
+    def store(self, scope: str, question: str, answer: str, expires_at: Optional[float] = None) -> None:
+        vector = question_features(question, self.dimensions)
+        if not vector:
+            return
+        index = self._sections.get(scope)
+        if index is None:
+            index = self._sections[scope] = _SectionIndex(self.dimensions)
+        elif index.nearest(vector)[1] >= self.threshold:
+            # 并发的相似问题已经存过答案
+            return
+        key = str(self._next_key)
+        self._next_key += 1
+        entry = _AnswerEntry(key, scope, question, answer, expires_at or time.time() + self.ttl_seconds, vector)
+        self._entries[key] = entry
+        index.add(entry)
+        self.stores += 1
+        self._dirty = True
+        while len(self._entries) > self.max_entries > 0:
+            self._remove(next(iter(self._entries.values())))
+            self.evictions += 1
+
+    def _remove(self, entry: _AnswerEntry) -> None:
+        del self._entries[entry.key]
+        index = self._sections[entry.scope]
+        index.remove(entry)
+        if not len(index):
+            del self._sections[entry.scope]
+        self._dirty = True
+
+    def _snapshot(self) -> list:
+        return [[e.scope, e.question, e.answer, e.expires_at] for e in self._entries.values()]
+
+    def _restore(self, entries: list) -> None:
+        now = time.time()
+        for scope, question, answer, expires_at in entries:
+            if expires_at > now:
+                self.store(scope, question, answer, expires_at)
+
+    async def start(self) -> None:
+        if self.enabled:
+            await super().start()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "backend": "numpy" if np is not None else "python",
+            "entries": len(self._entries),
+            "sections": len(self._sections),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+            "persistent": bool(self.path),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
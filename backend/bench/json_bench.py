@@ -0,0 +1,138 @@
+"""JSON编解码和响应压缩的微基准：对比标准库 json 与 orjson，以及压缩前后的响应大小和耗时。
+
+在 backend 目录下运行：
+
+    python bench/json_bench.py --messages 500 --output json-bench.json
+
+解码使用上游聊天补全响应体，编码使用会话历史页（含中文内容）。
+编码对比 FastAPI 默认路径（jsonable_encoder + 标准库 json）和 FastJSONResponse 的直接渲染。
+没有安装 orjson 或 brotli 时对应的结果为 null。
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import sys
+import time
+from typing import Optional, Dict, Any, Callable
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+
+import json_codec
+from json_codec import FastJSONResponse
+from static_assets import brotli
+
+
+def history_page(messages: int) -> Dict[str, Any]:
+    page = []
+    for seq in range(1, messages + 1):
+        role = "user" if seq % 2 else "assistant"
+        content = (
+            f"第{seq}条消息：TF-IDF 用词频乘以逆文档频率衡量一个词对文档的重要性。"
+            "Cosine similarity compares the angle between two document vectors. " * (1 if role == "user" else 4)
+        )
+        page.append({"seq": seq, "role": role, "content": content})
+    return {"messages": page, "lastSeq": messages, "hasMore": False, "nextBefore": None}
+
+
+def upstream_body(content_chars: int) -> bytes:
+    return json.dumps({
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": 1700000000,
+        "model": "bench",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": ("逆文档频率 inverse document frequency. " * content_chars)[:content_chars]},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 1200, "completion_tokens": content_chars // 4, "total_tokens": 1200 + content_chars // 4},
+    }, ensure_ascii=False).encode("utf-8")
+
+
+# 每次操作的耗时（微秒），取多轮中最快的一轮
+def measure(fn: Callable[[], Any], iterations: int, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        best = min(best, (time.perf_counter() - started) / iterations)
+    return round(best * 1e6, 2)
+
+
+def compare(baseline: float, candidate: Optional[float]) -> Optional[float]:
+    return round(baseline / candidate, 2) if candidate else None
+
+
+def main(args: argparse.Namespace) -> Dict[str, Any]:
+    run = lambda fn: measure(fn, args.iterations, args.repeats)
+    orjson = json_codec.orjson
+
+    body = upstream_body(args.content_chars)
+    decode = {"bytes": len(body), "stdlibUs": run(lambda: json.loads(body))}
+    decode["orjsonUs"] = run(lambda: orjson.loads(body)) if orjson is not None else None
+    decode["speedup"] = compare(decode["stdlibUs"], decode["orjsonUs"])
+
+    page = history_page(args.messages)
+    rendered = FastJSONResponse(page).body
+    encode = {
+        "bytes": len(rendered),
+        "defaultUs": run(lambda: JSONResponse(jsonable_encoder(page)).body),
+        "fastUs": run(lambda: FastJSONResponse(page).body),
+        "backend": json_codec.JSON_BACKEND,
+    }
+    encode["speedup"] = compare(encode["defaultUs"], encode["fastUs"])
+
+    compression: Dict[str, Any] = {"bytes": len(rendered)}
+    gzipped = gzip.compress(rendered, compresslevel=args.gzip_level)
+    compression["gzip"] = {
+        "level": args.gzip_level,
+        "bytes": len(gzipped),
+        "ratio": round(len(gzipped) / len(rendered), 4),
+        "us": run(lambda: gzip.compress(rendered, compresslevel=args.gzip_level)),
+    }
+    if brotli is not None:
+        compressed = brotli.compress(rendered, quality=args.brotli_quality)
+        compression["br"] = {
+            "quality": args.brotli_quality,
+            "bytes": len(compressed),
+            "ratio": round(len(compressed) / len(rendered), 4),
+            "us": run(lambda: brotli.compress(rendered, quality=args.brotli_quality)),
+        }
+    else:
+        compression["br"] = None
+
+    return {
+        "python": platform.python_version(),
+        "orjson": getattr(orjson, "__version__", None) if orjson is not None else None,
+        "iterations": args.iterations,
+        "repeats": args.repeats,
+        "decodeUpstream": decode,
+        "encodeHistory": encode,
+        "compressHistory": compression,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JSON codec and response compression micro-benchmark")
+    parser.add_argument("--messages", type=int, default=500, help="编码的会话历史页中的消息数")
+    parser.add_argument("--content-chars", type=int, default=4000, help="解码的上游回复内容长度（字符）")
+    parser.add_argument("--iterations", type=int, default=200, help="每轮的操作次数")
+    parser.add_argument("--repeats", type=int, default=5, help="轮数，取最快的一轮")
+    parser.add_argument("--gzip-level", type=int, default=6, help="gzip压缩级别（与 COMPRESSION_GZIP_LEVEL 一致）")
+    parser.add_argument("--brotli-quality", type=int, default=4, help="brotli压缩质量（与 COMPRESSION_BROTLI_QUALITY 一致）")
+    parser.add_argument("--output", help="结果写入的文件（默认输出到stdout）")
+    args = parser.parse_args()
+
+    result = json.dumps(main(args), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(result + "\n")
+    else:
+        print(result)
@@ -0,0 +1,464 @@
+"""可复现的离线压测：启动本地模拟上游和后端，按场景施加并发负载，输出JSON结果。
+
+在 backend 目录下运行：
+
+    python bench/loadtest.py --duration 10 --concurrency 16 --output bench-results.json
+    python bench/loadtest.py --scenarios chat,checkpoint --baseline bench-results.json
+
+结果包含每个场景的吞吐、p50/p95/p99延迟、错误数和后端进程内存增长，
+可以保存下来在不同提交之间对比。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+import httpx
+
+from mock_upstream import add_mock_arguments
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(BACKEND_DIR, "bench")
+
+ALL_SCENARIOS = ["chat", "chat_stream", "summary", "checkpoint", "checkpoints", "static"]
+
+
+# ---------- 进程管理 ----------
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def read_rss(pid: int) -> Optional[int]:
+    # 读取进程的常驻内存（字节）；非Linux系统上尝试psutil
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"process exited with code {process.returncode} before becoming ready: {url}")
+            try:
+                response = await client.get(url, timeout=1.0)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+
+def stop_process(process: Optional[subprocess.Popen]) -> None:
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# 生成一个与Vite构建产物结构相同的前端目录，压测不依赖真实的前端构建
+def write_fake_dist(root: str) -> Dict[str, str]:
+    os.makedirs(os.path.join(root, "assets"), exist_ok=True)
+    files = {
+        "index.html": '<!doctype html><html><head><script type="module" src="/assets/index-Bench1234.js"></script>'
+                      '<link rel="stylesheet" href="/assets/index-Bench5678.css"></head><body><div id="root"></div></body></html>',
+        "assets/index-Bench1234.js": "".join(f"export function f{i}(x){{return x*{i}+{i % 7};}}\n" for i in range(6000)),
+        "assets/index-Bench5678.css": "".join(f".c{i}{{margin:{i % 16}px;padding:{i % 9}px}}\n" for i in range(3000)),
+    }
+    for path, content in files.items():
+        with open(os.path.join(root, path), "w", encoding="utf-8") as f:
+            f.write(content)
+    return files
+
+
+# ---------- 场景 ----------
+
+def load_sections() -> List[str]:
+    with open(os.path.join(BACKEND_DIR, "checkpoints.json"), encoding="utf-8") as f:
+        bank = json.load(f)
+    course = bank["courses"][bank["defaultCourse"]]
+    return list(course["sections"].keys())
+
+
+class Scenario:
+    def __init__(self, name: str, build: Callable[[int, int, random.Random], Tuple[str, str, Dict[str, Any]]],
+                 stream: bool = False):
+        self.name = name
+        self.build = build
+        self.stream = stream
+
+
+def build_scenarios(sections: List[str], summary_variants: int) -> Dict[str, Scenario]:
+    question = {
+        "question": "Which metric is most appropriate for an imbalanced spam dataset?",
+        "options": [
+            {"id": "a", "text": "Accuracy"},
+            {"id": "b", "text": "F1 score"},
+            {"id": "c", "text": "Mean squared error"},
+        ],
+        "correctAnswerId": "b",
+    }
+    section_content = "Spam classification with naive Bayes. " * 40
+
+    def chat(worker: int, i: int, rng: random.Random):
+        # 每个worker使用自己的会话，会话历史随压测增长
+        return "POST", "/api/chat", {
+            "message": f"Question {i} from worker {worker}: how does Laplace smoothing work?",
+            "sessionId": f"bench-chat-{worker}",
+            "currentSection": rng.choice(sections),
+        }
+
+    def chat_stream(worker: int, i: int, rng: random.Random):
+        return "POST", "/api/chat/stream", {
+            "message": f"Question {i} from worker {worker}: explain precision and recall.",
+            "sessionId": f"bench-stream-{worker}",
+            "currentSection": rng.choice(sections),
+        }
+
+    def summary(worker: int, i: int, rng: random.Random):
+        # 有限的输入组合，混合缓存命中和未命中
+        variant = rng.randrange(summary_variants)
+        answer = question["options"][variant % len(question["options"])]["id"]
+        return "POST", "/api/summary", {
+            "sessionId": f"bench-summary-{worker}",
+            "sectionId": sections[variant % len(sections)],
+            "sectionContent": f"{section_content} Variant {variant}.",
+            "checkpointQuestion": question,
+            "userAnswer": answer,
+            "isCorrect": answer == question["correctAnswerId"],
+        }
+
+    def checkpoint(worker: int, i: int, rng: random.Random):
+        return "POST", "/api/checkpoint", {"sectionId": rng.choice(sections)}
+
+    def checkpoints(worker: int, i: int, rng: random.Random):
+        return "GET", "/api/checkpoints", {}
+
+    def static(worker: int, i: int, rng: random.Random):
+        return "GET", rng.choice(["/", "/assets/index-Bench1234.js", "/assets/index-Bench5678.css"]), {}
+
+    return {
+        "chat": Scenario("chat", chat),
+        "chat_stream": Scenario("chat_stream", chat_stream, stream=True),
+        "summary": Scenario("summary", summary),
+        "checkpoint": Scenario("checkpoint", checkpoint),
+        "checkpoints": Scenario("checkpoints", checkpoints),
+        "static": Scenario("static", static),
+    }
+
+
+# ---------- 负载与统计 ----------
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # nearest-rank 分位数
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    to_ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "p50": to_ms(percentile(values, 0.50)),
+        "p95": to_ms(percentile(values, 0.95)),
+        "p99": to_ms(percentile(values, 0.99)),
+        "max": to_ms(values[-1] if values else None),
+        "mean": to_ms(sum(values) / len(values) if values else None),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+    seed: int,
+    backend_pid: Optional[int],
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    first_byte: List[float] = []
+    status_counts: Dict[str, int] = {}
+    errors = 0
+    rss_before = read_rss(backend_pid) if backend_pid else None
+    rss_peak = rss_before
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + worker_id)
+        i = 0
+        while time.perf_counter() < deadline:
+            method, path, body = scenario.build(worker_id, i, rng)
+            i += 1
+            start = time.perf_counter()
+            status = "exception"
+            try:
+                kwargs = {"json": body} if method == "POST" else {}
+                headers = {"Accept-Encoding": "gzip, br"}
+                if scenario.stream:
+                    async with client.stream(method, path, headers=headers, **kwargs) as response:
+                        status = str(response.status_code)
+                        got_first = False
+                        async for chunk in response.aiter_bytes():
+                            if not got_first and b'"delta"' in chunk:
+                                first_byte.append(time.perf_counter() - start)
+                                got_first = True
+                else:
+                    response = await client.request(method, path, headers=headers, **kwargs)
+                    status = str(response.status_code)
+            except httpx.HTTPError:
+                pass
+            latencies.append(time.perf_counter() - start)
+            status_counts[status] = status_counts.get(status, 0) + 1
+            if not status.startswith("2") and not status.startswith("3"):
+                errors += 1
+
+    async def sample_memory():
+        nonlocal rss_peak
+        while True:
+            await asyncio.sleep(0.5)
+            rss = read_rss(backend_pid)
+            if rss is not None and (rss_peak is None or rss > rss_peak):
+                rss_peak = rss
+
+    sampler = asyncio.create_task(sample_memory()) if backend_pid else None
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if sampler:
+        sampler.cancel()
+    rss_after = read_rss(backend_pid) if backend_pid else None
+
+    result = {
+        "concurrency": concurrency,
+        "durationSeconds": round(elapsed, 3),
+        "requests": len(latencies),
+        "errors": errors,
+        "statusCounts": status_counts,
+        "throughputRps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "latencyMs": summarize_latencies(latencies),
+        "rssBeforeBytes": rss_before,
+        "rssAfterBytes": rss_after,
+        "rssPeakBytes": rss_peak,
+        "rssGrowthBytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+    }
+    if scenario.stream:
+        result["firstTokenMs"] = summarize_latencies(first_byte)
+    return result
+
+
+# 与上一次的结果对比吞吐和延迟（正数表示变大）
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    def change(new, old):
+        if new is None or old in (None, 0):
+            return None
+        return round((new - old) / old * 100, 2)
+
+    comparison = {}
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        comparison[name] = {
+            "throughputRpsChangePct": change(current["throughputRps"], previous["throughputRps"]),
+            **{
+                f"{q}ChangePct": change(current["latencyMs"][q], previous["latencyMs"][q])
+                for q in ("p50", "p95", "p99")
+            },
+            "rssGrowthBytesDelta": (
+                current["rssGrowthBytes"] - previous["rssGrowthBytes"]
+                if current.get("rssGrowthBytes") is not None and previous.get("rssGrowthBytes") is not None
+                else None
+            ),
+        }
+    return comparison
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------- 入口 ----------
+
+async def main(args: argparse.Namespace) -> Dict[str, Any]:
+    scenario_names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenario_names) - set(ALL_SCENARIOS)
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="autopbl-bench-")
+    mock_process = backend_process = None
+    # 子进程的输出写到工作目录，避免和结果混在一起
+    mock_log = open(os.path.join(workdir, "mock.log"), "wb")
+    backend_log = open(os.path.join(workdir, "backend.log"), "wb")
+    try:
+        if args.target:
+            target = args.target.rstrip("/")
+            backend_pid = args.target_pid
+        else:
+            mock_port = free_port()
+            mock_cmd = [
+                sys.executable, os.path.join(BENCH_DIR, "mock_upstream.py"), "--port", str(mock_port),
+                "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+                "--stream-chunks", str(args.stream_chunks), "--chunk-delay-ms", str(args.chunk_delay_ms),
+                "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+                "--reply-words", str(args.reply_words), "--seed", str(args.seed),
+            ]
+            mock_process = subprocess.Popen(mock_cmd, cwd=BACKEND_DIR, stdout=mock_log, stderr=subprocess.STDOUT)
+            await wait_ready(f"http://127.0.0.1:{mock_port}/stats", mock_process)
+
+            # 后端使用临时目录中的会话库、总结缓存和前端文件，压测之间互不影响
+            dist_dir = os.path.join(workdir, "dist")
+            write_fake_dist(dist_dir)
+            env = {
+                **os.environ,
+                "OPENAI_API_KEY": "sk-bench-offline",
+                "OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1/chat/completions",
+                "SESSION_DB_PATH": os.path.join(workdir, "sessions.db"),
+                "SUMMARY_CACHE_PATH": os.path.join(workdir, "summary_cache.json"),
+                "FRONTEND_DIST_DIR": dist_dir,
+                "LOG_LEVEL": "WARNING",
+            }
+            for item in args.backend_env:
+                key, _, value = item.partition("=")
+                env[key] = value
+
+            backend_port = free_port()
+            if args.serve_workers:
+                # 通过 serve.py 的路由进程压测多worker部署
+                env.update({"SERVER_WORKERS": str(args.serve_workers), "HOST": "127.0.0.1", "PORT": str(backend_port)})
+                backend_cmd = [sys.executable, "serve.py"]
+            else:
+                backend_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(backend_port),
+                               "--log-level", "warning", "--no-access-log"]
+            backend_process = subprocess.Popen(
+                backend_cmd,
+                cwd=BACKEND_DIR,
+                env=env,
+                stdout=backend_log,
+                stderr=subprocess.STDOUT,
+            )
+            target = f"http://127.0.0.1:{backend_port}"
+            await wait_ready(f"{target}/api/health", backend_process)
+            backend_pid = backend_process.pid
+
+        scenarios = build_scenarios(load_sections(), args.summary_variants)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        timeout = httpx.Timeout(args.request_timeout)
+        results: Dict[str, Any] = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "gitCommit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "target": target if args.target else "local",
+                "serveWorkers": args.serve_workers,
+                "concurrency": args.concurrency,
+                "durationSeconds": args.duration,
+                "warmupSeconds": args.warmup,
+                "seed": args.seed,
+                "mock": None if args.target else {
+                    "latencyMs": args.latency_ms,
+                    "jitterMs": args.jitter_ms,
+                    "streamChunks": args.stream_chunks,
+                    "chunkDelayMs": args.chunk_delay_ms,
+                    "errorRate": args.error_rate,
+                    "errorStatus": args.error_status,
+                    "replyWords": args.reply_words,
+                },
+            },
+            "scenarios": {},
+        }
+
+        async with httpx.AsyncClient(base_url=target, limits=limits, timeout=timeout) as client:
+            for name in scenario_names:
+                if args.warmup > 0:
+                    await run_scenario(client, scenarios[name], args.concurrency, args.warmup, args.seed + 1, None)
+                results["scenarios"][name] = await run_scenario(
+                    client, scenarios[name], args.concurrency, args.duration, args.seed, backend_pid
+                )
+                print(f"{name}: {json.dumps(results['scenarios'][name]['latencyMs'])} "
+                      f"{results['scenarios'][name]['throughputRps']} req/s", file=sys.stderr)
+
+            try:
+                results["backendMetrics"] = (await client.get("/api/metrics")).json()
+            except (httpx.HTTPError, ValueError):
+                results["backendMetrics"] = None
+
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                results["comparison"] = compare(results, json.load(f))
+        return results
+    except BaseException:
+        print(f"benchmark failed, process logs kept in {workdir}", file=sys.stderr)
+        args.keep_workdir = True
+        raise
+    finally:
+        stop_process(backend_process)
+        stop_process(mock_process)
+        mock_log.close()
+        backend_log.close()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test for the AutoPBL backend")
+    parser.add_argument("--scenarios", default=",".join(ALL_SCENARIOS), help=f"逗号分隔的场景：{','.join(ALL_SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发的客户端数")
+    parser.add_argument("--duration", type=float, default=10, help="每个场景的压测时间（秒）")
+    parser.add_argument("--warmup", type=float, default=2, help="每个场景正式计时前的预热时间（秒）")
+    parser.add_argument("--request-timeout", type=float, default=60, help="单个请求的超时（秒）")
+    parser.add_argument("--summary-variants", type=int, default=8, help="总结场景中不同输入的数量，决定缓存命中率")
+    parser.add_argument("--backend-env", action="append", default=[], metavar="KEY=VALUE", help="传给后端进程的额外环境变量")
+    parser.add_argument("--serve-workers", type=int, default=0, help="用 serve.py 启动指定数量的worker（经过路由进程），默认单进程")
+    parser.add_argument("--target", help="压测已经运行的后端（不启动模拟上游和后端）")
+    parser.add_argument("--target-pid", type=int, help="--target 后端的进程ID，用于统计内存")
+    parser.add_argument("--baseline", help="之前保存的结果文件，输出对比")
+    parser.add_argument("--output", help="结果写入的文件（默认输出到stdout）")
+    parser.add_argument("--keep-workdir", action="store_true", help="保留临时目录（会话库、进程日志）")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
@@ -0,0 +1,138 @@
+"""本地模拟的OpenAI兼容上游，用于离线压测。
+
+支持配置固定延迟、随机抖动、流式分块和错误注入：
+
+    python bench/mock_upstream.py --port 9100 --latency-ms 200 --stream-chunks 20 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class MockConfig:
+    def __init__(
+        self,
+        latency_ms: float = 200,
+        jitter_ms: float = 50,
+        stream_chunks: int = 20,
+        chunk_delay_ms: float = 20,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        reply_words: int = 60,
+        seed: int = 0,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.stream_chunks = stream_chunks
+        self.chunk_delay_ms = chunk_delay_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply_words = reply_words
+        self.random = random.Random(seed)
+
+    # 首字节前的延迟（秒）
+    def first_byte_delay(self) -> float:
+        jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock LLM Upstream")
+    stats = {"requests": 0, "streams": 0, "errors": 0, "inflight": 0, "maxInflight": 0}
+
+    def reply_words(messages) -> list:
+        last = messages[-1]["content"] if messages else ""
+        return [f"Mock reply ({len(last)} chars in):"] + [f"word{i}" for i in range(config.reply_words)]
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        stats["inflight"] += 1
+        stats["maxInflight"] = max(stats["maxInflight"], stats["inflight"])
+        streaming = False
+        try:
+            await asyncio.sleep(config.first_byte_delay())
+            if config.should_fail():
+                stats["errors"] += 1
+                return JSONResponse(status_code=config.error_status, content={"error": {"message": "injected error"}})
+
+            words = reply_words(body.get("messages", []))
+            if not body.get("stream"):
+                return {
+                    "id": f"mock-{stats['requests']}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(words)}, "finish_reason": "stop"}],
+                }
+
+            stats["streams"] += 1
+            streaming = True
+            return StreamingResponse(stream_words(words), media_type="text/event-stream")
+        finally:
+            # 流式响应在生成器结束时才算完成
+            if not streaming:
+                stats["inflight"] -= 1
+
+    async def stream_words(words: list):
+        chunk_count = max(1, min(config.stream_chunks, len(words)))
+        step = -(-len(words) // chunk_count)
+        try:
+            for i in range(0, len(words), step):
+                delta = " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
+                payload = {"choices": [{"index": 0, "delta": {"content": delta}}]}
+                yield f"data: {json.dumps(payload)}\n\n"
+                if config.chunk_delay_ms:
+                    await asyncio.sleep(config.chunk_delay_ms / 1000)
+            yield "data: [DONE]\n\n"
+        finally:
+            stats["inflight"] -= 1
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=200, help="首字节前的平均延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="延迟的随机抖动范围（毫秒）")
+    parser.add_argument("--stream-chunks", type=int, default=20, help="流式响应的分块数")
+    parser.add_argument("--chunk-delay-ms", type=float, default=20, help="流式分块之间的间隔（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的比例（0-1）")
+    parser.add_argument("--error-status", type=int, default=500, help="注入错误的HTTP状态码")
+    parser.add_argument("--reply-words", type=int, default=60, help="回复的单词数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，保证结果可复现")
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        stream_chunks=args.stream_chunks,
+        chunk_delay_ms=args.chunk_delay_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        reply_words=args.reply_words,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible upstream")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
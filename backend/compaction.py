@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Awaitable, Callable, List
+
+from env import env_bool, env_int
+from session_store import SessionStore, StoredMessage
+
+logger = logging.getLogger(__name__)
+
+
+# 构建增量压缩的总结提示：上一次的滚动总结 + 之后新增的对话
+def build_compaction_prompt(previous_summary: Optional[str], turns: List[StoredMessage]) -> str:
+    prompt = """
+Please update the running summary of a tutoring conversation between a learner and an AI tutor.
+This summary replaces the older turns of the conversation in future prompts.
+"""
+    if previous_summary:
+        prompt += f"\nPrevious summary:\n{previous_summary}\n"
+
+    prompt += "\nNew conversation turns:\n"
+    for message in turns:
+        speaker = "Learner" if message.role == "user" else "Tutor"
+        prompt += f"{speaker}: {message.content}\n"
+
+    prompt += """
+Please provide a concise summary (at most 200 words) that captures:
+1. The questions the learner asked and the topics that were explained
+2. Any misconceptions or difficulties the learner showed
+3. Open questions or next steps that were discussed
+"""
+    return prompt
+
+
+# 长会话的后台滚动压缩：历史超过阈值后，把较早的对话增量折叠进一个滚动总结
+class ConversationCompactor:
+    def __init__(
+        self,
+        store: SessionStore,
+        summarize: Callable[[str], Awaitable[str]],
+        enabled: bool = True,
+        threshold: int = 20,
+        keep_recent: int = 8,
+    ):
+        self.store = store
+        self.summarize = summarize
+        self.enabled = enabled
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.compactions = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, store: SessionStore, summarize: Callable[[str], Awaitable[str]]) -> "ConversationCompactor":
+        return cls(
+            store,
+            summarize,
+            enabled=env_bool("COMPACTION_ENABLED", True),
+            threshold=env_int("COMPACTION_THRESHOLD", 20),
+            keep_recent=env_int("COMPACTION_KEEP_RECENT", 8),
+        )
+
+    # 在回复完成后调用；压缩在后台任务中执行，不增加当前请求的延迟
+    def schedule(self, session_id: str) -> None:
+        if not self.enabled or session_id in self._tasks:
+            return
+        task = asyncio.create_task(self._compact(session_id))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _compact(self, session_id: str) -> None:
+        state = await self.store.get_compaction(session_id)
+        previous_summary, upto_seq = state if state else (None, 0)
+
+        # 只处理上次压缩之后新增的对话（章节总结系统消息不参与压缩）
+        turns = [m for m in await self.store.messages_since(session_id, upto_seq) if m.role != "system"]
+        if len(turns) <= self.threshold:
+            return
+
+        fold = turns[:-self.keep_recent] if self.keep_recent > 0 else turns
+        try:
+            summary = await self.summarize(build_compaction_prompt(previous_summary, fold))
+        except Exception as e:
+            self.failures += 1
+            logger.warning("Compaction failed", extra={"session_id": session_id, "error": str(e)})
+            return
+
+        await self.store.set_compaction(session_id, summary, fold[-1].seq)
+        self.compactions += 1
+        logger.info("Compacted conversation", extra={"session_id": session_id, "messages": len(fold)})
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "keepRecent": self.keep_recent,
+            "running": len(self._tasks),
+            "compactions": self.compactions,
+            "failures": self.failures,
+        }
@@ -0,0 +1,180 @@
+import zlib
+from typing import Optional, Dict, Any
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from env import env_bool, env_int
+from metrics import metrics, RATIO_BUCKETS
+from static_assets import COMPRESSIBLE_TYPES, parse_accept_encoding, brotli
+
+# 不压缩的状态码（没有响应体）
+_NO_BODY_STATUS = (204, 304)
+
+
+# 按 Accept-Encoding 选择编码：优先brotli（需要安装 brotli 包），其次gzip
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = parse_accept_encoding(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits=31 生成带gzip头的流
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    # 流式响应每块都刷新，客户端不必等到响应结束才能解压
+    def chunk(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+
+# API响应的动态压缩（纯ASGI中间件）：超过大小阈值的JSON/文本响应按客户端支持的编码压缩。
+# 跳过SSE（逐事件刷新，不能缓冲）、已经编码过的响应（预压缩的静态资源）和没有响应体的状态码
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        enabled: bool = True,
+        min_bytes: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        path_prefix: str = "/api/",
+    ):
+        self.app = app
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.path_prefix = path_prefix
+
+    @staticmethod
+    def options_from_env() -> Dict[str, Any]:
+        return {
+            "enabled": env_bool("COMPRESSION_ENABLED", True),
+            "min_bytes": env_int("COMPRESSION_MIN_BYTES", 1024),
+            "gzip_level": env_int("COMPRESSION_GZIP_LEVEL", 6),
+            "brotli_quality": env_int("COMPRESSION_BROTLI_QUALITY", 4),
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(self, encoding, send))
+
+
+class _CompressingSend:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Dict[str, Any]] = None
+        # None：还没收到响应体；"pass"：原样转发；"stream"：逐块压缩
+        self.mode: Optional[str] = None
+        self.compressor: Optional[_Compressor] = None
+        self.original_bytes = 0
+        self.compressed_bytes = 0
+
+    def _eligible(self, headers: Headers, status: int) -> bool:
+        content_type = headers.get("content-type", "")
+        return (
+            status not in _NO_BODY_STATUS
+            and "content-encoding" not in headers
+            and not content_type.startswith("text/event-stream")
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+        )
+
+    def _encode_headers(self, message: Dict[str, Any], length: Optional[int]) -> None:
+        headers = MutableHeaders(scope=message)
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+        # 压缩后的字节与原始ETag对应的字节不同，改为弱ETag
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+    def _record(self) -> None:
+        metrics.inc("http_compressed_responses_total", {"encoding": self.encoding})
+        metrics.inc("http_compression_saved_bytes_total", {"encoding": self.encoding},
+                    amount=self.original_bytes - self.compressed_bytes)
+        if self.original_bytes:
+            metrics.observe("http_compression_ratio", self.compressed_bytes / self.original_bytes,
+                            {"encoding": self.encoding}, buckets=RATIO_BUCKETS)
+
+    async def __call__(self, message: Dict[str, Any]) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message.get("headers", []))
+            if self._eligible(headers, message["status"]):
+                # 等到第一块响应体再决定是否压缩
+                self.start = message
+            else:
+                self.mode = "pass"
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.mode == "pass":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.mode is None:
+            declared = Headers(raw=self.start.get("headers", [])).get("content-length")
+            small = len(body) < self.middleware.min_bytes if not more_body else (
+                declared is not None and int(declared) < self.middleware.min_bytes
+            )
+            if small:
+                self.mode = "pass"
+                await self.send(self.start)
+                await self.send(message)
+                return
+            self.compressor = _Compressor(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            if not more_body:
+                # 完整的响应体一次压缩，保留 Content-Length
+                compressed = self.compressor.finish(body)
+                if len(compressed) >= len(body):
+                    self.mode = "pass"
+                    await self.send(self.start)
+                    await self.send(message)
+                    return
+                self.original_bytes, self.compressed_bytes = len(body), len(compressed)
+                self._encode_headers(self.start, len(compressed))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                self._record()
+                return
+            self.mode = "stream"
+            self._encode_headers(self.start, None)
+            await self.send(self.start)
+
+        self.original_bytes += len(body)
+        chunk = self.compressor.chunk(body) if more_body else self.compressor.finish(body)
+        self.compressed_bytes += len(chunk)
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+        if not more_body:
+            self._record()
@@ -0,0 +1,43 @@
+import os
+from typing import Optional
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+_FALSE_VALUES = ("0", "false", "no", "off")
+
+
+# 各组件统一的环境变量解析：未设置或为空时使用默认值，无法解析时抛出带变量名的 ValueError
+def _env_value(name: str) -> Optional[str]:
+    value = os.getenv(name, "").strip()
+    return value or None
+
+
+def env_bool(name: str, default: bool) -> bool:
+    value = _env_value(name)
+    if value is None:
+        return default
+    value = value.lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(f"{name} must be one of {'/'.join(_TRUE_VALUES + _FALSE_VALUES)}, got {value!r}")
+
+
+def env_int(name: str, default: int) -> int:
+    value = _env_value(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}") from None
+
+
+def env_float(name: str, default: float) -> float:
+    value = _env_value(name)
+    if value is None:
+        return float(default)
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {value!r}") from None
@@ -0,0 +1,45 @@
+import json
+from collections.abc import Mapping
+from typing import Any, Union
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，没有安装时使用标准库 json
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(value: Any) -> Any:
+    # orjson 不认识的类型（如题库中的只读 MappingProxyType）
+    if isinstance(value, Mapping):
+        return dict(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+# 解析JSON文本或UTF-8字节（上游响应体、SSE数据行、WebSocket帧）
+def json_loads(data: Union[str, bytes, bytearray]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# 编码为紧凑的UTF-8 JSON字节，不转义非ASCII字符
+def json_dumps_bytes(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_dumps(value: Any) -> str:
+    if orjson is not None:
+        return json_dumps_bytes(value).decode("utf-8")
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+# API的默认响应类；直接返回 FastJSONResponse 的端点还能跳过 FastAPI 的 jsonable_encoder
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return json_dumps_bytes(content)
@@ -0,0 +1,127 @@
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Optional, List
+
+from env import env_int
+from upstream_pool import UpstreamPool
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_SECRET_PATTERNS = [
+    (re.compile(r"sk-[A-Za-z0-9_\-]{6,}"), "sk-***"),
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9._\-]+"), r"\1***"),
+    (re.compile(r"(?i)(\"?(?:api[_-]?key|authorization)\"?\s*[:=]\s*\"?)[^\s\",]+"), r"\1***"),
+]
+
+
+# 脱敏：去掉日志中的API密钥和鉴权头
+class Redactor:
+    def __init__(self, secrets: Optional[List[str]] = None):
+        self.secrets = [secret for secret in (secrets or []) if secret and len(secret) >= 6]
+
+    def __call__(self, text: str) -> str:
+        for secret in self.secrets:
+            text = text.replace(secret, "***")
+        for pattern, replacement in _SECRET_PATTERNS:
+            text = pattern.sub(replacement, text)
+        return text
+
+
+# 需要脱敏的密钥：所有上游端点的密钥（UPSTREAMS 中的 apiKey/apiKeyEnv）和 OPENAI_API_KEY
+def configured_secrets() -> List[str]:
+    secrets = [endpoint.api_key for endpoint in UpstreamPool.from_env().endpoints]
+    return secrets + [os.getenv("OPENAI_API_KEY", "")]
+
+
+# 每条日志输出为一行JSON，extra 字段作为结构化字段输出
+class JsonFormatter(logging.Formatter):
+    def __init__(self, redactor: Redactor):
+        super().__init__()
+        self.redactor = redactor
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return self.redactor(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, redactor: Redactor):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.redactor = redactor
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = {k: v for k, v in record.__dict__.items() if k not in _RESERVED_ATTRS and not k.startswith("_")}
+        if fields:
+            text += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return self.redactor(text)
+
+
+# 非阻塞日志：请求处理代码只把日志记录放入队列，由后台线程格式化、脱敏并写到stdout
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 保留原始的 msg/args，让格式化在监听线程中进行；只提前展开异常信息
+        record = logging.makeLogRecord(record.__dict__)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging() -> None:
+    global _listener
+    if _listener is not None:
+        return
+
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+    redactor = Redactor(configured_secrets())
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json").lower() == "text":
+        stream_handler.setFormatter(TextFormatter(redactor))
+    else:
+        stream_handler.setFormatter(JsonFormatter(redactor))
+
+    log_queue: "queue.Queue" = queue.Queue(maxsize=env_int("LOG_QUEUE_SIZE", 10000))
+    queue_handler = _QueueHandler(log_queue)
+    # 队列满时丢弃日志，而不是阻塞事件循环
+    queue_handler.enqueue = lambda record: _enqueue_nowait(log_queue, record)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+
+
+def _enqueue_nowait(log_queue: "queue.Queue", record: logging.LogRecord) -> None:
+    try:
+        log_queue.put_nowait(record)
+    except queue.Full:
+        pass
+
+
+def shutdown_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,20 +1,118 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import httpx
-import os
+import hashlib
+import time
+import logging
 from dotenv import load_dotenv
-from pydantic import BaseModel
-import json
-from typing import Optional, Dict, Any, List
+from pydantic import BaseModel, ValidationError
+import asyncio
+from typing import Optional, Dict, Any, List, Tuple
 import uvicorn
 from datetime import datetime
+from urllib.parse import urlencode
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+
+from env import env_bool, env_float, env_int
+from upstream import UpstreamClient
+from session_store import create_session_store
+from summary_cache import SummaryCache, summary_cache_key
+from admission import AdmissionController, AdmissionRejected, PRIORITY_CHAT, PRIORITY_SUMMARY, PRIORITY_BACKGROUND
+from tokens import TokenBudget, estimate_tokens, select_history, MESSAGE_OVERHEAD_TOKENS
+from compaction import ConversationCompactor
+from question_bank import QuestionBank, CompiledResponse
+from static_assets import StaticAssetIndex, etag_matches
+from logging_setup import setup_logging, shutdown_logging
+from metrics import metrics, MetricsMiddleware, SIZE_BUCKETS, RATIO_BUCKETS
+from prompt_builder import PromptBuilder, section_segment, session_segment
+from section_registry import SectionRegistry, section_hash
+from answer_cache import AnswerCache
+from summary_jobs import SummaryJobQueue
+from session_events import SessionEventHub
+from model_router import ModelRouter, ModelRoute, is_model_failure
+from json_codec import FastJSONResponse, json_loads, json_dumps
+from compression import CompressionMiddleware
 
 # 加载环境变量
 load_dotenv()
 
-app = FastAPI(title="Learning Platform API")
+# 结构化日志：通过队列异步写出，不阻塞事件循环
+setup_logging()
+logger = logging.getLogger("autopbl")
+
+# 共享的上游HTTP客户端（连接池复用、keep-alive、可选HTTP/2）
+upstream_client = UpstreamClient()
+
+# 会话存储：会话历史和章节总结（有界、LRU/TTL淘汰，默认持久化到SQLite）
+session_store = create_session_store()
+
+# 章节总结缓存：按输入内容寻址，合并并发的相同请求
+summary_cache = SummaryCache.from_env()
+
+# 章节总结的后台任务队列（202 + 轮询），以及可选的章节总结预生成
+summary_jobs = SummaryJobQueue.from_env()
+
+# 会话事件推送（WebSocket连接订阅自己会话的事件，如后台章节总结完成）
+session_events = SessionEventHub()
+WS_HEARTBEAT_INTERVAL = env_float("WS_HEARTBEAT_INTERVAL", 20.0)
+WS_IDLE_TIMEOUT = env_float("WS_IDLE_TIMEOUT", 60.0)
+
+# 上游调用的准入控制（并发上限、等待队列、快速拒绝）
+admission = AdmissionController.from_env()
+
+# 聊天上下文的token预算，用来决定发送多少历史消息
+token_budget = TokenBudget.from_env()
+
+# 按稳定程度排列的提示构建器（上游提示缓存的前缀复用）
+prompt_builder = PromptBuilder.from_env()
+
+# 章节注册表：客户端注册一次章节内容，聊天请求只携带内容哈希
+section_registry = SectionRegistry.from_env()
+
+# 按章节划分的语义答案缓存（可选）：相似的首轮问题直接返回已有的答案
+answer_cache = AnswerCache.from_env()
+
+# 按任务和上游SLO选择模型层级（快速/强）
+model_router = ModelRouter.from_env()
+
+# 长会话的后台滚动压缩，复用章节总结的上游调用
+compactor = ConversationCompactor.from_env(session_store, lambda prompt: summarize_conversation(prompt))
+
+# 检查点题库：从数据文件加载一次，文件修改后自动重新加载
+question_bank = QuestionBank.from_env()
+CHECKPOINT_CACHE_CONTROL = f"public, max-age={env_int('CHECKPOINT_CACHE_MAX_AGE', 300)}"
+
+# 会话历史分页的默认和最大每页消息数
+HISTORY_PAGE_SIZE = env_int("HISTORY_PAGE_SIZE", 50)
+HISTORY_MAX_PAGE_SIZE = env_int("HISTORY_MAX_PAGE_SIZE", 500)
+
+# 前端构建文件的内存索引（启动时建立，含预压缩变体）
+static_assets = StaticAssetIndex.from_env()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(static_assets.build)
+    await upstream_client.start()
+    await session_store.start()
+    await summary_cache.start()
+    await answer_cache.start()
+    await summary_jobs.start()
+    try:
+        yield
+    finally:
+        await summary_jobs.close()
+        await compactor.close()
+        await summary_cache.close()
+        await answer_cache.close()
+        await session_store.close()
+        await upstream_client.close()
+        shutdown_logging()
+
+# 默认响应类使用 orjson（安装时）渲染JSON
+app = FastAPI(title="Learning Platform API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # 配置CORS - 确保允许前端域名
 app.add_middleware(
@@ -25,6 +123,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 超过阈值的API响应按 Accept-Encoding 压缩（gzip/brotli），SSE和已编码的响应除外
+app.add_middleware(CompressionMiddleware, **CompressionMiddleware.options_from_env())
+
+# 每个端点的延迟、吞吐和错误指标
+app.add_middleware(MetricsMiddleware)
+
+# 准入控制拒绝请求时返回 429/503，并带上 Retry-After
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return FastJSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # 定义请求模型
 class ChatMessage(BaseModel):
     message: str
@@ -33,12 +146,26 @@ class ChatMessage(BaseModel):
     sectionContent: Optional[str] = None
     lastCheckpointQuestion: Optional[Dict[str, Any]] = None
     userChoices: Optional[Dict[str, Any]] = {}
+    # 通过 /api/sections 注册的章节哈希；提供时代替 sectionContent（旧客户端仍可直接发送内容）
+    sectionHash: Optional[str] = None
+    # 问题依赖会话上下文（如之前的选择）时跳过语义答案缓存
+    bypassCache: bool = False
+    # 客户端生成的轮次ID：WebSocket失败后用同一ID改走HTTP重发时，用户消息不会重复加入历史
+    turnId: Optional[str] = None
+
+class SectionRegistration(BaseModel):
+    sectionId: str
+    sectionContent: str
+    checkpointQuestion: Optional[Dict[str, Any]] = None
+    # 仅用于多worker部署时把注册请求路由到会话所在的worker
+    sessionId: Optional[str] = None
 
 class SessionRequest(BaseModel):
     sessionId: str
 
 class CheckpointRequest(BaseModel):
     sectionId: str
+    courseId: Optional[str] = None
 
 class SummaryRequest(BaseModel):
     sessionId: str
@@ -48,154 +175,579 @@ class SummaryRequest(BaseModel):
     userAnswer: Optional[str] = None
     isCorrect: Optional[bool] = None
 
-# 存储会话历史的字典
-# 格式: {session_id: [{"role": "user", "content": "..."}, {"role": "assistant", "content": "..."}]}
-session_histories = {}
+class SummaryPregenerateRequest(BaseModel):
+    sectionId: str
+    sectionContent: str
+    checkpointQuestion: Dict[str, Any]
+    # 仅用于多worker部署时把请求路由到会话所在的worker（预生成的总结缓存在该worker中）
+    sessionId: Optional[str] = None
+
+# 检查是否配置了上游端点（UPSTREAMS 或 OPENAI_BASE_URL/OPENAI_API_KEY）
+def ensure_upstream_configured():
+    if not upstream_client.pool:
+        raise HTTPException(status_code=500, detail="Server configuration error: API Key is missing")
 
-# 存储章节总结的字典
-# 格式: {session_id: {section_id: "summary text"}}
-section_summaries = {}
+# 检查请求引用的章节哈希；哈希未知（已被淘汰或服务重启）时返回409，客户端应重新注册
+def check_section_hash(request: ChatMessage):
+    if request.sectionHash and request.sectionHash not in section_registry:
+        raise HTTPException(status_code=409, detail="Unknown sectionHash, please register the section again")
 
-# 聊天API路由
-@app.post("/api/chat")
-async def chat(request: ChatMessage):
-    if not request.message:
-        raise HTTPException(status_code=400, detail="Message is required")
+# 章节层提示片段：注册过的章节使用缓存的片段，旧客户端发送的原始内容直接渲染
+def render_section_fragment(request: ChatMessage) -> str:
+    if not request.sectionHash:
+        return section_segment(request.currentSection, request.sectionContent, request.lastCheckpointQuestion)
+    entry = section_registry.get(request.sectionHash)
+    if entry is None:
+        raise HTTPException(status_code=409, detail="Unknown sectionHash, please register the section again")
+    if request.lastCheckpointQuestion and request.lastCheckpointQuestion != entry.checkpoint_question:
+        # 请求单独携带了不同的检查点问题，不能使用缓存的片段
+        return section_segment(entry.section_id, entry.content, request.lastCheckpointQuestion)
+    return section_registry.fragment(entry)
+
+# 每个会话最近一次加入历史的客户端轮次ID（按会话LRU，有上限）
+recent_turns: "OrderedDict[str, str]" = OrderedDict()
+RECENT_TURNS_MAX = 10000
+
+# 同一轮已经加入过历史时返回False（客户端在回复开始前失败后用HTTP重发）
+def remember_turn(session_id: str, turn_id: Optional[str]) -> bool:
+    if turn_id is None:
+        return True
+    if recent_turns.get(session_id) == turn_id:
+        recent_turns.move_to_end(session_id)
+        return False
+    recent_turns[session_id] = turn_id
+    recent_turns.move_to_end(session_id)
+    while len(recent_turns) > RECENT_TURNS_MAX:
+        recent_turns.popitem(last=False)
+    return True
+
+# 构建聊天请求体：系统提示 + 预算内的会话历史（会把用户消息加入历史）
+# 返回请求体、本次选择的提示大小和模型层级
+async def build_chat_request(request: ChatMessage, session_id: str) -> Tuple[Dict[str, Any], Dict[str, Any], ModelRoute]:
+    # 先解析章节片段：章节哈希可能在检查之后被淘汰，409必须在写入历史之前返回，
+    # 否则会留下没有回复的用户消息，客户端重新注册后重发还会再加一次
+    section_fragment = render_section_fragment(request)
     
-    # 从环境变量获取API密钥和URL
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1/chat/completions")
+    # 章节总结（如果有）和较早对话的滚动总结属于会话层
+    section_summary = await session_store.get_summary(session_id, request.currentSection) if request.currentSection else None
     
-    if not api_key:
-        raise HTTPException(status_code=500, detail="Server configuration error: API Key is missing")
+    # 添加用户消息到会话历史（重发的同一轮不再重复添加）
+    if remember_turn(session_id, request.turnId):
+        await session_store.append(session_id, "user", request.message)
+    else:
+        metrics.inc("chat_turn_dedup_total")
     
-    # 获取会话ID，如果没有则创建一个新的
-    session_id = request.sessionId or f"session_{datetime.now().timestamp()}"
+    # 如果较早的对话已被压缩，用滚动总结代替这些消息
+    candidates = await session_store.recent_messages(session_id, token_budget.history_scan)
+    compaction = await session_store.get_compaction(session_id)
+    compacted_summary = None
+    if compaction:
+        compacted_summary, upto_seq = compaction
+        candidates = [m for m in candidates if m.role == "system" or m.seq > upto_seq]
     
-    # 获取当前会话的历史记录，如果没有则创建一个新的
-    if session_id not in session_histories:
-        session_histories[session_id] = []
-    
-    # 打印调试信息
-    print(f"Using API Key: {api_key[:5]}...{api_key[-5:] if len(api_key) > 10 else ''}")
-    print(f"Using Base URL: {base_url}")
-    print(f"Received message: {request.message}")
-    print(f"Current Section: {request.currentSection}")
-    print(f"User Choices: {request.userChoices}")
-    print(f"Session ID: {session_id}")
-    print(f"Current session history length: {len(session_histories[session_id])}")
-    
-    # 构建系统提示，包含当前章节内容和上下文
-    system_content = "You are an expert in project-based learning. You specialize in teaching AI and deep learning through projects. "
-    
-    # 添加当前章节信息
-    if request.currentSection and request.sectionContent:
-        system_content += f"\nCurrent section: {request.currentSection}\n"
-        system_content += f"Section content: {request.sectionContent}\n"
-    
-    # 添加章节总结（如果有）
-    if session_id in section_summaries and request.currentSection in section_summaries.get(session_id, {}):
-        system_content += f"\nSection summary: {section_summaries[session_id][request.currentSection]}\n"
-    
-    # 添加最近的检查点问题
-    if request.lastCheckpointQuestion:
-        question = request.lastCheckpointQuestion.get("question", "")
-        options = request.lastCheckpointQuestion.get("options", [])
-        correct_answer_id = request.lastCheckpointQuestion.get("correctAnswerId", "")
-        
-        if question and options and correct_answer_id:
-            system_content += "\nRecent checkpoint question:\n"
-            system_content += f"Question: {question}\n"
-            system_content += "Options:\n"
-            
-            for option in options:
-                option_id = option.get("id", "")
-                option_text = option.get("text", "")
-                if option_id and option_text:
-                    is_correct = option_id == correct_answer_id
-                    system_content += f"- {option_id}: {option_text} {'(correct)' if is_correct else ''}\n"
-    
-    # 添加用户之前的选择
-    if request.userChoices and len(request.userChoices) > 0:
-        system_content += "\nUser's previous choices:\n"
-        for key, value in request.userChoices.items():
-            system_content += f"- {key}: {value}\n"
-    
-    # 添加指导要求
-    system_content += """
-Task: The learner wants to discuss some content in the tutorial with you. You will be given the framework of the tutorial, 
-a summary of the learner's current progress, and the content they have questions about.
-
-Requirements:
-1. Be engaging, helpful, and ready to answer questions as long as they relate to the tutorial. Do not give away 
-   the full answer to a complex question right away. Guide the learner to think first. Progressively provide more 
-   assistance if the learner has trouble figuring out the problem on their own.
-2. If the learner deviates too much from the tutorial, remind them to stay on track.
-3. Encourage the learner when needed, such as when they have trouble fixing a bug.
-4. All math formulas should be written in LaTex format and surrounded by dollar signs ($ or $$).
-5. All hyperlinks should be written in markdown format like this: [link text](link URL).
-6. Reference the current section content and checkpoint questions when relevant to provide more personalized help.
-7. If the user asks about their previous choices or answers, provide helpful feedback based on that information.
-8. Remember the conversation history and refer back to previous questions and answers when appropriate.
-9. If there's a section summary available, use it to provide more targeted and relevant responses.
-"""
+    # 系统提示按稳定程度排列：静态指令 → 章节内容和检查点问题 → 会话状态，上游可以缓存共同的前缀
+    tiers = prompt_builder.system_tiers(
+        section_fragment,
+        session_segment(section_summary, request.userChoices, compacted_summary),
+    )
+    system_content = prompt_builder.system_text(tiers)
+    system_tokens = estimate_tokens(system_content) + MESSAGE_OVERHEAD_TOKENS
+    
+    # 按token预算从新到旧选择历史消息，章节总结系统消息总是保留
+    recent_history, history_tokens = select_history(candidates, token_budget.history_budget(system_tokens))
+    messages, prefix_stats = prompt_builder.build(tiers, [message.to_dict() for message in recent_history])
     
-    # 添加用户消息到会话历史
-    session_histories[session_id].append({"role": "user", "content": request.message})
+    prompt_stats = {
+        "promptTokens": system_tokens + history_tokens,
+        "systemTokens": system_tokens,
+        "historyMessages": len(recent_history),
+        "historyCandidates": len(candidates),
+        "promptChars": len(system_content) + sum(len(m.content) for m in recent_history),
+        "prefixReuseRatio": prefix_stats["prefixReuseRatio"],
+    }
+    
+    # 按问题长度、提示大小和是否像调试求助选择模型层级
+    route = model_router.route("chat", request.message, prompt_stats["promptTokens"])
+    prompt_stats["modelTier"] = route.tier
     
-    # 构造请求体，包含系统提示和会话历史
-    messages = [{"role": "system", "content": system_content}]
+    metrics.observe("prompt_chars", prompt_stats["promptChars"], buckets=SIZE_BUCKETS)
+    metrics.observe("prompt_tokens", prompt_stats["promptTokens"], buckets=SIZE_BUCKETS)
+    metrics.observe("prompt_prefix_reuse_ratio", prompt_stats["prefixReuseRatio"], buckets=RATIO_BUCKETS)
     
-    # 添加历史消息，但限制数量以避免超过API限制
-    # 保留最近的10条消息
-    history_limit = 10
-    recent_history = session_histories[session_id][-history_limit:] if len(session_histories[session_id]) > history_limit else session_histories[session_id]
-    messages.extend(recent_history)
+    # 系统提示包含章节总结等内容，只在DEBUG级别输出
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("System content", extra={"session_id": session_id, "system_content": system_content})
+    logger.info("Built chat prompt", extra={"session_id": session_id, "messages": len(messages), **prompt_stats})
     
     api_request_body = {
-        "model": "claude-3-7-sonnet-20250219",  # 或者其他支持的模型
+        "model": route.model,
         "messages": messages
     }
+    return api_request_body, prompt_stats, route
+
+# 把提示大小写入响应头
+def prompt_stats_headers(prompt_stats: Dict[str, Any]) -> Dict[str, str]:
+    return {
+        "X-Prompt-Tokens": str(prompt_stats["promptTokens"]),
+        "X-Prompt-Chars": str(prompt_stats["promptChars"]),
+        "X-History-Messages": str(prompt_stats["historyMessages"]),
+        "X-Prompt-Prefix-Reuse": str(prompt_stats["prefixReuseRatio"]),
+        "X-Model-Tier": prompt_stats["modelTier"],
+    }
+
+# 解析会话ID
+async def prepare_session(request: ChatMessage) -> str:
+    # 获取会话ID，如果没有则创建一个新的（会话存储有上限，闲置会话会被淘汰）
+    session_id = request.sessionId or f"session_{datetime.now().timestamp()}"
+    
+    # 记录请求信息（消息内容只在DEBUG级别输出）
+    logger.info("Received chat message", extra={
+        "session_id": session_id,
+        "section": request.currentSection,
+        "message_chars": len(request.message),
+    })
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Chat message details", extra={
+            "session_id": session_id,
+            "chat_message": request.message,
+            "user_choices": request.userChoices,
+            "history_length": await session_store.message_count(session_id),
+        })
+    
+    return session_id
+
+# 语义答案缓存的作用域（章节ID + 章节内容）；只有首轮问题使用缓存，追问依赖之前的对话，
+# 缓存未开启、客户端要求绕过或没有章节信息时返回None
+async def answer_cache_scope(request: ChatMessage, session_id: str) -> Optional[str]:
+    if not answer_cache.enabled:
+        return None
+    if request.bypassCache:
+        metrics.inc("answer_cache_total", {"status": "bypass"})
+        return None
+    if request.sectionHash:
+        entry = section_registry.get(request.sectionHash)
+        section_id, content = (entry.section_id, entry.content) if entry else (None, None)
+    else:
+        section_id, content = request.currentSection, request.sectionContent
+    if not section_id or not content:
+        return None
+    if await session_store.page_messages(session_id, None, None, 1, include_system=False):
+        metrics.inc("answer_cache_total", {"status": "followup"})
+        return None
+    return section_hash(section_id, content, None)
+
+# 查找缓存的答案；命中时把问题和答案加入会话历史，不调用上游
+async def serve_cached_answer(request: ChatMessage, session_id: str, scope: Optional[str]) -> Optional[str]:
+    if scope is None:
+        return None
+    result = answer_cache.lookup(scope, request.message)
+    if result is None:
+        metrics.inc("answer_cache_total", {"status": "miss"})
+        return None
+    answer, similarity = result
+    metrics.inc("answer_cache_total", {"status": "hit"})
+    metrics.observe("answer_cache_similarity", similarity, buckets=RATIO_BUCKETS)
+    logger.info("Answer cache hit", extra={"session_id": session_id, "similarity": round(similarity, 4)})
+    await session_store.append(session_id, "user", request.message)
+    await session_store.append(session_id, "assistant", answer)
+    return answer
+
+# 聊天API路由
+@app.post("/api/chat")
+async def chat(request: ChatMessage, http_response: Response):
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is required")
+    
+    ensure_upstream_configured()
+    check_section_hash(request)
+    
+    session_id = await prepare_session(request)
+    
+    cache_scope = await answer_cache_scope(request, session_id)
+    cached_answer = await serve_cached_answer(request, session_id, cache_scope)
+    if cached_answer is not None:
+        http_response.headers["X-Answer-Cache"] = "hit"
+        return {"response": cached_answer, "cached": True}
+    
+    # 等待上游调用名额；同一会话同时只能有一个进行中的聊天
+    ticket = await admission.acquire(PRIORITY_CHAT, session_id)
     
     try:
-        # 调用API
-        async with httpx.AsyncClient() as client:
-            print(f"Sending request to: {base_url}")
-            print(f"System content: {system_content}")
-            print(f"Total messages sent: {len(messages)}")
-            response = await client.post(
-                base_url,
+        api_request_body, prompt_stats, route = await build_chat_request(request, session_id)
+        http_response.headers.update(prompt_stats_headers(prompt_stats))
+        
+        # 调用API（使用共享连接池，由端点池选择上游地址和密钥）；结果计入模型层级的SLO
+        with model_router.observe(route):
+            response = await upstream_client.post(
                 json=api_request_body,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                },
-                timeout=30.0  # 设置超时时间
+                headers={"Content-Type": "application/json"}
             )
             
-            print(f"Response status: {response.status_code}")
+            logger.info("Upstream responded", extra={"session_id": session_id, "status": response.status_code})
             
             response.raise_for_status()  # 如果响应状态码不是2xx，则抛出异常
-            
-            data = response.json()
-            print(f"Response data: {data}")
-            
-            ai_message = data["choices"][0]["message"]["content"] if "choices" in data and len(data["choices"]) > 0 else "Sorry, I could not get a response."
-            
-            # 添加AI回复到会话历史
-            session_histories[session_id].append({"role": "assistant", "content": ai_message})
-            
-            return {"response": ai_message}
-    
+        
+        data = json_loads(response.content)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Upstream response data", extra={"session_id": session_id, "data": data})
+        
+        has_answer = "choices" in data and len(data["choices"]) > 0
+        ai_message = data["choices"][0]["message"]["content"] if has_answer else "Sorry, I could not get a response."
+        
+        # 添加AI回复到会话历史
+        await session_store.append(session_id, "assistant", ai_message)
+        compactor.schedule(session_id)
+        if cache_scope is not None and has_answer:
+            answer_cache.store(cache_scope, request.message, ai_message)
+        
+        return {"response": ai_message}
+
+    except HTTPException:
+        # 例如章节哈希未知时的409，原样返回
+        raise
     except httpx.HTTPStatusError as e:
-        print(f"HTTP Status Error: {e.response.status_code} - {e.response.text}")
+        logger.error("Upstream HTTP status error", extra={"status": e.response.status_code, "body": e.response.text})
         raise HTTPException(status_code=e.response.status_code, detail=f"API call failed: {e.response.text}")
     except httpx.RequestError as e:
-        print(f"Request Error: {str(e)}")
+        logger.error("Upstream request error", extra={"error": str(e)})
         raise HTTPException(status_code=500, detail=f"API call failed: {str(e)}")
     except Exception as e:
-        print(f"Unexpected Error: {str(e)}")
+        logger.exception("Unexpected error")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+    finally:
+        ticket.release()
+
+# 把一个SSE事件编码为文本
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    payload = json_dumps(data)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+# 构建聊天请求并建立上游流式连接；上游错误以 HTTPException 抛出，调用方负责关闭返回的响应
+async def open_chat_stream(request: ChatMessage, session_id: str) -> Tuple[httpx.Response, Dict[str, Any]]:
+    api_request_body, prompt_stats, route = await build_chat_request(request, session_id)
+    api_request_body["stream"] = True
+    
+    # 先建立上游流式连接，这样上游错误仍能以正常的HTTP状态码返回；
+    # 流式响应的总耗时取决于回答长度，只把建立连接的成败计入模型层级的SLO
+    try:
+        response = await upstream_client.open_stream(
+            json=api_request_body,
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            }
+        )
+    except httpx.RequestError as e:
+        model_router.record(route.tier, None, False)
+        logger.error("Upstream request error", extra={"error": str(e)})
+        raise HTTPException(status_code=500, detail=f"API call failed: {str(e)}")
+    
+    if response.is_error:
+        if is_model_failure(response.status_code):
+            model_router.record(route.tier, None, False)
+        error_text = (await response.aread()).decode("utf-8", errors="replace")
+        await response.aclose()
+        logger.error("Upstream HTTP status error", extra={"status": response.status_code, "body": error_text})
+        raise HTTPException(status_code=response.status_code, detail=f"API call failed: {error_text}")
+    model_router.record(route.tier, None, True)
+    return response, prompt_stats
+
+# 逐个产出上游SSE流中的增量文本
+async def upstream_deltas(response: httpx.Response):
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        try:
+            data = json_loads(payload)
+        except ValueError:
+            continue
+        choices = data.get("choices") or []
+        delta = (choices[0].get("delta") or {}).get("content") if choices else None
+        if delta:
+            yield delta
+
+# 流结束后把完整的AI回复加入会话历史，并安排后台压缩；首轮问题的答案存入语义答案缓存
+async def finish_chat_turn(session_id: str, chunks: List[str], request: ChatMessage, cache_scope: Optional[str]) -> str:
+    ai_message = "".join(chunks) or "Sorry, I could not get a response."
+    await session_store.append(session_id, "assistant", ai_message)
+    compactor.schedule(session_id)
+    if cache_scope is not None and chunks:
+        answer_cache.store(cache_scope, request.message, ai_message)
+    return ai_message
+
+# 以SSE事件返回缓存的答案（与上游流式回复的事件格式相同）
+async def cached_answer_events(session_id: str, answer: str):
+    yield sse_event({"sessionId": session_id, "cached": True}, event="start")
+    yield sse_event({"delta": answer})
+    yield sse_event({"response": answer}, event="done")
+
+# 流式聊天API路由（Server-Sent Events）
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatMessage):
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message is required")
+    
+    ensure_upstream_configured()
+    check_section_hash(request)
+    session_id = await prepare_session(request)
+    
+    cache_scope = await answer_cache_scope(request, session_id)
+    cached_answer = await serve_cached_answer(request, session_id, cache_scope)
+    if cached_answer is not None:
+        return StreamingResponse(
+            cached_answer_events(session_id, cached_answer),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Answer-Cache": "hit"},
+        )
+    
+    # 流式响应在整个流结束前一直占用上游调用名额
+    ticket = await admission.acquire(PRIORITY_CHAT, session_id)
+    
+    try:
+        response, prompt_stats = await open_chat_stream(request, session_id)
+    except BaseException:
+        ticket.release()
+        raise
+    
+    async def event_generator():
+        chunks = []
+        completed = False
+        started_at = time.perf_counter()
+        try:
+            yield sse_event({"sessionId": session_id, "prompt": prompt_stats}, event="start")
+            async for delta in upstream_deltas(response):
+                if not chunks:
+                    metrics.observe("stream_first_token_seconds", time.perf_counter() - started_at)
+                chunks.append(delta)
+                yield sse_event({"delta": delta})
+            completed = True
+            
+            ai_message = await finish_chat_turn(session_id, chunks, request, cache_scope)
+            yield sse_event({"response": ai_message}, event="done")
+        except httpx.HTTPError as e:
+            metrics.inc("upstream_errors_total", {"kind": "chat_stream", "error": type(e).__name__})
+            logger.error("Upstream stream error", extra={"session_id": session_id, "error": str(e)})
+            yield sse_event({"detail": f"API call failed: {str(e)}"}, event="error")
+        finally:
+            # 上游响应和调用名额只在这里释放；客户端断开时生成器会被取消或回收，同样会执行到这里
+            ticket.release()
+            await response.aclose()
+            metrics.observe("stream_duration_seconds", time.perf_counter() - started_at)
+            if not completed:
+                metrics.inc("stream_aborted_total")
+                logger.info("Stream ended before completion", extra={"session_id": session_id})
+    
+    # 先取出 start 事件让生成器开始执行：客户端在响应开始前就断开时 StreamingResponse 不会迭代生成器，
+    # 未开始的生成器没有机会执行 finally
+    events = event_generator()
+    start_event = await events.__anext__()
+    
+    async def primed_events():
+        yield start_event
+        async for event in events:
+            yield event
+    
+    return StreamingResponse(
+        primed_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **prompt_stats_headers(prompt_stats)},
+    )
+
+# WebSocket聊天通道：连接后先发送一次会话上下文（context帧），之后每轮只发送消息文本（message帧）。
+# 服务端以 start / delta / done / error 帧流式返回回复，定期发送 ping 心跳，并推送后台事件（如章节总结完成）
+@app.websocket("/api/chat/ws")
+async def chat_ws(websocket: WebSocket):
+    await websocket.accept()
+    metrics.gauge_add("ws_connections", 1)
+    send_lock = asyncio.Lock()
+    context: Optional[ChatMessage] = None
+    session_id: Optional[str] = None
+    turn: Optional[asyncio.Task] = None
+    background: List[asyncio.Task] = []
+    events: Optional[asyncio.Queue] = None
+    
+    async def send(frame: Dict[str, Any]):
+        async with send_lock:
+            await websocket.send_text(json_dumps(frame))
+    
+    async def send_error(status: int, detail: str, turn_id: Any = None, retry_after: Optional[int] = None):
+        frame: Dict[str, Any] = {"type": "error", "status": status, "detail": detail}
+        if turn_id is not None:
+            frame["id"] = turn_id
+        if retry_after is not None:
+            frame["retryAfter"] = retry_after
+        await send(frame)
+    
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_INTERVAL)
+            await send({"type": "ping", "ts": time.time()})
+    
+    async def push_events(queue: asyncio.Queue):
+        while True:
+            await send(await queue.get())
+    
+    # 一轮对话：与 /api/chat/stream 相同的准入控制、历史选择和提示构建
+    async def run_turn(request: ChatMessage, turn_id: Any):
+        cache_scope = await answer_cache_scope(request, session_id)
+        cached_answer = await serve_cached_answer(request, session_id, cache_scope)
+        if cached_answer is not None:
+            await send({"type": "start", "id": turn_id, "cached": True})
+            await send({"type": "delta", "id": turn_id, "delta": cached_answer})
+            await send({"type": "done", "id": turn_id, "response": cached_answer})
+            return
+        try:
+            ticket = await admission.acquire(PRIORITY_CHAT, session_id)
+        except AdmissionRejected as e:
+            await send_error(e.status_code, e.detail, turn_id, e.retry_after)
+            return
+        try:
+            response, prompt_stats = await open_chat_stream(request, session_id)
+        except HTTPException as e:
+            ticket.release()
+            await send_error(e.status_code, str(e.detail), turn_id)
+            return
+        except BaseException:
+            ticket.release()
+            raise
+        
+        chunks = []
+        completed = False
+        started_at = time.perf_counter()
+        try:
+            await send({"type": "start", "id": turn_id, "prompt": prompt_stats})
+            async for delta in upstream_deltas(response):
+                if not chunks:
+                    metrics.observe("stream_first_token_seconds", time.perf_counter() - started_at)
+                chunks.append(delta)
+                await send({"type": "delta", "id": turn_id, "delta": delta})
+            completed = True
+            
+            ai_message = await finish_chat_turn(session_id, chunks, request, cache_scope)
+            await send({"type": "done", "id": turn_id, "response": ai_message})
+        except httpx.HTTPError as e:
+            metrics.inc("upstream_errors_total", {"kind": "chat_stream", "error": type(e).__name__})
+            logger.error("Upstream stream error", extra={"session_id": session_id, "error": str(e)})
+            await send_error(502, f"API call failed: {str(e)}", turn_id)
+        finally:
+            # 连接断开或客户端取消时关闭上游响应以取消上游请求
+            ticket.release()
+            await response.aclose()
+            metrics.observe("stream_duration_seconds", time.perf_counter() - started_at)
+            if not completed:
+                metrics.inc("stream_aborted_total")
+                logger.info("Stream ended before completion", extra={"session_id": session_id})
+    
+    # 处理 context 帧：校验一次上下文，之后的消息帧复用它；会话ID在连接内不能改变
+    async def apply_context(frame: Dict[str, Any]):
+        nonlocal context, session_id, events
+        fields = {key: value for key, value in frame.items() if key not in ("type", "message")}
+        fields.setdefault("sessionId", session_id or websocket.query_params.get("sessionId"))
+        try:
+            candidate = ChatMessage(message="", **fields)
+        except ValidationError as e:
+            await send_error(422, str(e))
+            return
+        if session_id is not None and candidate.sessionId not in (None, session_id):
+            await send_error(400, "sessionId cannot change on an open connection")
+            return
+        try:
+            check_section_hash(candidate)
+        except HTTPException as e:
+            await send_error(e.status_code, str(e.detail))
+            return
+        if session_id is None:
+            session_id = candidate.sessionId or f"session_{datetime.now().timestamp()}"
+            events = session_events.subscribe(session_id)
+            background.append(asyncio.create_task(push_events(events)))
+            background.append(asyncio.create_task(heartbeat()))
+        context = candidate.model_copy(update={"sessionId": session_id})
+        await send({"type": "ready", "sessionId": session_id})
+    
+    try:
+        while True:
+            try:
+                incoming = await asyncio.wait_for(websocket.receive(), WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # 客户端长时间没有任何帧（包括心跳回应），视为连接已失效
+                await websocket.close(code=1001)
+                break
+            if incoming["type"] == "websocket.disconnect":
+                break
+            try:
+                frame = json_loads(incoming.get("text") or incoming.get("bytes") or b"")
+            except ValueError:
+                await send_error(400, "Frames must be JSON objects")
+                continue
+            if not isinstance(frame, dict):
+                await send_error(400, "Frames must be JSON objects")
+                continue
+            frame_type = frame.get("type")
+            metrics.inc("ws_frames_total", {"type": str(frame_type)})
+            
+            if frame_type == "ping":
+                await send({"type": "pong", "ts": time.time()})
+            elif frame_type == "pong":
+                continue
+            elif frame_type == "context":
+                await apply_context(frame)
+            elif frame_type == "message":
+                turn_id = frame.get("id")
+                message = frame.get("message")
+                if context is None:
+                    await send_error(400, "Send a context frame first", turn_id)
+                elif not isinstance(message, str) or not message:
+                    await send_error(400, "Message is required", turn_id)
+                elif turn is not None and not turn.done():
+                    await send_error(429, "A chat request for this session is already in progress", turn_id, 1)
+                elif not upstream_client.pool:
+                    await send_error(500, "Server configuration error: API Key is missing", turn_id)
+                else:
+                    request = context.model_copy(update={
+                        "message": message,
+                        "turnId": str(turn_id) if turn_id is not None else None,
+                    })
+                    logger.info("Received chat message", extra={
+                        "session_id": session_id,
+                        "section": request.currentSection,
+                        "message_chars": len(message),
+                        "transport": "websocket",
+                    })
+                    turn = asyncio.create_task(run_turn(request, turn_id))
+            elif frame_type == "cancel":
+                if turn is not None and not turn.done():
+                    turn.cancel()
+            else:
+                await send_error(400, f"Unknown frame type: {frame_type}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # 先同步地退订，再等待任务结束（等待期间本协程也可能被取消）
+        if events is not None:
+            session_events.unsubscribe(session_id, events)
+        metrics.gauge_add("ws_connections", -1)
+        tasks = background + ([turn] if turn is not None else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+# 注册章节内容，返回内容哈希；之后的聊天请求用 sectionHash 引用该章节
+@app.post("/api/sections")
+async def register_section(request: SectionRegistration):
+    if len(request.sectionContent.encode("utf-8")) > section_registry.max_content_bytes:
+        raise HTTPException(status_code=413, detail="Section content is too large")
+    section_hash = section_registry.register(request.sectionId, request.sectionContent, request.checkpointQuestion)
+    return {"sectionHash": section_hash, "sectionId": request.sectionId}
+
+# 章节注册表统计端点
+@app.get("/api/sections/stats")
+async def section_stats():
+    return section_registry.stats()
 
 # 新建聊天会话API
 @app.post("/api/chat/new")
@@ -204,10 +756,9 @@ async def new_chat(request: SessionRequest):
         raise HTTPException(status_code=400, detail="Session ID is required")
     
     # 清除会话历史
-    if request.sessionId in session_histories:
-        session_histories[request.sessionId] = []
+    await session_store.clear(request.sessionId)
     
-    print(f"Creating new chat session with ID: {request.sessionId}")
+    logger.info("Creating new chat session", extra={"session_id": request.sessionId})
     
     return {
         "success": True,
@@ -216,61 +767,137 @@ async def new_chat(request: SessionRequest):
     }
 
 # 获取会话历史API
+# 不带参数时返回完整历史；since=<seq> 只返回之后的新消息（增量同步），before=<seq> 向前翻页，
+# limit 控制每页消息数，includeSystem=false 不返回章节总结等系统消息。响应带ETag，历史未变化时返回304
 @app.get("/api/chat/history/{session_id}")
-async def get_chat_history(session_id: str):
-    if session_id not in session_histories:
-        return {"messages": []}
+async def get_chat_history(
+    session_id: str,
+    http_request: Request,
+    since: Optional[int] = None,
+    before: Optional[int] = None,
+    limit: Optional[int] = None,
+    includeSystem: bool = True,
+):
+    # 先只读取历史版本，客户端已是最新时不读取消息
+    count, first_seq, last_seq, cleared_seq = await session_store.history_version(session_id)
+    version = f"{count}:{first_seq}:{last_seq}:{cleared_seq}:{since}:{before}:{limit}:{includeSystem}"
+    etag = '"' + hashlib.blake2b(version.encode("utf-8"), digest_size=12).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(etag, http_request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
     
-    return {"messages": session_histories[session_id]}
+    # 客户端需要丢弃本地历史、从头同步的情况：游标比服务端最新的seq还大（会话被淘汰后重建），
+    # 游标在最近一次清空之前（/api/chat/new 之后seq继续递增，只比较最新seq发现不了），
+    # 或者游标之后的消息已经因消息数上限被截断
+    reset = since is not None and (
+        since > last_seq or 0 < since <= cleared_seq or 0 < since < first_seq - 1
+    )
+    if reset:
+        since = 0
+    
+    paginated = since is not None or before is not None or limit is not None
+    page_size = min(max(limit or HISTORY_PAGE_SIZE, 1), HISTORY_MAX_PAGE_SIZE) if paginated else max(count, 1)
+    # 多取一条判断是否还有更多消息
+    messages = await session_store.page_messages(session_id, since, before, page_size + 1, includeSystem)
+    has_more = len(messages) > page_size
+    if has_more:
+        messages = messages[:page_size] if since is not None else messages[-page_size:]
+    
+    content: Dict[str, Any] = {
+        "messages": [{"seq": message.seq, **message.to_dict()} for message in messages],
+        "lastSeq": last_seq,
+        "hasMore": has_more,
+    }
+    if since is not None:
+        # 下一次增量同步的起点；没有更多消息时直接使用最新seq，跳过被过滤掉的系统消息
+        content["nextSince"] = messages[-1].seq if has_more else last_seq
+        content["reset"] = reset
+    else:
+        # 继续向前翻页的游标
+        content["nextBefore"] = messages[0].seq if has_more and messages else None
+    return FastJSONResponse(content=content, headers=headers)
+
+# 返回预编译的JSON响应，带ETag和缓存头；客户端缓存仍有效时返回304
+def compiled_json_response(compiled: CompiledResponse, http_request: Request) -> Response:
+    headers = {"ETag": compiled.etag, "Cache-Control": CHECKPOINT_CACHE_CONTROL}
+    if etag_matches(compiled.etag, http_request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=compiled.body, media_type="application/json", headers=headers)
 
 # 检查点问题API
 @app.post("/api/checkpoint")
-async def checkpoint(request: CheckpointRequest):
+async def checkpoint(request: CheckpointRequest, http_request: Request):
     if not request.sectionId:
         raise HTTPException(status_code=400, detail="Section ID is required")
     
     # 获取对应章节的问题
-    question_data = get_question_for_section(request.sectionId)
-    
-    return question_data
+    return compiled_json_response(question_bank.question(request.sectionId, request.courseId), http_request)
 
-# 章节总结API
-@app.post("/api/summary")
-async def create_summary(request: SummaryRequest):
-    if not request.sessionId or not request.sectionId or not request.sectionContent or not request.checkpointQuestion:
-        raise HTTPException(status_code=400, detail="Missing required fields")
+# 批量获取一个课程的所有检查点问题
+@app.get("/api/checkpoints")
+async def checkpoints(http_request: Request, course: Optional[str] = None):
+    compiled_course = question_bank.course(course)
+    if compiled_course is None:
+        raise HTTPException(status_code=404, detail=f"Course not found: {course}")
     
-    # 从环境变量获取API密钥和URL
-    api_key = os.getenv("OPENAI_API_KEY")
-    base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1/chat/completions")
+    return compiled_json_response(compiled_course.bulk, http_request)
+
+# 调用上游生成总结
+async def request_summary(prompt: str, priority: int = PRIORITY_SUMMARY, kind: str = "summary") -> str:
+    # 构造请求体（总结类调用默认使用快速层级的模型）
+    route = model_router.route(kind)
+    api_request_body = {
+        "model": route.model,
+        "messages": [
+            {"role": "system", "content": "You are an expert educational content summarizer."},
+            {"role": "user", "content": prompt}
+        ]
+    }
     
-    if not api_key:
-        raise HTTPException(status_code=500, detail="Server configuration error: API Key is missing")
+    # 调用API（使用共享连接池），总结请求优先于聊天获得上游名额
+    async with admission.admit(priority):
+        with model_router.observe(route):
+            response = await upstream_client.post(
+                json=api_request_body,
+                headers={"Content-Type": "application/json"},
+                kind=kind,
+            )
+            response.raise_for_status()
     
-    # 构建提示，要求AI总结章节内容和检查点问题
+    data = json_loads(response.content)
+    return data["choices"][0]["message"]["content"] if "choices" in data and len(data["choices"]) > 0 else "No summary available."
+
+# 对话压缩使用的总结调用，以后台优先级排队
+async def summarize_conversation(prompt: str) -> str:
+    ensure_upstream_configured()
+    return await request_summary(prompt, priority=PRIORITY_BACKGROUND, kind="compaction")
+
+# 构建提示，要求AI总结章节内容和检查点问题；不传答案时得到与答案无关的章节总结
+def build_summary_prompt(section_id: str, section_content: str, checkpoint_question: Dict[str, Any],
+                         user_answer: Optional[str] = None, is_correct: Optional[bool] = None) -> str:
     prompt = f"""
 Please summarize the following section content and checkpoint question. 
 This summary will be used to provide context for future conversations with the user.
 
-Section ID: {request.sectionId}
+Section ID: {section_id}
 
 Section Content:
-{request.sectionContent}
+{section_content}
 
 Checkpoint Question:
-{request.checkpointQuestion['question']}
+{checkpoint_question['question']}
 
 Options:
 """
     
-    for option in request.checkpointQuestion['options']:
-        is_correct = option['id'] == request.checkpointQuestion['correctAnswerId']
-        prompt += f"- {option['id']}: {option['text']} {'(correct)' if is_correct else ''}\n"
+    for option in checkpoint_question['options']:
+        is_correct_option = option['id'] == checkpoint_question['correctAnswerId']
+        prompt += f"- {option['id']}: {option['text']} {'(correct)' if is_correct_option else ''}\n"
     
-    if request.userAnswer:
-        prompt += f"\nUser's answer: {request.userAnswer}\n"
-        if request.isCorrect is not None:
-            prompt += f"User's answer was {'correct' if request.isCorrect else 'incorrect'}.\n"
+    if user_answer:
+        prompt += f"\nUser's answer: {user_answer}\n"
+        if is_correct is not None:
+            prompt += f"User's answer was {'correct' if is_correct else 'incorrect'}.\n"
     
     prompt += """
 Please provide a concise summary (around 3-5 sentences) that captures:
@@ -280,223 +907,222 @@ Please provide a concise summary (around 3-5 sentences) that captures:
 
 The summary should be informative enough to provide context for future discussions, but brief enough to be easily referenced.
 """
+    return prompt
+
+# 与答案相关的部分不需要上游调用，直接拼接在预生成的章节总结之后
+def answer_note(user_answer: Optional[str], is_correct: Optional[bool]) -> str:
+    if not user_answer:
+        return ""
+    note = f"\nThe learner answered {user_answer}"
+    if is_correct is not None:
+        note += f", which was {'correct' if is_correct else 'incorrect'}"
+    return note + "."
+
+# 生成章节总结，返回 (summary, cache_status)
+async def generate_section_summary(request: SummaryRequest) -> Tuple[str, str]:
+    if summary_jobs.pregenerate and request.userAnswer:
+        # 预生成模式：在与答案无关的章节总结（可能已在预生成中，会合并等待）之后拼接答案信息
+        base_key = summary_cache_key(request.sectionId, request.sectionContent, request.checkpointQuestion, None, None)
+        base_prompt = build_summary_prompt(request.sectionId, request.sectionContent, request.checkpointQuestion)
+        base, cache_status = await summary_cache.get_or_create(base_key, lambda: request_summary(base_prompt))
+        return base + answer_note(request.userAnswer, request.isCorrect), cache_status
     
-    # 构造请求体
-    api_request_body = {
-        "model": "claude-3-7-sonnet-20250219",
-        "messages": [
-            {"role": "system", "content": "You are an expert educational content summarizer."},
-            {"role": "user", "content": prompt}
-        ]
-    }
+    prompt = build_summary_prompt(
+        request.sectionId, request.sectionContent, request.checkpointQuestion, request.userAnswer, request.isCorrect
+    )
+    # 相同输入的总结只请求一次上游，并发的相同请求会合并
+    cache_key = summary_cache_key(
+        request.sectionId,
+        request.sectionContent,
+        request.checkpointQuestion,
+        request.userAnswer,
+        request.isCorrect,
+    )
+    return await summary_cache.get_or_create(cache_key, lambda: request_summary(prompt))
+
+# 生成并保存章节总结；总结保存后之后的聊天请求才会使用它
+async def run_section_summary(request: SummaryRequest) -> Dict[str, Any]:
+    summary, cache_status = await generate_section_summary(request)
+    metrics.inc("summary_cache_total", {"status": cache_status})
+    logger.info("Summary cache lookup", extra={"section": request.sectionId, "cache_status": cache_status})
+    
+    # 存储总结
+    await session_store.set_summary(request.sessionId, request.sectionId, summary)
+    
+    # 将总结作为系统消息添加到会话历史中
+    await session_store.append(request.sessionId, "system", f"Section {request.sectionId} Summary: {summary}")
+    
+    # 通知该会话已连接的WebSocket，之后的聊天会使用这个总结
+    session_events.publish(request.sessionId, {"type": "summary", "sectionId": request.sectionId, "summary": summary})
+    
+    return {"summary": summary, "sectionId": request.sectionId, "cached": cache_status != "miss"}
+
+# 章节总结API（?mode=async 时立即返回202和任务ID，总结在后台任务队列中生成）
+@app.post("/api/summary")
+async def create_summary(request: SummaryRequest, mode: Optional[str] = None):
+    if not request.sessionId or not request.sectionId or not request.sectionContent or not request.checkpointQuestion:
+        raise HTTPException(status_code=400, detail="Missing required fields")
+    
+    ensure_upstream_configured()
+    
+    if mode == "async":
+        dedupe_key = request.sessionId + ":" + summary_cache_key(
+            request.sectionId, request.sectionContent, request.checkpointQuestion, request.userAnswer, request.isCorrect
+        )
+        job = summary_jobs.submit(lambda: run_section_summary(request), dedupe_key=dedupe_key)
+        # 多worker部署时查询请求需要带 sessionId 才能路由到同一个worker
+        status_url = f"/api/summary/jobs/{job.id}?{urlencode({'sessionId': request.sessionId})}"
+        return FastJSONResponse(
+            status_code=202,
+            content={"jobId": job.id, "status": job.status, "statusUrl": status_url},
+            headers={"Location": status_url},
+        )
     
     try:
-        # 调用API
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                base_url,
-                json=api_request_body,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}"
-                },
-                timeout=30.0
-            )
-            
-            response.raise_for_status()
-            
-            data = response.json()
-            summary = data["choices"][0]["message"]["content"] if "choices" in data and len(data["choices"]) > 0 else "No summary available."
-            
-            # 存储总结
-            if request.sessionId not in section_summaries:
-                section_summaries[request.sessionId] = {}
-            
-            section_summaries[request.sessionId][request.sectionId] = summary
-            
-            # 将总结作为系统消息添加到会话历史中
-            if request.sessionId not in session_histories:
-                session_histories[request.sessionId] = []
-            
-            system_message = {
-                "role": "system", 
-                "content": f"Section {request.sectionId} Summary: {summary}"
-            }
-            
-            # 添加系统消息到会话历史
-            session_histories[request.sessionId].append(system_message)
-            
-            return {
-                "success": True,
-                "summary": summary,
-                "message": f"Summary created for section {request.sectionId}"
-            }
+        result = await run_section_summary(request)
+        return {
+            "success": True,
+            "summary": result["summary"],
+            "message": f"Summary created for section {request.sectionId}",
+            "cached": result["cached"]
+        }
     
+    except AdmissionRejected:
+        raise
     except httpx.HTTPStatusError as e:
-        print(f"HTTP Status Error: {e.response.status_code} - {e.response.text}")
+        logger.error("Upstream HTTP status error", extra={"status": e.response.status_code, "body": e.response.text})
         raise HTTPException(status_code=e.response.status_code, detail=f"API call failed: {e.response.text}")
     except httpx.RequestError as e:
-        print(f"Request Error: {str(e)}")
+        logger.error("Upstream request error", extra={"error": str(e)})
         raise HTTPException(status_code=500, detail=f"API call failed: {str(e)}")
     except Exception as e:
-        print(f"Unexpected Error: {str(e)}")
+        logger.exception("Unexpected error")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
-# 获取章节问题的辅助函数
-def get_question_for_section(section_id: str) -> Dict[str, Any]:
-    # 预定义的问题库
-    questions = {
-        "1.1": {
-            "question": "What is the main purpose of spam classification in the context of this project?",
-            "options": [
-                {"id": "a", "text": "To categorize emails by their sender"},
-                {"id": "b", "text": "To filter unwanted messages from legitimate ones"},
-                {"id": "c", "text": "To analyze the writing style of different authors"},
-                {"id": "d", "text": "To compress text data for efficient storage"}
-            ],
-            "correctAnswerId": "b"
-        },
-        "1.2": {
-            "question": "Which of the following is NOT one of the key steps in the spam classification process?",
-            "options": [
-                {"id": "a", "text": "Data Collection"},
-                {"id": "b", "text": "Text Preprocessing"},
-                {"id": "c", "text": "Feature Extraction"},
-                {"id": "d", "text": "Image Recognition"}
-            ],
-            "correctAnswerId": "d"
-        },
-        "1.3": {
-            "question": "By the end of this project, what will you have built?",
-            "options": [
-                {"id": "a", "text": "A language translation system"},
-                {"id": "b", "text": "A spam classification system"},
-                {"id": "c", "text": "A text summarization tool"},
-                {"id": "d", "text": "A sentiment analysis model"}
-            ],
-            "correctAnswerId": "b"
-        },
-        "2.1": {
-            "question": "Why is data processing crucial in an NLP pipeline?",
-            "options": [
-                {"id": "a", "text": "It makes the text more readable for humans"},
-                {"id": "b", "text": "It prepares text data for machine learning algorithms"},
-                {"id": "c", "text": "It increases the size of the dataset"},
-                {"id": "d", "text": "It translates text into different languages"}
-            ],
-            "correctAnswerId": "b"
-        },
-        "2.2": {
-            "question": "Which of the following is a characteristic of spam messages based on the sample data?",
-            "options": [
-                {"id": "a", "text": "They are always written in all caps"},
-                {"id": "b", "text": "They often contain personal information"},
-                {"id": "c", "text": "They frequently mention urgency or offers"},
-                {"id": "d", "text": "They are always shorter than ham messages"}
-            ],
-            "correctAnswerId": "c"
-        },
-        "2.3": {
-            "question": "Which of the following is NOT a typical text preprocessing step?",
-            "options": [
-                {"id": "a", "text": "Lowercasing"},
-                {"id": "b", "text": "Tokenization"},
-                {"id": "c", "text": "Encryption"},
-                {"id": "d", "text": "Removing Stop Words"}
-            ],
-            "correctAnswerId": "c"
-        },
-        "3.1": {
-            "question": "Why is text vectorization necessary in NLP?",
-            "options": [
-                {"id": "a", "text": "To make text more readable"},
-                {"id": "b", "text": "To convert text into a format that machine learning algorithms can understand"},
-                {"id": "c", "text": "To reduce the size of the text data"},
-                {"id": "d", "text": "To translate text into different languages"}
-            ],
-            "correctAnswerId": "b"
-        },
-        "3.2": {
-            "question": "Which of the following is NOT one of the three main text vectorization techniques discussed?",
-            "options": [
-                {"id": "a", "text": "Bag of Words (BOW)"},
-                {"id": "b", "text": "TF-IDF"},
-                {"id": "c", "text": "Word Embeddings"},
-                {"id": "d", "text": "Binary Encoding"}
-            ],
-            "correctAnswerId": "d"
-        },
-        "3.3": {
-            "question": "What does the Bag of Words model disregard when representing text?",
-            "options": [
-                {"id": "a", "text": "Word frequency"},
-                {"id": "b", "text": "Grammar and word order"},
-                {"id": "c", "text": "The presence of words"},
-                {"id": "d", "text": "All of the above"}
-            ],
-            "correctAnswerId": "b"
-        },
-        "4.1": {
-            "question": "Which of the following algorithms is particularly effective for text classification?",
-            "options": [
-                {"id": "a", "text": "K-means clustering"},
-                {"id": "b", "text": "Principal Component Analysis (PCA)"},
-                {"id": "c", "text": "Naive Bayes"},
-                {"id": "d", "text": "Linear Regression"}
-            ],
-            "correctAnswerId": "c"
-        },
-        "4.2": {
-            "question": "Which of the following is NOT a common metric for evaluating classification models?",
-            "options": [
-                {"id": "a", "text": "Accuracy"},
-                {"id": "b", "text": "Precision"},
-                {"id": "c", "text": "Mean Squared Error (MSE)"},
-                {"id": "d", "text": "F1-score"}
-            ],
-            "correctAnswerId": "c"
-        }
-    }
+# 查询后台总结任务的状态（queued / running / done / failed），完成后包含总结内容
+@app.get("/api/summary/jobs/{job_id}")
+async def summary_job_status(job_id: str):
+    job = summary_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Summary job not found or expired")
+    return job.to_dict()
+
+# 章节首次打开时预先生成与答案无关的章节总结（需要 SUMMARY_PREGENERATE=true），以后台优先级执行
+@app.post("/api/summary/pregenerate")
+async def pregenerate_summary(request: SummaryPregenerateRequest):
+    if not summary_jobs.pregenerate:
+        return {"scheduled": False, "reason": "disabled"}
+    if not request.sectionId or not request.sectionContent or not request.checkpointQuestion:
+        raise HTTPException(status_code=400, detail="Missing required fields")
     
-    # 如果找不到对应章节的问题，返回默认问题
-    if section_id not in questions:
-        return {
-            "question": "What are the three main text vectorization techniques discussed in this course?",
-            "options": [
-                {"id": "a", "text": "Bag of Words, TF-IDF, Word Embeddings"},
-                {"id": "b", "text": "Word2Vec, GloVe, FastText"},
-                {"id": "c", "text": "Tokenization, Stemming, Lemmatization"},
-                {"id": "d", "text": "CNN, RNN, Transformer"}
-            ],
-            "correctAnswerId": "a"
-        }
+    ensure_upstream_configured()
+    
+    cache_key = summary_cache_key(request.sectionId, request.sectionContent, request.checkpointQuestion, None, None)
+    if summary_cache.get(cache_key) is not None:
+        return {"scheduled": False, "reason": "cached"}
+    
+    prompt = build_summary_prompt(request.sectionId, request.sectionContent, request.checkpointQuestion)
     
-    return questions[section_id]
+    async def pregenerate() -> Dict[str, Any]:
+        _, cache_status = await summary_cache.get_or_create(
+            cache_key, lambda: request_summary(prompt, priority=PRIORITY_BACKGROUND, kind="summary_pregenerate")
+        )
+        metrics.inc("summary_pregenerate_total", {"status": cache_status})
+        return {"sectionId": request.sectionId, "cached": cache_status != "miss"}
+    
+    job = summary_jobs.submit(pregenerate, dedupe_key=f"pregenerate:{cache_key}")
+    return FastJSONResponse(status_code=202, content={"scheduled": True, "jobId": job.id, "status": job.status})
+
+# 后台总结任务队列统计端点
+@app.get("/api/summary/jobs")
+async def summary_jobs_stats():
+    return summary_jobs.stats()
 
 # 添加健康检查端点
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok", "message": "API is running"}
 
-# 配置静态文件服务（前端构建文件）
+# 静态资源索引统计端点
+@app.get("/api/static/stats")
+async def static_stats():
+    return static_assets.stats()
+
+# 提示前缀复用统计端点
+@app.get("/api/prompt/stats")
+async def prompt_stats_endpoint():
+    return prompt_builder.stats()
+
+# 对话压缩统计端点
+@app.get("/api/compaction/stats")
+async def compaction_stats():
+    return compactor.stats()
+
+# 准入控制统计端点
+@app.get("/api/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+# 语义答案缓存统计端点（条目数、命中率）
+@app.get("/api/answers/cache/stats")
+async def answer_cache_stats():
+    return answer_cache.stats()
+
+# 模型路由统计端点（各层级的延迟、错误率和降级状态）
+@app.get("/api/models/stats")
+async def model_router_stats():
+    return model_router.stats()
+
+# 章节总结缓存统计端点
+@app.get("/api/summary/cache/stats")
+async def summary_cache_stats():
+    return summary_cache.stats()
+
+# WebSocket会话事件推送统计端点
+@app.get("/api/events/stats")
+async def session_event_stats():
+    return session_events.stats()
+
+# 会话存储统计端点（会话数、消息数、内存占用）
+@app.get("/api/sessions/stats")
+async def session_stats():
+    return await session_store.stats()
+
+# 延迟、吞吐和错误指标端点（默认JSON，?format=prometheus 返回Prometheus文本格式）
+@app.get("/api/metrics")
+async def get_metrics(format: str = "json"):
+    if format == "prometheus":
+        return PlainTextResponse(metrics.prometheus(), media_type="text/plain; version=0.0.4")
+    return metrics.snapshot()
+
+# 上游端点池的健康状态和选择统计（EWMA延迟、进行中请求、熔断状态）
+@app.get("/api/upstreams")
+async def upstreams():
+    return upstream_client.pool.stats()
+
+# 上游连接池统计端点
+@app.get("/api/upstream/stats")
+async def upstream_stats():
+    return upstream_client.stats()
+
+# 配置静态文件服务（前端构建文件，从启动时建立的内存索引中提供）
 @app.get("/{full_path:path}")
-async def serve_frontend(full_path: str):
+async def serve_frontend(full_path: str, http_request: Request):
     # 如果请求的是API路径，则不处理
     if full_path.startswith("api/"):
         raise HTTPException(status_code=404, detail="Not Found")
     
-    # 尝试提供请求的文件
-    file_path = os.path.join("dist", full_path)
-    if os.path.exists(file_path) and os.path.isfile(file_path):
-        return FileResponse(file_path)
-    
-    # 如果文件不存在，返回index.html（用于SPA路由）
-    return FileResponse("dist/index.html")
+    # 提供请求的文件，不存在时返回index.html（用于SPA路由）
+    response = static_assets.serve(full_path, http_request.headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Frontend is not built")
+    return response
 
 # 主入口点
 if __name__ == "__main__":
     # 获取端口，默认为8000
-    port = int(os.getenv("PORT", 8000))
+    port = env_int("PORT", 8000)
     
-    # 启动服务器
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
\ No newline at end of file
+    # 单进程启动服务器（默认监视文件自动重载，RELOAD=false 关闭）；多worker部署使用 python serve.py
+    reload = env_bool("RELOAD", True)
+    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=reload)
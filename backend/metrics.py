@@ -0,0 +1,168 @@
+import time
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional, Tuple
+
+# 延迟（秒）和大小（字符/token）的默认分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+SIZE_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # 根据分桶估算分位数（取所在桶的上界）
+    def percentile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "avg": round(self.sum / self.count, 6) if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "buckets": {str(b): c for b, c in zip(list(self.buckets) + ["+Inf"], self.counts)},
+        }
+
+
+# 进程内的指标注册表：直方图、计数器和仪表值，按名称和标签区分
+class MetricsRegistry:
+    def __init__(self):
+        self.started_at = time.time()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._bucket_config: Dict[str, Tuple[float, ...]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+
+    @staticmethod
+    def _key(labels: Optional[Dict[str, str]]) -> LabelKey:
+        return tuple(sorted(labels.items())) if labels else ()
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None,
+                buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        series = self._histograms.setdefault(name, {})
+        key = self._key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self._bucket_config.setdefault(name, buckets))
+        histogram.observe(value)
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, amount: float = 1) -> None:
+        series = self._counters.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def gauge_add(self, name: str, amount: float, labels: Optional[Dict[str, str]] = None) -> None:
+        series = self._gauges.setdefault(name, {})
+        key = self._key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def gauge_set(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        self._gauges.setdefault(name, {})[self._key(labels)] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        def series_list(series: Dict[LabelKey, Any], render) -> List[Dict[str, Any]]:
+            return [{"labels": dict(key), **render(value)} for key, value in series.items()]
+
+        return {
+            "uptimeSeconds": round(time.time() - self.started_at, 3),
+            "histograms": {name: series_list(series, Histogram.snapshot) for name, series in self._histograms.items()},
+            "counters": {name: series_list(series, lambda v: {"value": v}) for name, series in self._counters.items()},
+            "gauges": {name: series_list(series, lambda v: {"value": v}) for name, series in self._gauges.items()},
+        }
+
+    # Prometheus 文本格式
+    def prometheus(self) -> str:
+        def fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+            items = list(key) + ([extra] if extra else [])
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        for name, series in self._histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bucket, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{fmt_labels(key, ('le', str(bucket)))} {cumulative}")
+                lines.append(f"{name}_sum{fmt_labels(key)} {histogram.sum}")
+                lines.append(f"{name}_count{fmt_labels(key)} {histogram.count}")
+        for name, series in self._counters.items():
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{fmt_labels(key)} {value}")
+        for name, series in self._gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in series.items():
+                lines.append(f"{name}{fmt_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+
+# 记录每个端点的端到端延迟、进行中的请求数和错误数（纯ASGI中间件，不缓冲流式响应）
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[Dict[Any, str]] = None
+
+    # 用路由模板（如 /api/chat/history/{session_id}）作为端点标签，避免标签数量随路径参数增长
+    def _endpoint_label(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            routes = getattr(scope.get("app"), "routes", [])
+            self._route_paths = {getattr(r, "endpoint", None): getattr(r, "path", "") for r in routes}
+        return self._route_paths.get(endpoint, getattr(endpoint, "__name__", "unknown"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        metrics.gauge_add("http_requests_in_flight", 1)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.gauge_add("http_requests_in_flight", -1)
+            labels = {"endpoint": self._endpoint_label(scope), "method": scope.get("method", "")}
+            metrics.observe("http_request_duration_seconds", time.perf_counter() - start, labels)
+            metrics.inc("http_requests_total", {**labels, "status": str(status["code"])})
+            if status["code"] >= 400:
+                metrics.inc("http_request_errors_total", {**labels, "status": str(status["code"])})
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, NamedTuple
+
+from env import env_float, env_int
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-3-7-sonnet-20250219"
+
+# 总结类调用（章节总结、预生成、对话压缩）
+SUMMARY_ENDPOINTS = frozenset({"summary", "summary_pregenerate", "compaction"})
+
+# 调试求助的廉价特征：代码块、报错信息、函数调用等，这类问题交给强模型
+_COMPLEX_RE = re.compile(
+    r"```|traceback|exception|error|\bbug|debug|stack trace|not work|doesn't work|crash|\bfails?\b"
+    r"|\bdef |\bimport |\w+\([^)]*\)|报错|错误|异常|调试",
+    re.IGNORECASE,
+)
+
+
+# 计入模型层级错误率的上游状态码
+def is_model_failure(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+class ModelRoute(NamedTuple):
+    tier: str
+    model: str
+    reason: str
+
+
+# 一个模型层级：模型名、降级目标和SLO（延迟p95和错误率），带最近调用结果的滑动窗口
+class ModelTier:
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        fallback: Optional[str] = None,
+        slo_latency: float = 30.0,
+        slo_error_rate: float = 0.2,
+        window: int = 100,
+    ):
+        self.name = name
+        self.model = model
+        self.fallback = fallback
+        self.slo_latency = slo_latency
+        self.slo_error_rate = slo_error_rate
+        # (延迟或None, 是否成功)；流式请求只记录成败
+        self.samples: deque = deque(maxlen=window)
+        self.degraded_until = 0.0
+        self.downgrades = 0
+        self.routed = 0
+
+    def p95_latency(self) -> Optional[float]:
+        latencies = sorted(latency for latency, _ in self.samples if latency is not None)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        p95 = self.p95_latency()
+        return {
+            "name": self.name,
+            "model": self.model,
+            "fallback": self.fallback,
+            "sloLatency": self.slo_latency,
+            "sloErrorRate": self.slo_error_rate,
+            "samples": len(self.samples),
+            "p95Latency": round(p95, 3) if p95 is not None else None,
+            "errorRate": round(self.error_rate(), 4),
+            "degraded": self.degraded_until > now,
+            "degradedForSeconds": round(self.degraded_until - now, 3) if self.degraded_until > now else None,
+            "downgrades": self.downgrades,
+            "routed": self.routed,
+        }
+
+
+# 按任务选择模型层级：总结类调用用快速层级，简短的简单问题用快速层级，调试类和长问题用强层级；
+# 层级的延迟p95或错误率超过SLO时，在冷却期内自动降级到它的 fallback 层级
+class ModelRouter:
+    def __init__(
+        self,
+        tiers: List[ModelTier],
+        summary_tier: str = "fast",
+        chat_tier: str = "strong",
+        simple_tier: str = "fast",
+        simple_max_chars: int = 200,
+        simple_max_prompt_tokens: int = 3000,
+        min_samples: int = 20,
+        cooldown: float = 60.0,
+    ):
+        self.tiers = {tier.name: tier for tier in tiers}
+        self.summary_tier = summary_tier
+        self.chat_tier = chat_tier
+        self.simple_tier = simple_tier
+        self.simple_max_chars = simple_max_chars
+        self.simple_max_prompt_tokens = simple_max_prompt_tokens
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+
+    # MODEL_TIERS 为JSON数组，例如
+    # [{"name": "fast", "model": "...", "sloLatency": 8}, {"name": "strong", "model": "...", "fallback": "fast"}]
+    # 没有配置时两个层级都使用原来的模型
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        window = env_int("MODEL_SLO_WINDOW", 100)
+        raw = os.getenv("MODEL_TIERS", "").strip()
+        items = json.loads(raw) if raw else [
+            {"name": "fast", "model": DEFAULT_MODEL},
+            {"name": "strong", "model": DEFAULT_MODEL, "fallback": "fast"},
+        ]
+        tiers = [
+            ModelTier(
+                name=item["name"],
+                model=item.get("model") or DEFAULT_MODEL,
+                fallback=item.get("fallback"),
+                slo_latency=float(item.get("sloLatency", 30.0)),
+                slo_error_rate=float(item.get("sloErrorRate", 0.2)),
+                window=window,
+            )
+            for item in items
+        ]
+        return cls(
+            tiers,
+            summary_tier=os.getenv("MODEL_SUMMARY_TIER", "fast"),
+            chat_tier=os.getenv("MODEL_CHAT_TIER", "strong"),
+            simple_tier=os.getenv("MODEL_SIMPLE_TIER", "fast"),
+            simple_max_chars=env_int("MODEL_SIMPLE_MAX_CHARS", 200),
+            simple_max_prompt_tokens=env_int("MODEL_SIMPLE_MAX_PROMPT_TOKENS", 3000),
+            min_samples=env_int("MODEL_SLO_MIN_SAMPLES", 20),
+            cooldown=env_float("MODEL_DOWNGRADE_COOLDOWN", 60.0),
+        )
+
+    def _tier(self, name: str) -> ModelTier:
+        # 配置中不存在的层级名退回到第一个层级
+        return self.tiers.get(name) or next(iter(self.tiers.values()))
+
+    def route(self, endpoint: str, message: str = "", prompt_tokens: int = 0) -> ModelRoute:
+        if endpoint in SUMMARY_ENDPOINTS:
+            tier, reason = self._tier(self.summary_tier), "summary"
+        elif _COMPLEX_RE.search(message):
+            tier, reason = self._tier(self.chat_tier), "complex"
+        elif len(message) <= self.simple_max_chars and prompt_tokens <= self.simple_max_prompt_tokens:
+            tier, reason = self._tier(self.simple_tier), "simple"
+        else:
+            tier, reason = self._tier(self.chat_tier), "default"
+
+        now = time.monotonic()
+        # 沿降级链找到第一个没有被降级的层级（避免循环）
+        seen = {tier.name}
+        while tier.degraded_until > now and tier.fallback and tier.fallback not in seen and tier.fallback in self.tiers:
+            tier, reason = self.tiers[tier.fallback], "downgraded"
+            seen.add(tier.name)
+
+        tier.routed += 1
+        metrics.inc("model_route_total", {"endpoint": endpoint, "tier": tier.name, "reason": reason})
+        return ModelRoute(tier.name, tier.model, reason)
+
+    # 记录一次调用的结果；latency 为 None 时只计入错误率（流式请求）
+    def record(self, tier_name: str, latency: Optional[float], ok: bool) -> None:
+        tier = self.tiers.get(tier_name)
+        if tier is None:
+            return
+        tier.samples.append((latency, ok))
+        if latency is not None:
+            metrics.observe("model_request_duration_seconds", latency, {"tier": tier_name})
+        if not ok:
+            metrics.inc("model_errors_total", {"tier": tier_name})
+        if len(tier.samples) < self.min_samples or tier.fallback is None:
+            return
+        p95 = tier.p95_latency()
+        error_rate = tier.error_rate()
+        if (p95 is not None and p95 > tier.slo_latency) or error_rate > tier.slo_error_rate:
+            tier.degraded_until = time.monotonic() + self.cooldown
+            tier.downgrades += 1
+            # 冷却结束后重新积累样本再判断
+            tier.samples.clear()
+            metrics.inc("model_downgrades_total", {"tier": tier_name})
+            logger.warning("Model tier exceeded its SLO, downgrading", extra={
+                "tier": tier_name,
+                "fallback": tier.fallback,
+                "p95_latency": p95,
+                "error_rate": round(error_rate, 4),
+                "cooldown": self.cooldown,
+            })
+
+    # 包住一次上游调用：正常结束记为成功，网络错误、限流和5xx记为失败；
+    # 客户端取消和其他4xx（请求本身的问题）不计入
+    @contextmanager
+    def observe(self, route: ModelRoute):
+        started = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            response = getattr(e, "response", None)
+            status = getattr(response, "status_code", None)
+            if status is None or is_model_failure(status):
+                self.record(route.tier, time.perf_counter() - started, False)
+            raise
+        self.record(route.tier, time.perf_counter() - started, True)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "summaryTier": self.summary_tier,
+            "chatTier": self.chat_tier,
+            "simpleTier": self.simple_tier,
+            "simpleMaxChars": self.simple_max_chars,
+            "simpleMaxPromptTokens": self.simple_max_prompt_tokens,
+            "minSamples": self.min_samples,
+            "cooldown": self.cooldown,
+            "tiers": [tier.stats(now) for tier in self.tiers.values()],
+        }
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+# 持久化到JSON文件的内存缓存：修改时标记为脏，后台任务按间隔整体写入，关闭时再写一次；
+# 启动时从文件恢复。子类负责条目和JSON列表之间的转换
+class PersistentCache(ABC):
+    # 日志中使用的缓存名称
+    cache_name = "cache"
+
+    def __init__(self, path: Optional[str] = None, flush_interval: float = 60.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._dirty = False
+        self._flusher: Optional[asyncio.Task] = None
+
+    # 当前条目的可JSON序列化列表（在事件循环中调用）
+    @abstractmethod
+    def _snapshot(self) -> list:
+        ...
+
+    # 用文件中读出的条目恢复缓存，负责丢弃已过期的条目（在工作线程中调用，此时还没有请求）
+    @abstractmethod
+    def _restore(self, entries: list) -> None:
+        ...
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load {self.cache_name}", extra={"path": self.path, "error": str(e)})
+            return
+        self._restore(data.get("entries", []))
+        self._dirty = False
+
+    def _save(self, entries: list) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    async def flush(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        entries = self._snapshot()
+        self._dirty = False
+        await asyncio.to_thread(self._save, entries)
+
+    async def start(self) -> None:
+        if not self.path:
+            return
+        await asyncio.to_thread(self._load)
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except OSError as e:
+                logger.error(f"Failed to persist {self.cache_name}", extra={"path": self.path, "error": str(e)})
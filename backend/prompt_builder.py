@@ -0,0 +1,178 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+from env import env_bool, env_float, env_int
+
+# 所有请求共享的静态教学指令，放在提示的最前面，上游可以缓存这一段前缀
+STATIC_INSTRUCTIONS = """You are an expert in project-based learning. You specialize in teaching AI and deep learning through projects.
+Task: The learner wants to discuss some content in the tutorial with you. You will be given the framework of the tutorial,
+a summary of the learner's current progress, and the content they have questions about.
+
+Requirements:
+1. Be engaging, helpful, and ready to answer questions as long as they relate to the tutorial. Do not give away
+   the full answer to a complex question right away. Guide the learner to think first. Progressively provide more
+   assistance if the learner has trouble figuring out the problem on their own.
+2. If the learner deviates too much from the tutorial, remind them to stay on track.
+3. Encourage the learner when needed, such as when they have trouble fixing a bug.
+4. All math formulas should be written in LaTex format and surrounded by dollar signs ($ or $$).
+5. All hyperlinks should be written in markdown format like this: [link text](link URL).
+6. Reference the current section content and checkpoint questions when relevant to provide more personalized help.
+7. If the user asks about their previous choices or answers, provide helpful feedback based on that information.
+8. Remember the conversation history and refer back to previous questions and answers when appropriate.
+9. If there's a section summary available, use it to provide more targeted and relevant responses.
+"""
+
+# 提示分层，按稳定程度从高到低排列
+TIER_STATIC = "static"
+TIER_SECTION = "section"
+TIER_SESSION = "session"
+
+
+# 章节层：同一章节的所有学习者共享（章节内容和检查点问题）
+def section_segment(current_section: Optional[str], section_content: Optional[str],
+                    checkpoint_question: Optional[Dict[str, Any]]) -> str:
+    segment = ""
+    if current_section and section_content:
+        segment += f"\nCurrent section: {current_section}\n"
+        segment += f"Section content: {section_content}\n"
+
+    if checkpoint_question:
+        question = checkpoint_question.get("question", "")
+        options = checkpoint_question.get("options", [])
+        correct_answer_id = checkpoint_question.get("correctAnswerId", "")
+
+        if question and options and correct_answer_id:
+            segment += "\nRecent checkpoint question:\n"
+            segment += f"Question: {question}\n"
+            segment += "Options:\n"
+
+            for option in options:
+                option_id = option.get("id", "")
+                option_text = option.get("text", "")
+                if option_id and option_text:
+                    is_correct = option_id == correct_answer_id
+                    segment += f"- {option_id}: {option_text} {'(correct)' if is_correct else ''}\n"
+    return segment
+
+
+# 会话层：只属于当前学习者（章节总结、之前的选择、较早对话的滚动总结）
+def session_segment(section_summary: Optional[str], user_choices: Optional[Dict[str, Any]],
+                    compacted_summary: Optional[str]) -> str:
+    segment = ""
+    if section_summary:
+        segment += f"\nSection summary: {section_summary}\n"
+
+    if user_choices:
+        segment += "\nUser's previous choices:\n"
+        # 按键排序，相同的选择总是生成相同的文本
+        for key in sorted(user_choices):
+            segment += f"- {key}: {user_choices[key]}\n"
+
+    if compacted_summary:
+        segment += f"\nSummary of the earlier conversation: {compacted_summary}\n"
+    return segment
+
+
+# 记录最近发给上游的提示前缀（逐段链式哈希），估算每个请求能命中上游提示缓存的前缀比例
+class PrefixTracker:
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 50000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[bytes, float]" = OrderedDict()
+
+    # 返回 (可复用的前缀字符数, 总字符数)，并记录本次请求的所有前缀
+    def observe(self, segments: List[str]) -> Tuple[int, int]:
+        now = time.monotonic()
+        digest = hashlib.blake2b(digest_size=16)
+        reused = 0
+        total = 0
+        matching = True
+        for segment in segments:
+            digest.update(segment.encode("utf-8"))
+            digest.update(b"\x00")
+            key = digest.copy().digest()
+            total += len(segment)
+            if matching:
+                seen_at = self._seen.get(key)
+                if seen_at is not None and now - seen_at < self.ttl_seconds:
+                    reused += len(segment)
+                else:
+                    matching = False
+            self._seen[key] = now
+            self._seen.move_to_end(key)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return reused, total
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+# 按稳定程度排列提示：静态指令 → 章节内容 → 会话状态 → 对话，可选地加入上游缓存断点
+class PromptBuilder:
+    def __init__(self, cache_control: bool = False, tracker: Optional[PrefixTracker] = None):
+        self.cache_control = cache_control
+        self.tracker = tracker or PrefixTracker()
+        self.requests = 0
+        self.reused_chars = 0
+        self.total_chars = 0
+
+    @classmethod
+    def from_env(cls) -> "PromptBuilder":
+        return cls(
+            cache_control=env_bool("PROMPT_CACHE_CONTROL", False),
+            tracker=PrefixTracker(
+                ttl_seconds=env_float("PROMPT_PREFIX_TTL", 300.0),
+                max_entries=env_int("PROMPT_PREFIX_MAX_ENTRIES", 50000),
+            ),
+        )
+
+    @staticmethod
+    def system_tiers(section: str, session: str) -> List[Tuple[str, str]]:
+        tiers = [(TIER_STATIC, STATIC_INSTRUCTIONS), (TIER_SECTION, section), (TIER_SESSION, session)]
+        return [(tier, content) for tier, content in tiers if content]
+
+    @staticmethod
+    def system_text(tiers: List[Tuple[str, str]]) -> str:
+        return "".join(content for _, content in tiers)
+
+    # 生成消息列表和前缀复用统计；history 为 {"role", "content"} 字典，最后一条是本次的用户消息
+    def build(self, tiers: List[Tuple[str, str]], history: List[Dict[str, str]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        if self.cache_control:
+            # 每一层末尾一个断点（Anthropic 风格的 cache_control），上游按层缓存
+            system_content: Any = [
+                {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
+                for _, content in tiers
+            ]
+        else:
+            system_content = self.system_text(tiers)
+        messages: List[Dict[str, Any]] = [{"role": "system", "content": system_content}]
+        messages.extend(dict(message) for message in history)
+
+        if self.cache_control and len(messages) >= 3:
+            # 再在本次用户消息之前的一条消息上加断点，缓存到上一轮为止的对话
+            previous = messages[-2]
+            previous["content"] = [{"type": "text", "text": previous["content"], "cache_control": {"type": "ephemeral"}}]
+
+        segments = [content for _, content in tiers] + [f"{m['role']}:{m['content']}" for m in history]
+        reused, total = self.tracker.observe(segments)
+        self.requests += 1
+        self.reused_chars += reused
+        self.total_chars += total
+        stats = {
+            "prefixReuseRatio": round(reused / total, 4) if total else 0.0,
+            "cachedPrefixChars": reused,
+            "tierChars": {tier: len(content) for tier, content in tiers},
+        }
+        return messages, stats
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cacheControl": self.cache_control,
+            "requests": self.requests,
+            "prefixReuseRatio": round(self.reused_chars / self.total_chars, 4) if self.total_chars else 0.0,
+            "trackedPrefixes": len(self.tracker),
+            "prefixTtlSeconds": self.tracker.ttl_seconds,
+        }
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping
+
+from env import env_float
+
+logger = logging.getLogger(__name__)
+
+
+# 预编译的响应：序列化好的JSON字节和对应的强ETag
+class CompiledResponse:
+    __slots__ = ("data", "body", "etag")
+
+    def __init__(self, data: Any):
+        self.data = _freeze(data)
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+
+def _freeze(value: Any) -> Any:
+    # 把嵌套的dict/list转换为只读结构，防止请求处理代码意外修改题库
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class CompiledCourse:
+    __slots__ = ("course_id", "questions", "default", "bulk")
+
+    def __init__(self, course_id: str, course: Dict[str, Any]):
+        self.course_id = course_id
+        sections = course.get("sections", {})
+        self.questions: Mapping[str, CompiledResponse] = MappingProxyType(
+            {section_id: CompiledResponse(question) for section_id, question in sections.items()}
+        )
+        self.default = CompiledResponse(course["defaultQuestion"])
+        self.bulk = CompiledResponse({
+            "course": course_id,
+            "title": course.get("title", ""),
+            "questions": sections,
+            "defaultQuestion": course["defaultQuestion"],
+        })
+
+
+# 从数据文件加载的检查点题库，文件修改后自动重新加载
+class QuestionBank:
+    def __init__(self, path: str, reload_interval: float = 2.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._courses: Mapping[str, CompiledCourse] = MappingProxyType({})
+        self.default_course = ""
+        self.reloads = 0
+        self._load()
+
+    @classmethod
+    def from_env(cls) -> "QuestionBank":
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints.json")
+        return cls(
+            path=os.getenv("CHECKPOINT_BANK_PATH", default_path),
+            reload_interval=env_float("CHECKPOINT_BANK_RELOAD_INTERVAL", 2.0),
+        )
+
+    def _load(self) -> None:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        courses = {course_id: CompiledCourse(course_id, course) for course_id, course in data["courses"].items()}
+        # 一次性替换整个索引，读取方看到的总是完整的旧题库或新题库
+        self._courses = MappingProxyType(courses)
+        self.default_course = data.get("defaultCourse") or next(iter(courses))
+        self._mtime = mtime
+        self.reloads += 1
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            try:
+                if os.stat(self.path).st_mtime == self._mtime:
+                    return
+                self._load()
+                logger.info("Reloaded checkpoint question bank", extra={"path": self.path})
+            except (OSError, ValueError, KeyError) as e:
+                # 文件损坏或正在写入时保留旧题库
+                logger.error("Failed to reload checkpoint question bank", extra={"path": self.path, "error": str(e)})
+
+    def course(self, course_id: Optional[str] = None) -> Optional[CompiledCourse]:
+        self._maybe_reload()
+        return self._courses.get(course_id or self.default_course)
+
+    # 获取章节的问题，找不到时返回课程的默认问题
+    def question(self, section_id: str, course_id: Optional[str] = None) -> CompiledResponse:
+        course = self.course(course_id) or self._courses[self.default_course]
+        return course.questions.get(section_id, course.default)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "defaultCourse": self.default_course,
+            "courses": {course_id: len(course.questions) for course_id, course in self._courses.items()},
+            "reloads": self.reloads,
+        }
@@ -0,0 +1,94 @@
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from env import env_int
+from prompt_builder import section_segment
+
+
+# 按内容寻址的章节：哈希由章节ID、内容和检查点问题决定，内容变化时哈希也会变化
+def section_hash(section_id: str, section_content: str, checkpoint_question: Optional[Dict[str, Any]]) -> str:
+    payload = json.dumps(
+        {"sectionId": section_id, "sectionContent": section_content, "checkpointQuestion": checkpoint_question},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class SectionEntry:
+    __slots__ = ("section_id", "content", "checkpoint_question", "fragment", "size")
+
+    def __init__(self, section_id: str, content: str, checkpoint_question: Optional[Dict[str, Any]]):
+        self.section_id = section_id
+        self.content = content
+        self.checkpoint_question = checkpoint_question
+        # 渲染好的章节层提示片段，第一次使用时生成
+        self.fragment: Optional[str] = None
+        self.size = len(content.encode("utf-8"))
+
+
+# 有界的章节注册表（LRU），客户端注册一次章节内容后，聊天请求只需要携带哈希
+class SectionRegistry:
+    def __init__(self, max_entries: int = 1024, max_content_bytes: int = 256 * 1024):
+        self.max_entries = max_entries
+        self.max_content_bytes = max_content_bytes
+        self._entries: "OrderedDict[str, SectionEntry]" = OrderedDict()
+        self.registrations = 0
+        self.hits = 0
+        self.misses = 0
+        self.fragment_renders = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls) -> "SectionRegistry":
+        return cls(
+            max_entries=env_int("SECTION_REGISTRY_MAX_ENTRIES", 1024),
+            max_content_bytes=env_int("SECTION_REGISTRY_MAX_CONTENT_BYTES", 256 * 1024),
+        )
+
+    def register(self, section_id: str, content: str, checkpoint_question: Optional[Dict[str, Any]] = None) -> str:
+        key = section_hash(section_id, content, checkpoint_question)
+        self.registrations += 1
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return key
+        self._entries[key] = SectionEntry(section_id, content, checkpoint_question)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return key
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[SectionEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def fragment(self, entry: SectionEntry) -> str:
+        if entry.fragment is None:
+            entry.fragment = section_segment(entry.section_id, entry.content, entry.checkpoint_question)
+            self.fragment_renders += 1
+        return entry.fragment
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "contentBytes": sum(entry.size for entry in self._entries.values()),
+            "registrations": self.registrations,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "fragmentRenders": self.fragment_renders,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,467 @@
+"""可选的多worker启动入口（python main.py 为单进程）：多个worker进程 + 按 sessionId 一致性哈希的路由进程。
+
+    python serve.py                      # SERVER_WORKERS 个worker（默认CPU核数）
+    SERVER_WORKERS=1 python serve.py     # 单进程，不启动路由
+
+每个worker通过unix socket提供 main:app；路由进程监听 HOST:PORT，
+把同一会话的请求总是转发给同一个worker，会话的内存状态（历史、总结、压缩任务）留在一个进程中。
+worker退出后会在同一个socket上重新启动，哈希环不变。
+前端静态资源由路由进程直接从内存索引提供，/api/metrics 由路由进程汇总所有worker的指标；
+请求体和响应体都流式转发，只有会话ID在请求体中的小请求需要先读完请求体。
+路由进程仍是单个Python进程，所有API流量都经过它，是API吞吐的上限（见README中的测量结果）。
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Dict, Any, List, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.websockets import WebSocket, WebSocketClose
+
+try:
+    import websockets
+except ImportError:  # 未安装时路由进程不转发WebSocket
+    websockets = None
+
+from env import env_int
+from logging_setup import setup_logging, shutdown_logging
+from json_codec import json_loads
+from static_assets import StaticAssetIndex
+
+logger = logging.getLogger("autopbl.serve")
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 逐跳头部不转发
+HOP_BY_HOP_HEADERS = frozenset({
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "host",
+})
+
+# 请求体中可能携带会话ID的路径；其余API请求（检查点、统计等）轮流分配
+SESSION_BODY_PATHS = frozenset({
+    "/api/chat", "/api/chat/stream", "/api/chat/new", "/api/summary", "/api/summary/pregenerate", "/api/sections",
+})
+SESSION_PATH_PREFIXES = ("/api/chat/history/",)
+MAX_ROUTING_BODY_BYTES = 1024 * 1024
+# 与uvicorn默认的WebSocket消息大小上限一致
+MAX_WEBSOCKET_MESSAGE_BYTES = 16 * 1024 * 1024
+
+
+def _module_available(name: str) -> bool:
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+# uvloop 和 httptools 是可选依赖，没有安装时使用 asyncio 和 h11
+def event_loop_impl() -> str:
+    return "uvloop" if sys.platform != "win32" and _module_available("uvloop") else "asyncio"
+
+
+def http_impl() -> str:
+    return "httptools" if _module_available("httptools") else "h11"
+
+
+# 一致性哈希环：每个worker在环上有多个虚拟节点，worker数量不变时同一会话总是映射到同一worker
+class HashRing:
+    def __init__(self, nodes: List[int], replicas: int = 128):
+        points: List[Tuple[int, int]] = []
+        for node in nodes:
+            for replica in range(replicas):
+                points.append((self._hash(f"worker-{node}-{replica}"), node))
+        points.sort()
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def node(self, key: str) -> int:
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[index]
+
+
+class WorkerProcess:
+    def __init__(self, index: int, socket_path: str, env: Dict[str, str]):
+        self.index = index
+        self.socket_path = socket_path
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.restarts = 0
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=socket_path),
+            base_url="http://worker",
+            timeout=httpx.Timeout(connect=5.0, read=None, write=30.0, pool=30.0),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=64),
+        )
+        self.requests = 0
+
+    def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--uds", self.socket_path,
+                "--loop", event_loop_impl(),
+                "--http", http_impl(),
+                "--no-access-log",
+                "--timeout-graceful-shutdown", "30",
+            ],
+            cwd=BACKEND_DIR,
+            env=self.env,
+        )
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self) -> None:
+        if self.alive():
+            self.process.send_signal(signal.SIGTERM)
+
+    def wait(self, timeout: float) -> None:
+        if self.process is None:
+            return
+        try:
+            self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+# 路由进程：按 sessionId 把API请求转发到固定的worker，请求体和响应体逐块转发；静态资源和指标直接处理
+class SessionRouter:
+    def __init__(
+        self,
+        workers: List[WorkerProcess],
+        supervise_interval: float = 1.0,
+        socket_dir: Optional[str] = None,
+        static_assets: Optional[StaticAssetIndex] = None,
+    ):
+        self.workers = workers
+        self.static_assets = static_assets or StaticAssetIndex()
+        # 需要在关闭时删除的临时socket目录
+        self.socket_dir = socket_dir
+        self.ring = HashRing([worker.index for worker in workers])
+        self.supervise_interval = supervise_interval
+        self._round_robin = 0
+        self._supervisor: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.static_assets.build)
+        for worker in self.workers:
+            worker.start()
+        await asyncio.gather(*(self._wait_ready(worker) for worker in self.workers))
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info("Workers ready", extra={"workers": len(self.workers), "loop": event_loop_impl(), "http": http_impl()})
+
+    async def close(self) -> None:
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for worker in self.workers:
+            worker.stop()
+        await asyncio.to_thread(lambda: [worker.wait(35) for worker in self.workers])
+        for worker in self.workers:
+            await worker.client.aclose()
+        # uvicorn 收到信号退出时会重新发出该信号，main() 中的 finally 不一定执行，所以在这里清理
+        if self.socket_dir:
+            shutil.rmtree(self.socket_dir, ignore_errors=True)
+        shutdown_logging()
+
+    async def _wait_ready(self, worker: WorkerProcess, timeout: float = 60.0) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not worker.alive():
+                raise RuntimeError(f"worker {worker.index} exited during startup")
+            try:
+                await worker.client.get("/api/health")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        raise RuntimeError(f"worker {worker.index} did not become ready")
+
+    # 重新启动退出的worker（使用同一个socket，哈希环不变）
+    async def _supervise(self) -> None:
+        while True:
+            await asyncio.sleep(self.supervise_interval)
+            for worker in self.workers:
+                if not worker.alive():
+                    code = worker.process.returncode if worker.process else None
+                    logger.error("Worker exited, restarting", extra={"worker": worker.index, "exit_code": code})
+                    worker.restarts += 1
+                    worker.start()
+
+    def _pick(self, session_id: Optional[str]) -> WorkerProcess:
+        if session_id:
+            return self.workers[self.ring.node(session_id)]
+        self._round_robin = (self._round_robin + 1) % len(self.workers)
+        return self.workers[self._round_robin]
+
+    # 路径或查询参数中的会话ID
+    @staticmethod
+    def session_id(path: str, query: str) -> Optional[str]:
+        for prefix in SESSION_PATH_PREFIXES:
+            if path.startswith(prefix):
+                return path[len(prefix):].split("/", 1)[0] or None
+        values = parse_qs(query).get("sessionId")
+        return values[0] if values else None
+
+    # JSON请求体中的会话ID
+    @staticmethod
+    def body_session_id(body: bytes) -> Optional[str]:
+        try:
+            data = json_loads(body)
+        except ValueError:
+            return None
+        if isinstance(data, dict) and isinstance(data.get("sessionId"), str):
+            return data["sessionId"]
+        return None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] == "websocket":
+            await self._proxy_websocket(scope, receive, send)
+            return
+
+        request = Request(scope, receive)
+        path = request.url.path
+        if path == "/api/router/stats":
+            response = Response(json.dumps(self.stats()), media_type="application/json")
+        elif path == "/api/metrics":
+            response = await self.merged_metrics(request.url.query)
+        elif not path.startswith("/api/") and request.method == "GET":
+            response = self.static_assets.serve(path.lstrip("/"), request.headers)
+            if response is None:
+                response = JSONResponse({"detail": "Frontend is not built"}, status_code=404)
+        else:
+            response = await self._proxy(request)
+        await response(scope, receive, send)
+
+    async def _proxy(self, request: Request) -> Response:
+        path = request.url.path
+        session_id = self.session_id(path, request.url.query)
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+        content = request.stream() if has_body else None
+        # 会话ID只在请求体中时需要先读完请求体；大请求体（或没有声明长度的请求体）不解析，轮流分配
+        if session_id is None and path in SESSION_BODY_PATHS and has_body:
+            length = request.headers.get("content-length", "")
+            if length.isdigit() and int(length) <= MAX_ROUTING_BODY_BYTES:
+                content = await request.body()
+                session_id = self.body_session_id(content)
+        worker = self._pick(session_id)
+        worker.requests += 1
+
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+        if request.client:
+            headers.append(("x-forwarded-for", request.client.host))
+        upstream_request = worker.client.build_request(
+            request.method,
+            path,
+            params=request.url.query,
+            headers=headers,
+            content=content,
+        )
+        try:
+            upstream = await worker.client.send(upstream_request, stream=True)
+        except httpx.TransportError as e:
+            logger.error("Worker unavailable", extra={"worker": worker.index, "error": str(e)})
+            return Response("Worker unavailable", status_code=502)
+
+        response_headers = {
+            k: v for k, v in upstream.headers.items()
+            if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() not in ("date", "server")
+        }
+        # 保留worker的压缩和Content-Length，原样转发字节
+        return StreamingResponse(
+            upstream.aiter_raw(),
+            status_code=upstream.status_code,
+            headers=response_headers,
+            background=BackgroundTask(upstream.aclose),
+        )
+
+    # 汇总所有worker的指标：JSON按worker列出快照，Prometheus格式给每条样本加上 worker 标签
+    async def merged_metrics(self, query: str) -> Response:
+        results = await asyncio.gather(
+            *(worker.client.get("/api/metrics", params=query) for worker in self.workers), return_exceptions=True
+        )
+        prometheus = parse_qs(query).get("format") == ["prometheus"]
+        snapshots = []
+        families: Dict[str, List[str]] = {}
+        for worker, result in zip(self.workers, results):
+            if isinstance(result, BaseException) or result.is_error:
+                logger.error("Worker metrics unavailable", extra={"worker": worker.index})
+                snapshots.append({"worker": worker.index, "error": "Worker unavailable"})
+                continue
+            if not prometheus:
+                snapshots.append({"worker": worker.index, **result.json()})
+                continue
+            # 同一指标的样本必须连续输出，按 TYPE 行分组
+            samples: Optional[List[str]] = None
+            for line in result.text.splitlines():
+                if line.startswith("# TYPE "):
+                    samples = families.setdefault(line, [])
+                elif line and samples is not None:
+                    samples.append(with_label(line, "worker", str(worker.index)))
+        if prometheus:
+            lines = [line for type_line, samples in families.items() for line in (type_line, *samples)]
+            return Response("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+        return Response(json.dumps({"workers": snapshots}), media_type="application/json")
+
+    # WebSocket按查询参数中的 sessionId 路由，之后在客户端和worker之间双向转发帧
+    async def _proxy_websocket(self, scope, receive, send) -> None:
+        if websockets is None:
+            await WebSocketClose(code=1003)(scope, receive, send)
+            return
+        websocket = WebSocket(scope, receive, send)
+        worker = self._pick(websocket.query_params.get("sessionId"))
+        worker.requests += 1
+        query = scope.get("query_string", b"").decode("latin-1")
+        headers = {"x-forwarded-for": websocket.client.host} if websocket.client else {}
+        try:
+            upstream = await websockets.unix_connect(
+                worker.socket_path,
+                f"ws://worker{scope['path']}" + (f"?{query}" if query else ""),
+                extra_headers=headers,
+                max_size=MAX_WEBSOCKET_MESSAGE_BYTES,
+                # 进程间连接不需要心跳，应用层心跳由worker发给客户端
+                ping_interval=None,
+            )
+        except (OSError, websockets.InvalidHandshake) as e:
+            logger.error("Worker unavailable", extra={"worker": worker.index, "error": str(e)})
+            await websocket.close(code=1011)
+            return
+        await websocket.accept()
+
+        async def client_to_worker():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    await upstream.close(code=message.get("code", 1000))
+                    return
+                data = message.get("text")
+                await upstream.send(data if data is not None else message.get("bytes", b""))
+
+        async def worker_to_client():
+            try:
+                async for data in upstream:
+                    if isinstance(data, str):
+                        await websocket.send_text(data)
+                    else:
+                        await websocket.send_bytes(data)
+            except websockets.ConnectionClosed:
+                pass
+            # 1005/1006 只表示没有收到关闭帧，不能再发送给客户端
+            code = upstream.close_code
+            await websocket.close(code=code if code and code not in (1005, 1006) else 1011)
+
+        tasks = [asyncio.create_task(client_to_worker()), asyncio.create_task(worker_to_client())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.start()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid if worker.process else None,
+                    "alive": worker.alive(),
+                    "restarts": worker.restarts,
+                    "requests": worker.requests,
+                }
+                for worker in self.workers
+            ],
+            "loop": event_loop_impl(),
+            "http": http_impl(),
+        }
+
+
+# 给Prometheus文本格式的一条样本加上标签
+def with_label(sample: str, name: str, value: str) -> str:
+    series, _, number = sample.rpartition(" ")
+    label = f'{name}="{value}"'
+    if series.endswith("}"):
+        return f"{series[:-1]},{label}}} {number}"
+    return f"{series}{{{label}}} {number}"
+
+
+def worker_env(index: int, base_env: Dict[str, str]) -> Dict[str, str]:
+    env = {**base_env, "SERVER_WORKER_ID": str(index)}
+    # 章节总结缓存和答案缓存文件按worker区分，避免多个进程同时覆盖同一个文件
+    for name in ("SUMMARY_CACHE_PATH", "ANSWER_CACHE_PATH"):
+        if env.get(name):
+            root, ext = os.path.splitext(env[name])
+            env[name] = f"{root}.worker-{index}{ext or '.json'}"
+    return env
+
+
+def main() -> None:
+    load_dotenv()
+    setup_logging()
+    host = os.getenv("HOST", "0.0.0.0")
+    port = env_int("PORT", 8000)
+    workers = env_int("SERVER_WORKERS", 0) or os.cpu_count() or 1
+
+    if workers == 1:
+        shutdown_logging()
+        uvicorn.run("main:app", host=host, port=port, loop=event_loop_impl(), http=http_impl(),
+                    reload=False, access_log=False)
+        return
+
+    temporary = not os.getenv("SERVER_SOCKET_DIR")
+    socket_dir = os.getenv("SERVER_SOCKET_DIR") or tempfile.mkdtemp(prefix="autopbl-workers-")
+    os.makedirs(socket_dir, exist_ok=True)
+    processes = [
+        WorkerProcess(i, os.path.join(socket_dir, f"worker-{i}.sock"), worker_env(i, dict(os.environ)))
+        for i in range(workers)
+    ]
+    # 与worker相同，相对的前端目录以后端目录为基准
+    static_assets = StaticAssetIndex.from_env()
+    static_assets.root = os.path.join(BACKEND_DIR, static_assets.root)
+    router = SessionRouter(processes, socket_dir=socket_dir if temporary else None, static_assets=static_assets)
+    uvicorn.run(router, host=host, port=port, loop=event_loop_impl(), http=http_impl(),
+                access_log=False, lifespan="on", log_config=None)
+
+
+if __name__ == "__main__":
+    main()
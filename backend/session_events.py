@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from typing import Dict, Any, Set
+
+logger = logging.getLogger(__name__)
+
+
+# 会话事件的发布/订阅：后台任务（如章节总结）完成后把事件推送给该会话已连接的WebSocket
+class SessionEventHub:
+    def __init__(self, max_pending: int = 100):
+        # 每个订阅者最多积压的事件数，客户端读取太慢时丢弃新事件而不是无限占用内存
+        self.max_pending = max_pending
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, session_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_pending)
+        self._subscribers.setdefault(session_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, session_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[session_id]
+
+    # 返回收到事件的订阅者数；没有连接时事件直接丢弃（客户端可以通过历史接口补齐）
+    def publish(self, session_id: str, event: Dict[str, Any]) -> int:
+        self.published += 1
+        delivered = 0
+        for queue in self._subscribers.get(session_id, ()):
+            try:
+                queue.put_nowait(event)
+                delivered += 1
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logger.warning("Dropped session event", extra={"session_id": session_id, "event": event.get("type")})
+        self.delivered += delivered
+        return delivered
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._subscribers),
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
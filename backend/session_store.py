@@ -0,0 +1,707 @@
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
+
+from env import env_float, env_int
+from tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# 紧凑的单条消息表示（元组），代替 {"role": ..., "content": ...} 字典；
+# tokens 是写入时估算的内容token数，每次构建提示时不必重新计算（旧数据库中的消息为None）
+class StoredMessage(NamedTuple):
+    seq: int
+    role: str
+    content: str
+    tokens: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+# 会话存储配置，从环境变量读取
+class SessionStoreConfig:
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        max_messages: int = 200,
+        ttl_seconds: float = 24 * 3600,
+        sweep_interval: float = 60.0,
+    ):
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+
+    @classmethod
+    def from_env(cls) -> "SessionStoreConfig":
+        return cls(
+            max_sessions=env_int("SESSION_MAX_SESSIONS", 10000),
+            max_messages=env_int("SESSION_MAX_MESSAGES", 200),
+            ttl_seconds=env_float("SESSION_TTL_SECONDS", 24 * 3600),
+            sweep_interval=env_float("SESSION_SWEEP_INTERVAL", 60.0),
+        )
+
+
+# 会话存储接口：会话历史和章节总结都通过它读写；缺少实现的后端在创建时就会报错
+class SessionStore(ABC):
+    def __init__(self, config: Optional[SessionStoreConfig] = None):
+        self.config = config or SessionStoreConfig.from_env()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    @abstractmethod
+    async def append(self, session_id: str, role: str, content: str) -> StoredMessage:
+        ...
+
+    @abstractmethod
+    async def get_messages(self, session_id: str) -> List[StoredMessage]:
+        ...
+
+    @abstractmethod
+    async def recent_messages(self, session_id: str, limit: int) -> List[StoredMessage]:
+        ...
+
+    # 返回 seq 大于 after_seq 的消息
+    @abstractmethod
+    async def messages_since(self, session_id: str, after_seq: int) -> List[StoredMessage]:
+        ...
+
+    @abstractmethod
+    async def message_count(self, session_id: str) -> int:
+        ...
+
+    # 历史分页：传入 after_seq 时按seq升序返回之后的最多 limit 条消息，
+    # 否则返回 before_seq 之前（不传时为最新）的最后 limit 条；include_system 为 False 时跳过系统消息（章节总结）
+    @abstractmethod
+    async def page_messages(self, session_id: str, after_seq: Optional[int], before_seq: Optional[int],
+                            limit: int, include_system: bool = True) -> List[StoredMessage]:
+        ...
+
+    # 历史版本 (消息数, 最小seq, 最大seq, 清空位置)：追加、清空和截断都会改变它，用于生成ETag。
+    # 清空位置是最近一次清空时的最大seq（从未清空为0），客户端的同步游标不超过它时说明本地历史已失效
+    @abstractmethod
+    async def history_version(self, session_id: str) -> Tuple[int, int, int, int]:
+        ...
+
+    @abstractmethod
+    async def clear(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get_summary(self, session_id: str, section_id: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    async def set_summary(self, session_id: str, section_id: str, summary: str) -> None:
+        ...
+
+    # 对话压缩状态：滚动总结和它覆盖到的最后一条消息的seq
+    @abstractmethod
+    async def get_compaction(self, session_id: str) -> Optional[Tuple[str, int]]:
+        ...
+
+    @abstractmethod
+    async def set_compaction(self, session_id: str, summary: str, upto_seq: int) -> None:
+        ...
+
+    # 清理空闲超过TTL的会话，返回清理的数量
+    @abstractmethod
+    async def sweep(self) -> int:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        ...
+
+    async def start(self) -> None:
+        if self._sweeper is None and self.config.ttl_seconds > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.sweep_interval)
+            try:
+                removed = await self.sweep()
+                if removed:
+                    logger.info("Session sweeper evicted idle sessions", extra={"evicted": removed})
+            except Exception:
+                logger.exception("Session sweeper error")
+
+
+class _Session:
+    __slots__ = ("messages", "summaries", "compaction", "last_active", "next_seq", "cleared_seq")
+
+    def __init__(self, max_messages: int):
+        self.messages: deque = deque(maxlen=max_messages if max_messages > 0 else None)
+        self.summaries: Dict[str, str] = {}
+        self.compaction: Optional[Tuple[str, int]] = None
+        self.last_active = time.monotonic()
+        self.next_seq = 1
+        self.cleared_seq = 0
+
+
+# 进程内存储：LRU淘汰最久未访问的会话，每个会话的消息数有上限
+class MemorySessionStore(SessionStore):
+    def __init__(self, config: Optional[SessionStoreConfig] = None):
+        super().__init__(config)
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def _get(self, session_id: str, create: bool = False) -> Optional[_Session]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = _Session(self.config.max_messages)
+            self._sessions[session_id] = session
+            # 超过最大会话数时淘汰最久未使用的会话
+            while len(self._sessions) > self.config.max_sessions > 0:
+                self._sessions.popitem(last=False)
+                self.evicted_lru += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_active = time.monotonic()
+        return session
+
+    async def append(self, session_id: str, role: str, content: str) -> StoredMessage:
+        session = self._get(session_id, create=True)
+        message = StoredMessage(session.next_seq, sys.intern(role), content, estimate_tokens(content))
+        session.next_seq += 1
+        session.messages.append(message)
+        return message
+
+    async def get_messages(self, session_id: str) -> List[StoredMessage]:
+        session = self._get(session_id)
+        return list(session.messages) if session else []
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[StoredMessage]:
+        session = self._get(session_id)
+        if session is None:
+            return []
+        messages = session.messages
+        if limit >= len(messages):
+            return list(messages)
+        return [messages[i] for i in range(len(messages) - limit, len(messages))]
+
+    async def messages_since(self, session_id: str, after_seq: int) -> List[StoredMessage]:
+        session = self._get(session_id)
+        if session is None:
+            return []
+        return [message for message in session.messages if message.seq > after_seq]
+
+    async def message_count(self, session_id: str) -> int:
+        session = self._sessions.get(session_id)
+        return len(session.messages) if session else 0
+
+    async def page_messages(self, session_id: str, after_seq: Optional[int], before_seq: Optional[int],
+                            limit: int, include_system: bool = True) -> List[StoredMessage]:
+        session = self._get(session_id)
+        if session is None:
+            return []
+        messages = session.messages
+        selected: List[StoredMessage] = []
+        if after_seq is not None:
+            # 新消息在末尾，从后向前找到起点，增量同步只遍历新增的消息
+            start = len(messages)
+            while start > 0 and messages[start - 1].seq > after_seq:
+                start -= 1
+            for message in islice(messages, start, None):
+                if include_system or message.role != "system":
+                    selected.append(message)
+                    if len(selected) >= limit:
+                        break
+            return selected
+        for message in reversed(messages):
+            if before_seq is not None and message.seq >= before_seq:
+                continue
+            if include_system or message.role != "system":
+                selected.append(message)
+                if len(selected) >= limit:
+                    break
+        selected.reverse()
+        return selected
+
+    async def history_version(self, session_id: str) -> Tuple[int, int, int, int]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return 0, 0, 0, 0
+        if not session.messages:
+            return 0, 0, 0, session.cleared_seq
+        return len(session.messages), session.messages[0].seq, session.messages[-1].seq, session.cleared_seq
+
+    async def clear(self, session_id: str) -> None:
+        session = self._get(session_id)
+        if session is not None:
+            session.messages.clear()
+            session.compaction = None
+            session.cleared_seq = session.next_seq - 1
+
+    async def get_summary(self, session_id: str, section_id: str) -> Optional[str]:
+        session = self._get(session_id)
+        return session.summaries.get(section_id) if session else None
+
+    async def set_summary(self, session_id: str, section_id: str, summary: str) -> None:
+        session = self._get(session_id, create=True)
+        session.summaries[section_id] = summary
+
+    async def get_compaction(self, session_id: str) -> Optional[Tuple[str, int]]:
+        session = self._get(session_id)
+        return session.compaction if session else None
+
+    async def set_compaction(self, session_id: str, summary: str, upto_seq: int) -> None:
+        session = self._get(session_id, create=True)
+        session.compaction = (summary, upto_seq)
+
+    async def sweep(self) -> int:
+        deadline = time.monotonic() - self.config.ttl_seconds
+        removed = 0
+        # OrderedDict按访问时间排序，从最旧的开始检查
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_active > deadline:
+                break
+            del self._sessions[session_id]
+            removed += 1
+        self.evicted_ttl += removed
+        return removed
+
+    # 估算存储占用的内存（字节）
+    def memory_usage(self) -> int:
+        total = sys.getsizeof(self._sessions)
+        for session_id, session in self._sessions.items():
+            total += sys.getsizeof(session_id) + sys.getsizeof(session)
+            total += sys.getsizeof(session.messages) + sys.getsizeof(session.summaries)
+            for message in session.messages:
+                total += sys.getsizeof(message) + sys.getsizeof(message.content)
+            for section_id, summary in session.summaries.items():
+                total += sys.getsizeof(section_id) + sys.getsizeof(summary)
+            if session.compaction is not None:
+                total += sys.getsizeof(session.compaction) + sys.getsizeof(session.compaction[0])
+        return total
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "messages": sum(len(s.messages) for s in self._sessions.values()),
+            "memoryBytes": self.memory_usage(),
+            "maxSessions": self.config.max_sessions,
+            "maxMessagesPerSession": self.config.max_messages,
+            "ttlSeconds": self.config.ttl_seconds,
+            "evictedLru": self.evicted_lru,
+            "evictedTtl": self.evicted_ttl,
+        }
+
+
+# 默认的数据库文件放在 backend 目录下，与启动时的工作目录无关
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BACKEND_DIR, "sessions.db")
+
+# SQLite整数的最大值，用作"没有上界"的seq
+_MAX_SEQ = 2 ** 63 - 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL,
+    next_seq INTEGER NOT NULL DEFAULT 1,
+    cleared_seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    session_id TEXT NOT NULL,
+    section_id TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (session_id, section_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS compactions (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    upto_seq INTEGER NOT NULL
+);
+"""
+
+
+# 删除一组会话的全部数据（消息、总结、压缩状态），返回删除的会话数
+def _delete_sessions(conn: sqlite3.Connection, where: str, params: tuple) -> int:
+    ids = [row[0] for row in conn.execute(f"SELECT session_id FROM sessions WHERE {where}", params)]
+    for session_id in ids:
+        conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM compactions WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+    return len(ids)
+
+
+# 更新会话的活动时间，会话不存在时创建；创建前已达到最大会话数时先淘汰最久未活动的会话
+# （与内存存储一致，上限在写入时就生效，不依赖定期清理）。返回淘汰的会话数
+def _touch_session(conn: sqlite3.Connection, session_id: str, now: float, max_sessions: int) -> int:
+    if conn.execute("UPDATE sessions SET last_active = ? WHERE session_id = ?", (now, session_id)).rowcount:
+        return 0
+    evicted = 0
+    if max_sessions > 0:
+        overflow = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - max_sessions + 1
+        if overflow > 0:
+            evicted = _delete_sessions(
+                conn,
+                "session_id IN (SELECT session_id FROM sessions ORDER BY last_active LIMIT ?)",
+                (overflow,),
+            )
+    conn.execute("INSERT INTO sessions (session_id, last_active, next_seq) VALUES (?, ?, 1)", (session_id, now))
+    return evicted
+
+
+# 持久化存储：SQLite WAL模式。写操作由单独的写线程批量提交（group commit），
+# 读操作在线程池中执行，事件循环不会阻塞在磁盘IO上。
+# 多个uvicorn worker可以共享同一个数据库文件。
+class SQLiteSessionStore(SessionStore):
+    def __init__(
+        self,
+        path: str = DEFAULT_DB_PATH,
+        config: Optional[SessionStoreConfig] = None,
+        batch_size: int = 128,
+        busy_timeout: float = 5.0,
+        read_threads: int = 4,
+    ):
+        super().__init__(config)
+        self.path = path
+        self.batch_size = batch_size
+        self.busy_timeout = busy_timeout
+        self.read_threads = read_threads
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._read_connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.batched_writes = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        return conn
+
+    async def start(self) -> None:
+        if self._writer is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = self._connect()
+            conn.executescript(_SCHEMA)
+            # 早期版本创建的数据库没有 tokens 和 cleared_seq 列
+            if "tokens" not in [row[1] for row in conn.execute("PRAGMA table_info(messages)")]:
+                conn.execute("ALTER TABLE messages ADD COLUMN tokens INTEGER")
+            if "cleared_seq" not in [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]:
+                conn.execute("ALTER TABLE sessions ADD COLUMN cleared_seq INTEGER NOT NULL DEFAULT 0")
+            conn.close()
+            self._readers = ThreadPoolExecutor(max_workers=self.read_threads, thread_name_prefix="session-read")
+            self._writer = threading.Thread(target=self._writer_loop, name="session-writer", daemon=True)
+            self._writer.start()
+        await super().start()
+
+    async def close(self) -> None:
+        await super().close()
+        if self._writer is not None:
+            # 写线程会先处理完队列中剩余的写操作再退出
+            self._queue.put(None)
+            await asyncio.to_thread(self._writer.join)
+            self._writer = None
+        if self._readers is not None:
+            self._readers.shutdown(wait=True)
+            self._readers = None
+        with self._lock:
+            for conn in self._read_connections:
+                conn.close()
+            self._read_connections.clear()
+
+    # 写线程：取出队列中所有待处理的写操作，在一个事务中提交
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._run_batch(conn, batch)
+        conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: list) -> None:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            results = [op(conn) for op, _, _ in batch]
+            conn.execute("COMMIT")
+        except Exception as error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            # 批量提交失败时逐个重试，避免一个坏操作拖累同一批的其它请求
+            if len(batch) > 1:
+                for item in batch:
+                    self._run_batch(conn, [item])
+                return
+            _, future, loop = batch[0]
+            loop.call_soon_threadsafe(_resolve, future, None, error)
+            return
+        self.batches += 1
+        self.batched_writes += len(batch)
+        for (_, future, loop), result in zip(batch, results):
+            loop.call_soon_threadsafe(_resolve, future, result, None)
+
+    async def _write(self, op):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((op, future, loop))
+        return await future
+
+    def _reader_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._read_connections.append(conn)
+        return conn
+
+    async def _read(self, query: str, params: tuple) -> list:
+        def run():
+            return self._reader_connection().execute(query, params).fetchall()
+        return await asyncio.get_running_loop().run_in_executor(self._readers, run)
+
+    async def append(self, session_id: str, role: str, content: str) -> StoredMessage:
+        now = time.time()
+        tokens = estimate_tokens(content)
+        max_messages = self.config.max_messages
+        max_sessions = self.config.max_sessions
+
+        def op(conn: sqlite3.Connection) -> StoredMessage:
+            self.evicted_lru += _touch_session(conn, session_id, now, max_sessions)
+            seq = conn.execute(
+                "UPDATE sessions SET next_seq = next_seq + 1 WHERE session_id = ? RETURNING next_seq - 1",
+                (session_id,),
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO messages (session_id, seq, role, content, tokens) VALUES (?, ?, ?, ?, ?)",
+                (session_id, seq, role, content, tokens),
+            )
+            # 超过每个会话的消息上限时删除最旧的消息
+            if max_messages > 0 and seq > max_messages:
+                conn.execute(
+                    "DELETE FROM messages WHERE session_id = ? AND seq <= ?",
+                    (session_id, seq - max_messages),
+                )
+            return StoredMessage(seq, role, content, tokens)
+
+        return await self._write(op)
+
+    async def get_messages(self, session_id: str) -> List[StoredMessage]:
+        rows = await self._read(
+            "SELECT seq, role, content, tokens FROM messages WHERE session_id = ? ORDER BY seq",
+            (session_id,),
+        )
+        return [StoredMessage(*row) for row in rows]
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[StoredMessage]:
+        rows = await self._read(
+            "SELECT seq, role, content, tokens FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, limit),
+        )
+        return [StoredMessage(*row) for row in reversed(rows)]
+
+    async def messages_since(self, session_id: str, after_seq: int) -> List[StoredMessage]:
+        rows = await self._read(
+            "SELECT seq, role, content, tokens FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+            (session_id, after_seq),
+        )
+        return [StoredMessage(*row) for row in rows]
+
+    async def message_count(self, session_id: str) -> int:
+        rows = await self._read("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,))
+        return rows[0][0]
+
+    async def page_messages(self, session_id: str, after_seq: Optional[int], before_seq: Optional[int],
+                            limit: int, include_system: bool = True) -> List[StoredMessage]:
+        role_filter = "" if include_system else " AND role != 'system'"
+        if after_seq is not None:
+            rows = await self._read(
+                f"SELECT seq, role, content, tokens FROM messages WHERE session_id = ? AND seq > ?{role_filter} ORDER BY seq LIMIT ?",
+                (session_id, after_seq, limit),
+            )
+            return [StoredMessage(*row) for row in rows]
+        rows = await self._read(
+            f"SELECT seq, role, content, tokens FROM messages WHERE session_id = ? AND seq < ?{role_filter} ORDER BY seq DESC LIMIT ?",
+            (session_id, before_seq if before_seq is not None else _MAX_SEQ, limit),
+        )
+        return [StoredMessage(*row) for row in reversed(rows)]
+
+    async def history_version(self, session_id: str) -> Tuple[int, int, int, int]:
+        rows = await self._read(
+            "SELECT COUNT(*), COALESCE(MIN(seq), 0), COALESCE(MAX(seq), 0), "
+            "COALESCE((SELECT cleared_seq FROM sessions WHERE session_id = ?), 0) FROM messages WHERE session_id = ?",
+            (session_id, session_id),
+        )
+        return tuple(rows[0])
+
+    async def clear(self, session_id: str) -> None:
+        now = time.time()
+
+        def op(conn: sqlite3.Connection) -> None:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM compactions WHERE session_id = ?", (session_id,))
+            conn.execute(
+                "UPDATE sessions SET last_active = ?, cleared_seq = next_seq - 1 WHERE session_id = ?",
+                (now, session_id),
+            )
+
+        await self._write(op)
+
+    async def get_summary(self, session_id: str, section_id: str) -> Optional[str]:
+        rows = await self._read(
+            "SELECT summary FROM summaries WHERE session_id = ? AND section_id = ?",
+            (session_id, section_id),
+        )
+        return rows[0][0] if rows else None
+
+    async def set_summary(self, session_id: str, section_id: str, summary: str) -> None:
+        now = time.time()
+        max_sessions = self.config.max_sessions
+
+        def op(conn: sqlite3.Connection) -> None:
+            self.evicted_lru += _touch_session(conn, session_id, now, max_sessions)
+            conn.execute(
+                "INSERT INTO summaries (session_id, section_id, summary) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id, section_id) DO UPDATE SET summary = excluded.summary",
+                (session_id, section_id, summary),
+            )
+
+        await self._write(op)
+
+    async def get_compaction(self, session_id: str) -> Optional[Tuple[str, int]]:
+        rows = await self._read(
+            "SELECT summary, upto_seq FROM compactions WHERE session_id = ?",
+            (session_id,),
+        )
+        return (rows[0][0], rows[0][1]) if rows else None
+
+    async def set_compaction(self, session_id: str, summary: str, upto_seq: int) -> None:
+        def op(conn: sqlite3.Connection) -> None:
+            # 多个worker可能同时压缩同一会话，只接受覆盖范围更新的结果
+            conn.execute(
+                "INSERT INTO compactions (session_id, summary, upto_seq) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, upto_seq = excluded.upto_seq "
+                "WHERE excluded.upto_seq > compactions.upto_seq",
+                (session_id, summary, upto_seq),
+            )
+
+        await self._write(op)
+
+    async def sweep(self) -> int:
+        deadline = time.time() - self.config.ttl_seconds
+        max_sessions = self.config.max_sessions
+
+        def op(conn: sqlite3.Connection):
+            expired = _delete_sessions(conn, "last_active < ?", (deadline,))
+            overflow = 0
+            if max_sessions > 0:
+                # 写入时已经限制了会话数；这里处理配置的上限被调低等情况
+                overflow = _delete_sessions(
+                    conn,
+                    "session_id IN (SELECT session_id FROM sessions ORDER BY last_active DESC LIMIT -1 OFFSET ?)",
+                    (max_sessions,),
+                )
+            return expired, overflow
+
+        expired, overflow = await self._write(op)
+        self.evicted_ttl += expired
+        self.evicted_lru += overflow
+        return expired + overflow
+
+    async def stats(self) -> Dict[str, Any]:
+        sessions = (await self._read("SELECT COUNT(*) FROM sessions", ()))[0][0]
+        messages = (await self._read("SELECT COUNT(*) FROM messages", ()))[0][0]
+        db_bytes = 0
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                db_bytes += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": sessions,
+            "messages": messages,
+            "diskBytes": db_bytes,
+            "pendingWrites": self._queue.qsize(),
+            "batches": self.batches,
+            "avgBatchSize": round(self.batched_writes / self.batches, 2) if self.batches else 0,
+            "maxSessions": self.config.max_sessions,
+            "maxMessagesPerSession": self.config.max_messages,
+            "ttlSeconds": self.config.ttl_seconds,
+            "evictedLru": self.evicted_lru,
+            "evictedTtl": self.evicted_ttl,
+        }
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]) -> None:
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+# 根据 SESSION_BACKEND 环境变量创建会话存储
+def create_session_store() -> SessionStore:
+    backend = os.getenv("SESSION_BACKEND", "sqlite").lower()
+    if backend == "memory":
+        return MemorySessionStore()
+    if backend == "sqlite":
+        # 相对路径按 backend 目录解析
+        return SQLiteSessionStore(
+            path=os.path.join(BACKEND_DIR, os.getenv("SESSION_DB_PATH") or DEFAULT_DB_PATH),
+            batch_size=env_int("SESSION_DB_BATCH_SIZE", 128),
+            busy_timeout=env_float("SESSION_DB_BUSY_TIMEOUT", 5.0),
+        )
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
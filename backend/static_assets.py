@@ -0,0 +1,187 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from typing import Optional, Dict, Any
+
+from fastapi.responses import Response, FileResponse
+
+from env import env_int
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，没有安装时只提供gzip
+    brotli = None
+
+# Vite 构建产物的文件名带内容哈希，例如 assets/index-B3x9kQ2a.js，可以永久缓存
+_HASHED_ASSET_RE = re.compile(r"(^|/)assets/.+[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "application/wasm",
+    "image/svg+xml",
+)
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+INDEX_CACHE_CONTROL = "no-cache"
+
+# 压缩表示的ETag后缀
+_ETAG_SUFFIXES = {"gzip": "gz", "br": "br"}
+
+
+class StaticAsset:
+    __slots__ = ("path", "file_path", "content_type", "etag", "cache_control", "variants")
+
+    def __init__(self, path: str, file_path: str, content_type: str, etag: str, cache_control: str):
+        self.path = path
+        self.file_path = file_path
+        self.content_type = content_type
+        self.etag = etag
+        self.cache_control = cache_control
+        # {"identity": bytes, "gzip": bytes, "br": bytes}；超过内存上限的大文件为空，从磁盘读取
+        self.variants: Dict[str, bytes] = {}
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    encodings: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name] = quality
+    return encodings
+
+
+# 检查 If-None-Match 是否包含当前ETag；弱比较，压缩中间件改写后的响应带的是弱ETag（W/前缀）
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
+
+# 启动时为前端构建目录建立的内存索引：预压缩的gzip/brotli变体、强ETag和缓存头
+class StaticAssetIndex:
+    def __init__(self, root: str = "dist", compress_min_bytes: int = 1024, max_inline_bytes: int = 8 * 1024 * 1024):
+        self.root = root
+        self.compress_min_bytes = compress_min_bytes
+        self.max_inline_bytes = max_inline_bytes
+        self._assets: Dict[str, StaticAsset] = {}
+        self.index_html: Optional[StaticAsset] = None
+
+    @classmethod
+    def from_env(cls) -> "StaticAssetIndex":
+        return cls(
+            root=os.getenv("FRONTEND_DIST_DIR", "dist"),
+            compress_min_bytes=env_int("STATIC_COMPRESS_MIN_BYTES", 1024),
+            max_inline_bytes=env_int("STATIC_MAX_INLINE_BYTES", 8 * 1024 * 1024),
+        )
+
+    def build(self) -> None:
+        assets: Dict[str, StaticAsset] = {}
+        if os.path.isdir(self.root):
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    file_path = os.path.join(directory, name)
+                    path = os.path.relpath(file_path, self.root).replace(os.sep, "/")
+                    assets[path] = self._load(path, file_path)
+        self._assets = assets
+        self.index_html = assets.get("index.html")
+
+    def _load(self, path: str, file_path: str) -> StaticAsset:
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+
+        if path == "index.html":
+            cache_control = INDEX_CACHE_CONTROL
+        elif _HASHED_ASSET_RE.search(path):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+
+        size = os.path.getsize(file_path)
+        if size > self.max_inline_bytes:
+            # 大文件不放进内存，只计算ETag
+            digest = hashlib.sha256()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            return StaticAsset(path, file_path, content_type, f'"{digest.hexdigest()[:32]}"', cache_control)
+
+        with open(file_path, "rb") as f:
+            body = f.read()
+        asset = StaticAsset(path, file_path, content_type, f'"{hashlib.sha256(body).hexdigest()[:32]}"', cache_control)
+        asset.variants["identity"] = body
+        if len(body) >= self.compress_min_bytes and content_type.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                asset.variants["gzip"] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    asset.variants["br"] = compressed
+        return asset
+
+    # 只在索引中查找，请求路径无法访问构建目录之外的文件
+    def lookup(self, full_path: str) -> Optional[StaticAsset]:
+        if "\x00" in full_path or "\\" in full_path:
+            return None
+        path = posixpath.normpath("/" + full_path).lstrip("/")
+        return self._assets.get(path)
+
+    def respond(self, asset: StaticAsset, request_headers) -> Response:
+        # 先按 Accept-Encoding 选出表示形式；每种编码的字节不同，强ETag也不同（如 "<hash>-gz"）
+        encoding = "identity"
+        if asset.variants:
+            accepted = parse_accept_encoding(request_headers.get("accept-encoding", ""))
+            for candidate in ("br", "gzip"):
+                if candidate in asset.variants and accepted.get(candidate, 0) > 0:
+                    encoding = candidate
+                    break
+        etag = asset.etag if encoding == "identity" else f'{asset.etag[:-1]}-{_ETAG_SUFFIXES[encoding]}"'
+        headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if etag_matches(etag, request_headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+
+        if not asset.variants:
+            return FileResponse(asset.file_path, media_type=asset.content_type, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=asset.variants[encoding], media_type=asset.content_type, headers=headers)
+
+    # 前端页面：找不到的路径返回 index.html（SPA路由）；前端没有构建时返回None
+    def serve(self, full_path: str, request_headers) -> Optional[Response]:
+        asset = self.lookup(full_path) or self.index_html
+        return self.respond(asset, request_headers) if asset is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "root": self.root,
+            "files": len(self._assets),
+            "indexHtml": self.index_html is not None,
+            "brotli": brotli is not None,
+            "inlineBytes": sum(len(a.variants.get("identity", b"")) for a in self._assets.values()),
+            "compressedBytes": sum(
+                len(v) for a in self._assets.values() for k, v in a.variants.items() if k != "identity"
+            ),
+        }
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Awaitable, Callable, Tuple
+
+from env import env_float, env_int
+from persistent_cache import PersistentCache
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    # 合并空白字符，避免仅空格/换行不同的内容产生不同的缓存键
+    return " ".join((text or "").split())
+
+
+# 根据总结提示依赖的输入计算内容寻址的缓存键
+def summary_cache_key(
+    section_id: str,
+    section_content: str,
+    checkpoint_question: Dict[str, Any],
+    user_answer: Optional[str],
+    is_correct: Optional[bool],
+) -> str:
+    options = [
+        [str(option.get("id", "")), _normalize_text(option.get("text", ""))]
+        for option in checkpoint_question.get("options", [])
+    ]
+    normalized = {
+        "sectionId": _normalize_text(section_id),
+        "sectionContent": _normalize_text(section_content),
+        "question": _normalize_text(checkpoint_question.get("question", "")),
+        "options": options,
+        "correctAnswerId": str(checkpoint_question.get("correctAnswerId", "")),
+        # create_summary() 只有在提供了答案时才会使用 isCorrect
+        "userAnswer": _normalize_text(user_answer),
+        "isCorrect": is_correct if user_answer else None,
+    }
+    encoded = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+# 有界、带TTL的总结缓存，并把相同键的并发请求合并为一次上游调用（single-flight）
+class SummaryCache(PersistentCache):
+    cache_name = "summary cache"
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_seconds: float = 7 * 24 * 3600,
+        path: Optional[str] = None,
+        flush_interval: float = 60.0,
+    ):
+        super().__init__(path, flush_interval)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # {key: (expires_at, summary)}，expires_at 使用墙上时间以便持久化
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls) -> "SummaryCache":
+        return cls(
+            max_entries=env_int("SUMMARY_CACHE_MAX_ENTRIES", 2048),
+            ttl_seconds=env_float("SUMMARY_CACHE_TTL_SECONDS", 7 * 24 * 3600),
+            path=os.getenv("SUMMARY_CACHE_PATH") or None,
+            flush_interval=env_float("SUMMARY_CACHE_FLUSH_INTERVAL", 60.0),
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, summary = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self._dirty = True
+            return None
+        self._entries.move_to_end(key)
+        return summary
+
+    def set(self, key: str, summary: str) -> None:
+        self._entries[key] = (time.time() + self.ttl_seconds, summary)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries > 0:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    # 返回 (summary, status)，status 为 "hit"、"coalesced" 或 "miss"
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        summary = self.get(key)
+        if summary is not None:
+            self.hits += 1
+            return summary, "hit"
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future), "coalesced"
+
+        self.misses += 1
+        # 上游调用放在独立任务中执行，发起者断开连接不会取消其它等待者的结果
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task), "miss"
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.set(key, task.result())
+
+    def _snapshot(self) -> list:
+        return [[key, expires_at, summary] for key, (expires_at, summary) in self._entries.items()]
+
+    def _restore(self, entries: list) -> None:
+        now = time.time()
+        for key, expires_at, summary in entries:
+            if expires_at > now:
+                self._entries[key] = (expires_at, summary)
+        while len(self._entries) > self.max_entries > 0:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+            "persistent": bool(self.path),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hitRate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Awaitable, Callable
+
+from env import env_bool, env_float, env_int
+from admission import AdmissionRejected
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+# 一个后台总结任务；factory 返回写入 result 的字典
+class SummaryJob:
+    def __init__(self, job_id: str, dedupe_key: Optional[str], factory: Callable[[], Awaitable[Dict[str, Any]]]):
+        self.id = job_id
+        self.dedupe_key = dedupe_key
+        self.factory = factory
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.error_status: Optional[int] = None
+
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"jobId": self.id, "status": self.status, "createdAt": self.created_at}
+        if self.finished_at is not None:
+            data["finishedAt"] = self.finished_at
+        if self.result is not None:
+            data.update(self.result)
+        if self.error is not None:
+            data["error"] = self.error
+            data["errorStatus"] = self.error_status
+        return data
+
+
+# 章节总结的后台任务队列：提交后立即返回任务ID，固定数量的worker协程按顺序执行，
+# 队列有上限，完成的任务保留一段时间供客户端查询
+class SummaryJobQueue:
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue: int = 256,
+        ttl_seconds: float = 600.0,
+        max_jobs: int = 10000,
+        pregenerate: bool = False,
+    ):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        # 章节首次打开时预先生成与答案无关的章节总结
+        self.pregenerate = pregenerate
+        self._queue: "asyncio.Queue[SummaryJob]" = asyncio.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, SummaryJob]" = OrderedDict()
+        # 相同输入的任务在未完成或成功时直接复用，不重复入队
+        self._by_key: Dict[str, str] = {}
+        self._tasks: list = []
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls) -> "SummaryJobQueue":
+        return cls(
+            workers=env_int("SUMMARY_JOB_WORKERS", 4),
+            max_queue=env_int("SUMMARY_JOB_MAX_QUEUE", 256),
+            ttl_seconds=env_float("SUMMARY_JOB_TTL_SECONDS", 600.0),
+            max_jobs=env_int("SUMMARY_JOB_MAX_JOBS", 10000),
+            pregenerate=env_bool("SUMMARY_PREGENERATE", False),
+        )
+
+    async def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(self.workers, 1))]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # 提交任务；dedupe_key 相同且仍在进行或已成功的任务直接返回，队列满时返回503
+    def submit(self, factory: Callable[[], Awaitable[Dict[str, Any]]], dedupe_key: Optional[str] = None) -> SummaryJob:
+        self._prune()
+        if dedupe_key is not None:
+            existing = self._jobs.get(self._by_key.get(dedupe_key, ""))
+            if existing is not None and existing.status != FAILED:
+                self.deduplicated += 1
+                return existing
+
+        job = SummaryJob(uuid.uuid4().hex, dedupe_key, factory)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            metrics.inc("summary_jobs_total", {"status": "rejected"})
+            raise AdmissionRejected(503, "Summary queue is full, please retry later", 5)
+        self._jobs[job.id] = job
+        if dedupe_key is not None:
+            self._by_key[dedupe_key] = job.id
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[SummaryJob]:
+        self._prune()
+        return self._jobs.get(job_id)
+
+    # 删除过期的已完成任务；任务总数超过上限时从最早的已完成任务开始删除
+    def _prune(self) -> None:
+        now = time.time()
+        overflow = len(self._jobs) - self.max_jobs
+        for job_id in list(self._jobs):
+            job = self._jobs[job_id]
+            # 任务按创建时间排列，之后创建的任务不可能已经过期
+            if overflow <= 0 and now - job.created_at <= self.ttl_seconds:
+                break
+            if not job.finished():
+                continue
+            if overflow > 0 or now - job.finished_at > self.ttl_seconds:
+                self._remove(job)
+                overflow -= 1
+
+    def _remove(self, job: SummaryJob) -> None:
+        self._jobs.pop(job.id, None)
+        if job.dedupe_key is not None and self._by_key.get(job.dedupe_key) == job.id:
+            del self._by_key[job.dedupe_key]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: SummaryJob) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        metrics.observe("summary_job_wait_seconds", job.started_at - job.created_at)
+        try:
+            job.result = await job.factory()
+            job.status = DONE
+            self.completed += 1
+        except asyncio.CancelledError:
+            job.status = FAILED
+            job.error = "Cancelled"
+            raise
+        except Exception as e:
+            job.status = FAILED
+            job.error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            # 准入拒绝和HTTPException带 status_code，上游错误带 response
+            response = getattr(e, "response", None)
+            job.error_status = getattr(e, "status_code", None) or getattr(response, "status_code", None) or 500
+            self.failed += 1
+            logger.warning("Summary job failed", extra={"job_id": job.id, "error": job.error})
+        finally:
+            job.finished_at = time.time()
+            job.factory = None
+            metrics.observe("summary_job_duration_seconds", job.finished_at - job.started_at)
+            metrics.inc("summary_jobs_total", {"status": job.status})
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {
+            "workers": self.workers,
+            "maxQueue": self.max_queue,
+            "ttlSeconds": self.ttl_seconds,
+            "pregenerate": self.pregenerate,
+            "queueDepth": self._queue.qsize(),
+            "jobs": counts,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import os
+import uuid
+
+import httpx
+import pytest
+
+# 必须在导入 main 之前设置：API 测试使用内存会话存储
+os.environ.setdefault("SESSION_BACKEND", "memory")
+
+import main  # noqa: E402
+from upstream_pool import UpstreamEndpoint, UpstreamPool  # noqa: E402
+
+
+# 在测试客户端上运行 steps(client)，返回它的结果
+@pytest.fixture
+def api():
+    def run(steps):
+        async def scenario():
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await steps(client)
+
+        return asyncio.run(scenario())
+
+    return run
+
+
+@pytest.fixture
+def session_id() -> str:
+    return f"test-{uuid.uuid4().hex}"
+
+
+# 假的上游：记录收到的请求体，按 reply(body) 的返回值回复（默认回复固定文本）
+class FakeUpstream:
+    def __init__(self):
+        self.requests = []
+        self.reply = lambda body: httpx.Response(200, json={"choices": [{"message": {"content": "fake answer"}}]})
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body)
+        return self.reply(body)
+
+
+@pytest.fixture
+def upstream(monkeypatch) -> FakeUpstream:
+    fake = FakeUpstream()
+    monkeypatch.setattr(main.upstream_client, "pool",
+                        UpstreamPool([UpstreamEndpoint("test", "http://upstream.test/v1/chat/completions", "key")]))
+    monkeypatch.setattr(main.upstream_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(fake.handle)))
+    return fake
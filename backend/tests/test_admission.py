@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_SUMMARY
+
+
+async def settle() -> None:
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_admits_immediately_below_limit_and_release_is_idempotent():
+    async def scenario():
+        controller = AdmissionController(max_inflight=2, max_queue=4, max_wait=1)
+        first = await controller.acquire(PRIORITY_CHAT, "a")
+        second = await controller.acquire(PRIORITY_CHAT, "b")
+        inflight = controller.stats()["inflight"]
+        first.release()
+        first.release()
+        second.release()
+        return inflight, controller.stats()
+
+    inflight, stats = asyncio.run(scenario())
+    assert inflight == 2
+    assert stats["inflight"] == 0
+    assert stats["activeSessions"] == 0
+    assert stats["admitted"] == 2
+
+
+def test_release_hands_the_slot_to_the_next_waiter():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=4, max_wait=1)
+        holder = await controller.acquire(PRIORITY_CHAT, "a")
+        waiter = asyncio.create_task(controller.acquire(PRIORITY_CHAT, "b"))
+        await settle()
+        queued = (controller.stats()["waiting"]["chat"], waiter.done())
+        holder.release()
+        ticket = await waiter
+        inflight = controller.stats()["inflight"]
+        ticket.release()
+        return queued, inflight, controller.stats()
+
+    queued, inflight, stats = asyncio.run(scenario())
+    assert queued == (1, False)
+    assert inflight == 1
+    assert stats["inflight"] == 0
+    assert stats["queued"] == 1
+
+
+def test_waiters_are_admitted_by_priority():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=4, max_wait=1)
+        holder = await controller.acquire(PRIORITY_CHAT, "a")
+        order = []
+
+        async def wait(priority, session_id):
+            ticket = await controller.acquire(priority, session_id)
+            order.append(priority)
+            await asyncio.sleep(0)
+            ticket.release()
+
+        tasks = [
+            asyncio.create_task(wait(PRIORITY_BACKGROUND, None)),
+            asyncio.create_task(wait(PRIORITY_CHAT, "b")),
+            asyncio.create_task(wait(PRIORITY_SUMMARY, None)),
+        ]
+        await settle()
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [PRIORITY_SUMMARY, PRIORITY_CHAT, PRIORITY_BACKGROUND]
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=1, max_wait=1)
+        holder = await controller.acquire(PRIORITY_CHAT, "a")
+        waiter = asyncio.create_task(controller.acquire(PRIORITY_CHAT, "b"))
+        await settle()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(PRIORITY_CHAT, "c")
+        holder.release()
+        (await waiter).release()
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert rejected.retry_after >= 1
+    assert stats["rejectedQueueFull"] == 1
+    # 被拒绝的会话不能一直占着会话标记
+    assert stats["activeSessions"] == 0
+
+
+def test_times_out_waiting_for_a_slot():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=4, max_wait=0.05)
+        holder = await controller.acquire(PRIORITY_CHAT, "a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(PRIORITY_CHAT, "b")
+        holder.release()
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    assert stats["rejectedTimeout"] == 1
+    assert stats["waiting"]["chat"] == 0
+    assert stats["inflight"] == 0
+    assert stats["activeSessions"] == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=4, max_wait=1)
+        holder = await controller.acquire(PRIORITY_CHAT, "a")
+        waiter = asyncio.create_task(controller.acquire(PRIORITY_CHAT, "b"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        holder.release()
+        # 名额已全部归还，新的请求可以立即进入
+        ticket = await asyncio.wait_for(controller.acquire(PRIORITY_CHAT, "b"), 0.5)
+        ticket.release()
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["inflight"] == 0
+    assert stats["waiting"]["chat"] == 0
+
+
+def test_one_chat_per_session():
+    async def scenario():
+        controller = AdmissionController(max_inflight=4, max_queue=4, max_wait=1)
+        ticket = await controller.acquire(PRIORITY_CHAT, "a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(PRIORITY_CHAT, "a")
+        # 总结请求不受会话限制
+        summary = await controller.acquire(PRIORITY_SUMMARY, "a")
+        summary.release()
+        ticket.release()
+        again = await controller.acquire(PRIORITY_CHAT, "a")
+        again.release()
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.status_code == 429
+    assert stats["rejectedSessionBusy"] == 1
+    assert stats["inflight"] == 0
+
+
+def test_admit_releases_on_error():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=4, max_wait=1)
+        with pytest.raises(RuntimeError):
+            async with controller.admit(PRIORITY_CHAT, "a"):
+                raise RuntimeError("upstream failed")
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["inflight"] == 0
+    assert stats["activeSessions"] == 0
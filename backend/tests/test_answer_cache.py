@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import pytest
+
+import answer_cache
+from answer_cache import AnswerCache, question_features
+
+QUESTION = "What does TF-IDF stand for?"
+PARAPHRASE = "what does tf-idf stand for"
+UNRELATED = "How do I compute cosine similarity between two vectors?"
+
+
+# numpy 和纯Python两种实现都要测试
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy" and answer_cache.np is None:
+        pytest.skip("numpy is not installed")
+    if request.param == "python":
+        monkeypatch.setattr(answer_cache, "np", None)
+    return request.param
+
+
+def test_features_are_stable_and_case_insensitive():
+    assert question_features(QUESTION, 1024) == question_features(PARAPHRASE, 1024)
+    assert question_features("", 1024) == {}
+
+
+def test_similar_question_hits_and_unrelated_misses(backend):
+    cache = AnswerCache(enabled=True)
+    cache.store("3.2", QUESTION, "Term frequency-inverse document frequency.")
+    cache.store("3.2", UNRELATED, "Divide the dot product by the norms.")
+    answer, similarity = cache.lookup("3.2", PARAPHRASE)
+    assert answer == "Term frequency-inverse document frequency."
+    assert similarity == pytest.approx(1.0, abs=1e-4)
+    assert cache.lookup("3.2", "Explain gradient descent") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_threshold_controls_near_matches(backend):
+    near = "What does TF-IDF stand for in search engines?"
+    loose, strict = AnswerCache(enabled=True, threshold=0.5), AnswerCache(enabled=True, threshold=0.99)
+    for cache in (loose, strict):
+        cache.store("3.2", QUESTION, "answer")
+    assert loose.lookup("3.2", near) is not None
+    assert strict.lookup("3.2", near) is None
+
+
+def test_sections_are_isolated(backend):
+    cache = AnswerCache(enabled=True)
+    cache.store("3.2", QUESTION, "answer")
+    assert cache.lookup("4.1", QUESTION) is None
+
+
+def test_least_recently_used_entry_is_evicted(backend):
+    cache = AnswerCache(enabled=True, max_entries=2)
+    cache.store("3.2", QUESTION, "tf-idf")
+    cache.store("3.2", UNRELATED, "cosine")
+    assert cache.lookup("3.2", QUESTION) is not None
+    cache.store("3.2", "Explain gradient descent", "gradient")
+    assert cache.lookup("3.2", UNRELATED) is None
+    assert cache.lookup("3.2", QUESTION) is not None
+    assert cache.evictions == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_expired_entry_is_removed_on_lookup(backend):
+    cache = AnswerCache(enabled=True)
+    cache.store("3.2", QUESTION, "answer", expires_at=time.time() - 1)
+    assert cache.lookup("3.2", QUESTION) is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["sections"] == 0
+
+
+def test_similar_question_is_stored_once(backend):
+    cache = AnswerCache(enabled=True)
+    cache.store("3.2", QUESTION, "first")
+    cache.store("3.2", PARAPHRASE, "second")
+    assert cache.stores == 1
+    assert cache.lookup("3.2", QUESTION)[0] == "first"
+
+
+def test_removal_keeps_remaining_entries_searchable(backend):
+    cache = AnswerCache(enabled=True, max_entries=3)
+    questions = [QUESTION, UNRELATED, "Explain gradient descent", "What is a confusion matrix?"]
+    for i, question in enumerate(questions):
+        cache.store("3.2", question, str(i))
+    # 第一条被淘汰后，最后一行填补了它的位置
+    assert cache.lookup("3.2", questions[0]) is None
+    assert [cache.lookup("3.2", q)[0] for q in questions[1:]] == ["1", "2", "3"]
+
+
+def test_entries_persist_across_restarts(backend, tmp_path):
+    path = str(tmp_path / "answers.json")
+
+    async def scenario():
+        cache = AnswerCache(enabled=True, path=path)
+        await cache.start()
+        cache.store("3.2", QUESTION, "answer")
+        cache.store("3.2", UNRELATED, "expired", expires_at=time.time() + 0.05)
+        await cache.close()
+        await asyncio.sleep(0.1)
+        restored = AnswerCache(enabled=True, path=path)
+        await restored.start()
+        try:
+            return restored.lookup("3.2", PARAPHRASE), restored.stats()["entries"]
+        finally:
+            await restored.close()
+
+    (answer, _), entries = asyncio.run(scenario())
+    assert answer == "answer"
+    assert entries == 1
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import httpx
+
+import main
+
+
+# 上游的SSE流：逐个发送增量文本；hang 为 True 时发完后不结束，模拟仍在生成的回答
+def upstream_stream(deltas, hang: bool = False) -> httpx.Response:
+    async def body():
+        for delta in deltas:
+            yield f'data: {json.dumps({"choices": [{"delta": {"content": delta}}]})}\n\n'.encode()
+        if hang:
+            await asyncio.sleep(30)
+        yield b"data: [DONE]\n\n"
+
+    return httpx.Response(200, content=body(), headers={"Content-Type": "text/event-stream"})
+
+
+def events(text: str):
+    parsed = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return parsed
+
+
+def aborted_streams() -> float:
+    return sum(main.metrics._counters.get("stream_aborted_total", {}).values())
+
+
+def test_stream_sends_deltas_and_stores_the_answer(api, upstream, session_id):
+    upstream.reply = lambda body: upstream_stream(["TF", "-IDF"])
+
+    async def steps(client):
+        response = await client.post("/api/chat/stream", json={"message": "hi", "sessionId": session_id})
+        return response, await main.session_store.get_messages(session_id)
+
+    response, messages = api(steps)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [event for event, _ in events(response.text)] == ["start", "message", "message", "done"]
+    assert events(response.text)[-1][1] == {"response": "TF-IDF"}
+    assert upstream.requests[0]["stream"] is True
+    assert [(m.role, m.content) for m in messages] == [("user", "hi"), ("assistant", "TF-IDF")]
+    assert main.admission.stats()["inflight"] == 0
+
+
+def test_client_disconnect_releases_the_stream(upstream, session_id):
+    upstream.reply = lambda body: upstream_stream(["partial"], hang=True)
+    aborted_before = aborted_streams()
+    body = json.dumps({"message": "hi", "sessionId": session_id}).encode()
+    sent = []
+
+    # 直接调用ASGI应用：收到第一个增量事件后客户端断开
+    async def scenario():
+        first_delta = asyncio.Event()
+        request_read = False
+
+        async def receive():
+            nonlocal request_read
+            if not request_read:
+                request_read = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await first_delta.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message["type"] == "http.response.body" and b"partial" in message.get("body", b""):
+                first_delta.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/api/chat/stream", "raw_path": b"/api/chat/stream", "root_path": "",
+            "query_string": b"", "headers": [(b"host", b"test"), (b"content-type", b"application/json")],
+            "client": ("127.0.0.1", 50000), "server": ("test", 80),
+        }
+        await asyncio.wait_for(main.app(scope, receive, send), timeout=5)
+        return await main.session_store.get_messages(session_id)
+
+    messages = asyncio.run(scenario())
+    assert sent[0]["status"] == 200
+    # 没有完成的回答不会写入历史，上游调用名额已经释放
+    assert [m.role for m in messages] == ["user"]
+    assert main.admission.stats()["inflight"] == 0
+    assert aborted_streams() == aborted_before + 1
+    assert main.upstream_client.pool.endpoints[0].outstanding == 0
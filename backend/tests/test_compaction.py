@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from compaction import ConversationCompactor
+from session_store import MemorySessionStore, SessionStoreConfig
+
+
+class FakeSummarizer:
+    def __init__(self, fail: bool = False):
+        self.prompts = []
+        self.fail = fail
+
+    async def __call__(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("upstream failed")
+        return f"summary {len(self.prompts)}"
+
+
+async def conversation(store: MemorySessionStore, turns: int, start: int = 0) -> None:
+    for i in range(start, start + turns):
+        await store.append("s", "user" if i % 2 == 0 else "assistant", f"turn {i}")
+
+
+@pytest.fixture
+def store() -> MemorySessionStore:
+    return MemorySessionStore(SessionStoreConfig(max_messages=500))
+
+
+@pytest.fixture
+def summarizer() -> FakeSummarizer:
+    return FakeSummarizer()
+
+
+@pytest.fixture
+def compactor(store, summarizer) -> ConversationCompactor:
+    return ConversationCompactor(store, summarizer, threshold=6, keep_recent=2)
+
+
+def test_short_conversation_is_not_compacted(store, summarizer, compactor):
+
+    async def scenario():
+        await conversation(store, 6)
+        await compactor._compact("s")
+        return await store.get_compaction("s")
+
+    assert asyncio.run(scenario()) is None
+    assert summarizer.prompts == []
+
+
+def test_compaction_folds_all_but_recent_turns(store, summarizer, compactor):
+
+    async def scenario():
+        await store.append("s", "system", "section summary")
+        await conversation(store, 8)
+        await compactor._compact("s")
+        return await store.get_compaction("s")
+
+    assert asyncio.run(scenario()) == ("summary 1", 7)
+    prompt = summarizer.prompts[0]
+    assert "Learner: turn 0" in prompt and "Tutor: turn 5" in prompt
+    assert "turn 6" not in prompt
+    # 章节总结的系统消息不参与压缩
+    assert "section summary" not in prompt
+    assert compactor.compactions == 1
+
+
+def test_compaction_is_incremental(store, summarizer, compactor):
+
+    async def scenario():
+        await conversation(store, 8)
+        await compactor._compact("s")
+        await conversation(store, 6, start=8)
+        # 上次压缩之后只有8条新对话，超过阈值
+        await compactor._compact("s")
+        return await store.get_compaction("s")
+
+    assert asyncio.run(scenario()) == ("summary 2", 12)
+    prompt = summarizer.prompts[1]
+    assert "Previous summary:\nsummary 1" in prompt
+    assert "turn 5" not in prompt and "Learner: turn 6" in prompt and "Tutor: turn 11" in prompt
+
+
+def test_failed_summary_keeps_previous_state(store, summarizer, compactor):
+    summarizer.fail = True
+
+    async def scenario():
+        await conversation(store, 8)
+        await compactor._compact("s")
+        return await store.get_compaction("s")
+
+    assert asyncio.run(scenario()) is None
+    assert compactor.failures == 1
+
+
+def test_schedule_runs_one_compaction_per_session(store, summarizer, compactor):
+
+    async def scenario():
+        await conversation(store, 8)
+        compactor.schedule("s")
+        compactor.schedule("s")
+        running = compactor.stats()["running"]
+        await asyncio.gather(*compactor._tasks.values())
+        return running
+
+    assert asyncio.run(scenario()) == 1
+    assert len(summarizer.prompts) == 1
+
+
+def test_disabled_compactor_does_nothing(store, summarizer):
+    compactor = ConversationCompactor(store, summarizer, threshold=6, keep_recent=2, enabled=False)
+
+    async def scenario():
+        await conversation(store, 8)
+        compactor.schedule("s")
+        return compactor.stats()["running"]
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import compression
+from compression import CompressionMiddleware, choose_encoding
+
+PAYLOAD = {"messages": [{"role": "user", "content": "What does TF-IDF stand for?"}] * 100}
+
+
+async def large(request):
+    return JSONResponse(PAYLOAD, headers={"ETag": '"v1"'})
+
+
+async def small(request):
+    return JSONResponse({"ok": True})
+
+
+async def chunked(request):
+    async def body():
+        for _ in range(50):
+            yield b"term frequency, inverse document frequency\n" * 10
+
+    return StreamingResponse(body(), media_type="text/plain")
+
+
+async def events(request):
+    return StreamingResponse(iter([b"data: {}\n\n" * 200]), media_type="text/event-stream")
+
+
+async def encoded(request):
+    return PlainTextResponse("x" * 4096, headers={"Content-Encoding": "identity"})
+
+
+app = CompressionMiddleware(Starlette(routes=[
+    Route("/api/large", large), Route("/api/small", small), Route("/api/chunked", chunked),
+    Route("/api/events", events), Route("/api/encoded", encoded), Route("/large", large),
+]))
+
+
+def get(path: str, accept_encoding: str = "gzip") -> httpx.Response:
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+    return asyncio.run(scenario())
+
+
+# 没有安装 brotli 时即使客户端支持也不选择br
+@pytest.mark.parametrize("header, expected", [
+    ("br, gzip, deflate", "gzip"),
+    ("br, gzip;q=0, deflate", None),
+    ("identity", None),
+    ("*", "gzip"),
+    ("", None),
+])
+def test_choose_encoding_without_brotli(monkeypatch, header, expected):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding(header) == expected
+
+
+def test_large_json_is_gzipped_with_weak_etag_and_vary():
+    response = get("/api/large")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"v1"'
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == PAYLOAD
+
+
+def test_streamed_body_is_compressed_chunk_by_chunk():
+    response = get("/api/chunked")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.text == "term frequency, inverse document frequency\n" * 500
+
+
+@pytest.mark.parametrize("path, accept_encoding", [
+    ("/api/small", "gzip"),
+    ("/api/events", "gzip"),
+    ("/api/encoded", "gzip"),
+    ("/api/large", "identity"),
+    ("/large", "gzip"),
+])
+def test_responses_that_are_passed_through(path, accept_encoding):
+    response = get(path, accept_encoding)
+    assert response.headers.get("content-encoding", "identity") == "identity"
+    assert "vary" not in response.headers
+
+
+@pytest.mark.skipif(compression.brotli is None, reason="brotli is not installed")
+def test_brotli_is_preferred_when_installed():
+    response = get("/api/large", "gzip, br")
+    assert response.headers["content-encoding"] == "br"
+    assert response.json() == PAYLOAD
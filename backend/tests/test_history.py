@@ -0,0 +1,109 @@
+import main
+
+
+async def seed(session_id: str, roles) -> None:
+    for i, role in enumerate(roles):
+        await main.session_store.append(session_id, role, f"{role} {i + 1}")
+
+
+def url(session_id: str) -> str:
+    return f"/api/chat/history/{session_id}"
+
+
+def test_full_history_revalidates_with_etag(api, session_id):
+    async def steps(client):
+        await seed(session_id, ["user", "assistant"])
+        first = await client.get(url(session_id))
+        cached = await client.get(url(session_id), headers={"If-None-Match": first.headers["etag"]})
+        weak = await client.get(url(session_id), headers={"If-None-Match": "W/" + first.headers["etag"]})
+        await main.session_store.append(session_id, "user", "again")
+        changed = await client.get(url(session_id), headers={"If-None-Match": first.headers["etag"]})
+        return first, cached, weak, changed
+
+    first, cached, weak, changed = api(steps)
+    assert first.status_code == 200
+    assert [m["seq"] for m in first.json()["messages"]] == [1, 2]
+    assert first.json()["lastSeq"] == 2 and first.json()["hasMore"] is False
+    assert cached.status_code == 304 and weak.status_code == 304
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != first.headers["etag"]
+
+
+def test_since_returns_only_newer_messages(api, session_id):
+    async def steps(client):
+        await seed(session_id, ["user", "assistant", "user", "assistant", "user"])
+        return (await client.get(url(session_id), params={"since": 2, "limit": 2})).json()
+
+    page = api(steps)
+    assert [m["seq"] for m in page["messages"]] == [3, 4]
+    assert page["hasMore"] is True
+    assert page["nextSince"] == 4
+    assert page["reset"] is False
+
+
+def test_since_ahead_of_server_resets_to_start(api, session_id):
+    async def steps(client):
+        await seed(session_id, ["user", "assistant"])
+        return (await client.get(url(session_id), params={"since": 10})).json()
+
+    page = api(steps)
+    assert page["reset"] is True
+    assert [m["seq"] for m in page["messages"]] == [1, 2]
+    assert page["nextSince"] == 2
+
+
+def test_before_pages_backwards_to_the_start(api, session_id):
+    async def steps(client):
+        await seed(session_id, ["user", "assistant"] * 3)
+        pages = []
+        params = {"limit": 4}
+        while True:
+            page = (await client.get(url(session_id), params=params)).json()
+            pages.append([m["seq"] for m in page["messages"]])
+            if page["nextBefore"] is None:
+                return pages
+            params = {"limit": 4, "before": page["nextBefore"]}
+
+    pages = api(steps)
+    assert pages == [[3, 4, 5, 6], [1, 2]]
+
+
+def test_system_messages_can_be_excluded(api, session_id):
+    async def steps(client):
+        await seed(session_id, ["user", "assistant", "system"])
+        full = (await client.get(url(session_id), params={"since": 0})).json()
+        filtered = (await client.get(url(session_id), params={"since": 0, "includeSystem": "false"})).json()
+        return full, filtered
+
+    full, filtered = api(steps)
+    assert [m["role"] for m in full["messages"]] == ["user", "assistant", "system"]
+    assert [m["role"] for m in filtered["messages"]] == ["user", "assistant"]
+    # 被过滤的系统消息不会在下一次增量同步中再次出现
+    assert filtered["nextSince"] == 3
+
+
+def test_since_before_clear_resets_to_start(api, session_id):
+    async def steps(client):
+        await seed(session_id, ["user", "assistant", "user"])
+        synced = (await client.get(url(session_id), params={"since": 0})).json()
+        await client.post("/api/chat/new", json={"sessionId": session_id})
+        await main.session_store.append(session_id, "user", "fresh start")
+        return synced, (await client.get(url(session_id), params={"since": synced["nextSince"]})).json()
+
+    synced, page = api(steps)
+    assert synced["nextSince"] == 3
+    # 清空后新消息的seq是4，但客户端本地的1-3已经不存在了
+    assert page["reset"] is True
+    assert [(m["seq"], m["content"]) for m in page["messages"]] == [(4, "fresh start")]
+
+
+def test_since_behind_truncated_history_resets_to_start(api, session_id, monkeypatch):
+    monkeypatch.setattr(main.session_store.config, "max_messages", 2)
+
+    async def steps(client):
+        await seed(session_id, ["user", "assistant", "user", "assistant"])
+        return (await client.get(url(session_id), params={"since": 1})).json()
+
+    page = api(steps)
+    assert page["reset"] is True
+    assert [m["seq"] for m in page["messages"]] == [3, 4]
@@ -0,0 +1,20 @@
+from logging_setup import Redactor, configured_secrets
+
+
+def test_configured_secrets_include_every_upstream_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "default-secret")
+    monkeypatch.setenv("EU_KEY", "eu-secret-value")
+    monkeypatch.setenv("UPSTREAMS", '[{"name": "us", "url": "http://us.test", "apiKey": "us-secret-value"},'
+                                    ' {"name": "eu", "url": "http://eu.test", "apiKeyEnv": "EU_KEY"}]')
+    redactor = Redactor(configured_secrets())
+    line = redactor("keys us-secret-value eu-secret-value default-secret")
+    assert line == "keys *** *** ***"
+
+
+def test_redactor_masks_key_patterns():
+    redactor = Redactor(["short"])
+    assert redactor("sent Bearer abc.def") == "sent Bearer ***"
+    assert redactor('{"api_key": "xyz123"}') == '{"api_key": "***"}'
+    assert redactor("key sk-abcdef123456") == "key sk-***"
+    # 过短的密钥不做替换，避免误伤普通文本
+    assert redactor("short text") == "short text"
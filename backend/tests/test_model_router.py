@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from model_router import ModelRouter, ModelTier
+
+
+def tiers():
+    return [
+        ModelTier("fast", "fast-model", slo_latency=1.0, slo_error_rate=0.2, window=10),
+        ModelTier("strong", "strong-model", fallback="fast", slo_latency=1.0, slo_error_rate=0.2, window=10),
+    ]
+
+
+@pytest.fixture
+def router() -> ModelRouter:
+    return ModelRouter(tiers(), min_samples=5, simple_max_chars=40, simple_max_prompt_tokens=1000)
+
+
+def http_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://upstream.test")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.mark.parametrize("endpoint, message, prompt_tokens, expected", [
+    ("summary", "", 5000, ("fast", "summary")),
+    ("compaction", "", 0, ("fast", "summary")),
+    ("chat", "What is TF-IDF?", 500, ("fast", "simple")),
+    ("chat", "What is TF-IDF?", 5000, ("strong", "default")),
+    ("chat", "Why does " + "this long question keep going " * 3, 500, ("strong", "default")),
+    ("chat", "I get a Traceback from my code", 500, ("strong", "complex")),
+    ("chat", "为什么 fit_transform(docs) 报错", 500, ("strong", "complex")),
+])
+def test_routes_by_task(router, endpoint, message, prompt_tokens, expected):
+    route = router.route(endpoint, message, prompt_tokens)
+    assert (route.tier, route.reason) == expected
+    assert route.model == f"{expected[0]}-model"
+
+
+def test_slow_tier_is_downgraded_for_the_cooldown(router):
+    for _ in range(4):
+        router.record("strong", 2.0, True)
+    assert router.route("chat", "Traceback").tier == "strong"
+    router.record("strong", 2.0, True)
+    route = router.route("chat", "Traceback")
+    assert (route.tier, route.reason) == ("fast", "downgraded")
+    strong = router.tiers["strong"]
+    assert strong.downgrades == 1
+    # 冷却后重新积累样本
+    assert len(strong.samples) == 0
+    strong.degraded_until = time.monotonic() - 1
+    assert router.route("chat", "Traceback").tier == "strong"
+
+
+def test_error_rate_triggers_downgrade(router):
+    for ok in (True, True, True, False, False):
+        router.record("strong", 0.1, ok)
+    assert router.tiers["strong"].downgrades == 1
+
+
+def test_healthy_tier_is_not_downgraded(router):
+    for _ in range(10):
+        router.record("strong", 0.5, True)
+    router.record("strong", 0.5, False)
+    assert router.tiers["strong"].downgrades == 0
+
+
+def test_tier_without_fallback_is_never_downgraded(router):
+    for _ in range(10):
+        router.record("fast", 5.0, False)
+    assert router.tiers["fast"].downgrades == 0
+    assert router.route("summary").tier == "fast"
+
+
+def test_fallback_cycle_terminates():
+    router = ModelRouter([
+        ModelTier("a", "model-a", fallback="b"),
+        ModelTier("b", "model-b", fallback="a"),
+    ], chat_tier="a")
+    for tier in router.tiers.values():
+        tier.degraded_until = time.monotonic() + 60
+    assert router.route("chat", "Traceback").tier == "b"
+
+
+def test_unknown_tier_name_uses_first_tier():
+    router = ModelRouter(tiers(), summary_tier="missing")
+    assert router.route("summary").tier == "fast"
+
+
+def test_observe_counts_only_model_failures():
+    router = ModelRouter(tiers(), min_samples=100)
+    route = router.route("chat", "Traceback")
+    with router.observe(route):
+        pass
+    for error in (http_error(503), http_error(429), httpx.ConnectError("refused"), http_error(400)):
+        with pytest.raises(type(error)):
+            with router.observe(route):
+                raise error
+    with pytest.raises(asyncio.CancelledError):
+        with router.observe(route):
+            raise asyncio.CancelledError()
+    # 成功1次，503/429/网络错误3次；400和取消不计入
+    assert [ok for _, ok in router.tiers["strong"].samples] == [True, False, False, False]
+
+
+def test_from_env_reads_tiers(monkeypatch):
+    monkeypatch.setenv("MODEL_TIERS", '[{"name": "mini", "model": "m1", "sloLatency": 5},'
+                                      ' {"name": "max", "model": "m2", "fallback": "mini"}]')
+    monkeypatch.setenv("MODEL_CHAT_TIER", "max")
+    monkeypatch.setenv("MODEL_SIMPLE_TIER", "mini")
+    monkeypatch.setenv("MODEL_SUMMARY_TIER", "mini")
+    monkeypatch.setenv("MODEL_SLO_WINDOW", "7")
+    router = ModelRouter.from_env()
+    assert router.route("chat", "Traceback") == ("max", "m2", "complex")
+    assert router.tiers["mini"].slo_latency == 5
+    assert router.tiers["max"].samples.maxlen == 7
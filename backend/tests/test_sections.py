@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from section_registry import SectionRegistry, section_hash
+
+QUESTION = {
+    "question": "What does IDF measure?",
+    "options": [{"id": "a", "text": "Rarity"}, {"id": "b", "text": "Length"}],
+    "correctAnswerId": "a",
+}
+
+
+def test_hash_depends_on_content_and_question():
+    base = section_hash("3.2", "TF-IDF weighs terms.", None)
+    assert base == section_hash("3.2", "TF-IDF weighs terms.", None)
+    assert base != section_hash("3.2", "TF-IDF weighs words.", None)
+    assert base != section_hash("3.2", "TF-IDF weighs terms.", QUESTION)
+
+
+def test_registry_renders_fragment_once():
+    registry = SectionRegistry()
+    key = registry.register("3.2", "TF-IDF weighs terms.", QUESTION)
+    assert registry.register("3.2", "TF-IDF weighs terms.", QUESTION) == key
+    entry = registry.get(key)
+    fragment = registry.fragment(entry)
+    assert "TF-IDF weighs terms." in fragment and "What does IDF measure?" in fragment
+    assert registry.fragment(entry) is fragment
+    assert registry.get("missing") is None
+    stats = registry.stats()
+    assert (stats["entries"], stats["registrations"], stats["fragmentRenders"]) == (1, 2, 1)
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_registry_evicts_least_recently_used():
+    registry = SectionRegistry(max_entries=2)
+    first = registry.register("1", "one")
+    second = registry.register("2", "two")
+    registry.get(first)
+    registry.register("3", "three")
+    assert first in registry and second not in registry
+    assert registry.evictions == 1
+
+
+def test_chat_with_registered_section_uses_its_content(api, upstream, session_id):
+    async def steps(client):
+        registered = (await client.post("/api/sections", json={
+            "sectionId": "3.2", "sectionContent": "TF-IDF weighs terms.", "checkpointQuestion": QUESTION,
+        })).json()
+        return await client.post("/api/chat", json={
+            "message": "hi", "sessionId": session_id, "sectionHash": registered["sectionHash"],
+        })
+
+    response = api(steps)
+    assert response.status_code == 200
+    system = upstream.requests[0]["messages"][0]["content"]
+    assert "TF-IDF weighs terms." in system and "What does IDF measure?" in system
+
+
+def test_unknown_section_hash_is_rejected_without_storing_the_message(api, upstream, session_id):
+    async def steps(client):
+        response = await client.post("/api/chat", json={"message": "hi", "sessionId": session_id, "sectionHash": "gone"})
+        return response, await main.session_store.get_messages(session_id)
+
+    response, messages = api(steps)
+    assert response.status_code == 409
+    assert messages == []
+    assert upstream.requests == []
+
+
+def test_section_evicted_before_prompt_is_built_leaves_no_orphan_turn(session_id):
+    # 检查通过之后哈希才被淘汰：409要在用户消息写入历史之前返回，重发时不会重复
+    request = main.ChatMessage(message="hi", sessionId=session_id, sectionHash="gone", turnId="t1")
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(HTTPException) as error:
+                await main.build_chat_request(request, session_id)
+            assert error.value.status_code == 409
+        return await main.session_store.get_messages(session_id)
+
+    assert asyncio.run(scenario()) == []
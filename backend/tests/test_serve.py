@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from serve import SessionRouter, WorkerProcess, with_label
+from static_assets import StaticAssetIndex
+
+
+# worker的响应体以流的形式返回，路由进程逐块转发
+def streamed(data) -> httpx.Response:
+    async def body():
+        yield data.encode() if isinstance(data, str) else json.dumps(data).encode()
+
+    return httpx.Response(200, content=body())
+
+
+# 用 MockTransport 代替worker进程，记录每个worker收到的请求
+@pytest.fixture
+def router(tmp_path):
+    (tmp_path / "index.html").write_text("<html>app</html>")
+    received = {0: [], 1: []}
+    workers = []
+    for index in received:
+        async def handler(request: httpx.Request, index=index) -> httpx.Response:
+            body = await request.aread()
+            received[index].append((request.url.path, body))
+            if request.url.path == "/api/metrics":
+                if request.url.params.get("format") == "prometheus":
+                    return streamed(f'# TYPE requests_total counter\nrequests_total{{endpoint="/"}} {index + 1}\n')
+                return streamed({"counters": {"requests_total": index + 1}})
+            return streamed({"worker": index})
+
+        worker = WorkerProcess(index, str(tmp_path / f"worker-{index}.sock"), {})
+        worker.client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://worker")
+        workers.append(worker)
+    assets = StaticAssetIndex(root=str(tmp_path))
+    assets.build()
+    session_router = SessionRouter(workers, static_assets=assets)
+    session_router.received = received
+    return session_router
+
+
+def request(router: SessionRouter, method: str, url: str, **kwargs) -> httpx.Response:
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=router), base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+
+    return asyncio.run(scenario())
+
+
+def test_with_label():
+    assert with_label('requests_total{endpoint="/"} 3', "worker", "1") == 'requests_total{endpoint="/",worker="1"} 3'
+    assert with_label("uptime 5", "worker", "0") == 'uptime{worker="0"} 5'
+
+
+def test_session_requests_stick_to_one_worker(router):
+    body = json.dumps({"sessionId": "abc", "message": "hi"}).encode()
+    workers = {request(router, "POST", "/api/chat", content=body).json()["worker"] for _ in range(3)}
+    history = request(router, "GET", "/api/chat/history/abc").json()["worker"]
+    assert workers == {history}
+    assert router.received[history][0] == ("/api/chat", body)
+
+
+def test_large_body_is_streamed_without_parsing(router):
+    async def chunks():
+        yield json.dumps({"sessionId": "abc", "message": "x"}).encode()
+
+    response = request(router, "POST", "/api/chat", content=chunks())
+    # 没有声明长度的请求体不读出来解析会话ID，轮流分配给worker
+    assert response.status_code == 200
+    assert b'"sessionId": "abc"' in router.received[response.json()["worker"]][0][1]
+
+
+def test_static_assets_are_served_by_the_router(router):
+    page = request(router, "GET", "/course/3.2")
+    assert page.text == "<html>app</html>"
+    assert router.received == {0: [], 1: []}
+
+
+def test_metrics_are_merged_across_workers(router):
+    snapshot = request(router, "GET", "/api/metrics").json()
+    assert snapshot == {"workers": [
+        {"worker": 0, "counters": {"requests_total": 1}},
+        {"worker": 1, "counters": {"requests_total": 2}},
+    ]}
+    text = request(router, "GET", "/api/metrics", params={"format": "prometheus"}).text
+    assert text == ('# TYPE requests_total counter\n'
+                    'requests_total{endpoint="/",worker="0"} 1\n'
+                    'requests_total{endpoint="/",worker="1"} 2\n')
@@ -0,0 +1,222 @@
+import asyncio
+import sqlite3
+import time
+from typing import Optional
+
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore, SessionStore, SessionStoreConfig
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore(SessionStoreConfig())
+
+
+def test_memory_evicts_least_recently_used_session():
+    async def scenario():
+        store = MemorySessionStore(SessionStoreConfig(max_sessions=2))
+        await store.append("a", "user", "hi")
+        await store.append("b", "user", "hi")
+        # 访问 a 之后 b 成为最久未使用的会话
+        await store.get_messages("a")
+        await store.append("c", "user", "hi")
+        return store, [await store.message_count(s) for s in ("a", "b", "c")]
+
+    store, counts = asyncio.run(scenario())
+    assert counts == [1, 0, 1]
+    assert store.evicted_lru == 1
+
+
+def test_memory_keeps_last_max_messages():
+    async def scenario():
+        store = MemorySessionStore(SessionStoreConfig(max_messages=3))
+        for i in range(5):
+            await store.append("s", "user", f"m{i}")
+        return await store.get_messages("s"), await store.history_version("s")
+
+    messages, version = asyncio.run(scenario())
+    assert [m.seq for m in messages] == [3, 4, 5]
+    assert [m.content for m in messages] == ["m2", "m3", "m4"]
+    assert version == (3, 3, 5, 0)
+
+
+def test_memory_sweep_removes_idle_sessions():
+    async def scenario():
+        store = MemorySessionStore(SessionStoreConfig(ttl_seconds=60))
+        await store.append("idle", "user", "hi")
+        await store.append("active", "user", "hi")
+        store._sessions["idle"].last_active = time.monotonic() - 120
+        removed = await store.sweep()
+        return store, removed
+
+    store, removed = asyncio.run(scenario())
+    assert removed == 1
+    assert list(store._sessions) == ["active"]
+    assert store.evicted_ttl == 1
+
+
+def test_memory_records_token_estimate_on_append():
+    async def scenario():
+        store = MemorySessionStore(SessionStoreConfig())
+        return await store.append("s", "user", "what does TF-IDF stand for")
+
+    message = asyncio.run(scenario())
+    assert message.seq == 1
+    assert message.tokens and message.tokens > 0
+
+
+async def open_sqlite(tmp_path, config: Optional[SessionStoreConfig] = None) -> SQLiteSessionStore:
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), config or SessionStoreConfig(), read_threads=1)
+    await store.start()
+    return store
+
+
+def test_sqlite_persists_messages_across_restarts(tmp_path):
+    async def scenario():
+        store = await open_sqlite(tmp_path)
+        await store.append("s", "user", "hi")
+        await store.append("s", "assistant", "hello")
+        await store.set_summary("s", "1.1", "summary")
+        await store.close()
+        store = await open_sqlite(tmp_path)
+        try:
+            return await store.get_messages("s"), await store.get_summary("s", "1.1")
+        finally:
+            await store.close()
+
+    messages, summary = asyncio.run(scenario())
+    assert [(m.seq, m.role, m.content) for m in messages] == [(1, "user", "hi"), (2, "assistant", "hello")]
+    assert all(m.tokens is not None for m in messages)
+    assert summary == "summary"
+
+
+def test_sqlite_enforces_session_cap_on_insert(tmp_path):
+    async def scenario():
+        store = await open_sqlite(tmp_path, SessionStoreConfig(max_sessions=2))
+        try:
+            await store.append("a", "user", "hi")
+            await store.append("b", "user", "hi")
+            # 已有会话的写入不触发淘汰
+            await store.append("a", "user", "again")
+            await store.set_summary("c", "1.1", "summary")
+            sessions = await store._read("SELECT session_id FROM sessions ORDER BY session_id", ())
+            return store.evicted_lru, [row[0] for row in sessions]
+        finally:
+            await store.close()
+
+    evicted, sessions = asyncio.run(scenario())
+    assert evicted == 1
+    assert sessions == ["a", "c"]
+
+
+def test_sqlite_truncates_to_max_messages(tmp_path):
+    async def scenario():
+        store = await open_sqlite(tmp_path, SessionStoreConfig(max_messages=2))
+        try:
+            for i in range(4):
+                await store.append("s", "user", f"m{i}")
+            return await store.get_messages("s"), await store.history_version("s")
+        finally:
+            await store.close()
+
+    messages, version = asyncio.run(scenario())
+    assert [m.seq for m in messages] == [3, 4]
+    assert version == (2, 3, 4, 0)
+
+
+def test_sqlite_sweep_removes_idle_sessions(tmp_path):
+    async def scenario():
+        store = await open_sqlite(tmp_path, SessionStoreConfig(ttl_seconds=60))
+        try:
+            await store.append("idle", "user", "hi")
+            await store.append("active", "user", "hi")
+            await store._write(lambda conn: conn.execute(
+                "UPDATE sessions SET last_active = ? WHERE session_id = 'idle'", (time.time() - 120,)
+            ))
+            removed = await store.sweep()
+            return removed, store.evicted_ttl, await store.message_count("idle"), await store.message_count("active")
+        finally:
+            await store.close()
+
+    assert asyncio.run(scenario()) == (1, 1, 0, 1)
+
+
+def test_sqlite_writer_batches_concurrent_writes(tmp_path):
+    async def scenario():
+        store = await open_sqlite(tmp_path)
+        try:
+            messages = await asyncio.gather(*(store.append("s", "user", f"m{i}") for i in range(50)))
+            return store, messages
+        finally:
+            await store.close()
+
+    store, messages = asyncio.run(scenario())
+    assert sorted(m.seq for m in messages) == list(range(1, 51))
+    assert store.batched_writes == 50
+    assert store.batches <= 50
+
+
+def test_sqlite_failed_write_does_not_fail_its_batch(tmp_path):
+    def broken(conn):
+        conn.execute("INSERT INTO missing_table VALUES (1)")
+
+    async def scenario():
+        store = await open_sqlite(tmp_path)
+        try:
+            results = await asyncio.gather(
+                store.append("s", "user", "before"),
+                store._write(broken),
+                store.append("s", "user", "after"),
+                return_exceptions=True,
+            )
+            return results, await store.get_messages("s")
+        finally:
+            await store.close()
+
+    results, messages = asyncio.run(scenario())
+    assert isinstance(results[1], sqlite3.OperationalError)
+    assert [m.content for m in messages] == ["before", "after"]
+
+
+def test_sqlite_adds_tokens_column_to_old_databases(tmp_path):
+    path = tmp_path / "sessions.db"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE sessions (session_id TEXT PRIMARY KEY, last_active REAL NOT NULL, next_seq INTEGER NOT NULL DEFAULT 1);
+        CREATE TABLE messages (session_id TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL,
+                               content TEXT NOT NULL, PRIMARY KEY (session_id, seq)) WITHOUT ROWID;
+        INSERT INTO sessions VALUES ('s', 0, 2);
+        INSERT INTO messages VALUES ('s', 1, 'user', 'old');
+    """)
+    conn.close()
+
+    async def scenario():
+        store = await open_sqlite(tmp_path)
+        try:
+            await store.append("s", "assistant", "new")
+            return await store.get_messages("s")
+        finally:
+            await store.close()
+
+    messages = asyncio.run(scenario())
+    assert [(m.seq, m.content) for m in messages] == [(1, "old"), (2, "new")]
+    assert messages[0].tokens is None and messages[1].tokens is not None
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_clear_records_position_in_history_version(backend, tmp_path):
+    async def scenario():
+        store = MemorySessionStore(SessionStoreConfig()) if backend == "memory" else await open_sqlite(tmp_path)
+        try:
+            for i in range(3):
+                await store.append("s", "user", f"m{i}")
+            await store.clear("s")
+            cleared = await store.history_version("s")
+            await store.append("s", "user", "after")
+            return cleared, await store.history_version("s")
+        finally:
+            await store.close()
+
+    # 清空后seq继续递增，清空位置区分了清空前后的游标
+    assert asyncio.run(scenario()) == ((0, 0, 0, 3), (1, 4, 4, 3))
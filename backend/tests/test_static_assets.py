@@ -0,0 +1,68 @@
+import gzip
+
+import pytest
+
+from static_assets import IMMUTABLE_CACHE_CONTROL, INDEX_CACHE_CONTROL, StaticAssetIndex, etag_matches
+
+SCRIPT = b"console.log('tf-idf');\n" * 200
+
+
+@pytest.fixture
+def index(tmp_path):
+    dist = tmp_path / "dist"
+    (dist / "assets").mkdir(parents=True)
+    (dist / "index.html").write_text("<html></html>")
+    (dist / "assets" / "index-1a2b3c4d.js").write_bytes(SCRIPT)
+    (tmp_path / "secret.txt").write_text("secret")
+    assets = StaticAssetIndex(root=str(dist))
+    assets.build()
+    return assets
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ("*", True),
+    ('"other"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches('"abc"', header) is expected
+
+
+def test_weak_etag_matches_strong_header():
+    assert etag_matches('W/"abc"', '"abc"')
+
+
+def test_lookup_stays_inside_the_build_directory(index):
+    assert index.lookup("assets/index-1a2b3c4d.js") is not None
+    assert index.lookup("assets/../index.html") is index.index_html
+    for path in ("../secret.txt", "assets/../../secret.txt", "..\\secret.txt", "index.html\x00.js"):
+        assert index.lookup(path) is None
+
+
+def test_hashed_assets_are_immutable(index):
+    assert index.lookup("assets/index-1a2b3c4d.js").cache_control == IMMUTABLE_CACHE_CONTROL
+    assert index.index_html.cache_control == INDEX_CACHE_CONTROL
+
+
+def test_respond_serves_gzip_variant_with_its_own_etag(index):
+    asset = index.lookup("assets/index-1a2b3c4d.js")
+    plain = index.respond(asset, {})
+    zipped = index.respond(asset, {"accept-encoding": "gzip, br;q=0"})
+    assert plain.body == SCRIPT
+    assert gzip.decompress(zipped.body) == SCRIPT
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert zipped.headers["etag"] != plain.headers["etag"]
+    assert zipped.headers["vary"] == "Accept-Encoding"
+
+
+def test_respond_returns_304_for_matching_etag(index):
+    asset = index.lookup("assets/index-1a2b3c4d.js")
+    etag = index.respond(asset, {}).headers["etag"]
+    cached = index.respond(asset, {"if-none-match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag and not cached.body
+    # 另一种编码的ETag不匹配
+    assert index.respond(asset, {"if-none-match": etag, "accept-encoding": "gzip"}).status_code == 200
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from summary_cache import SummaryCache, summary_cache_key
+
+QUESTION = {"question": "What does IDF measure?", "options": [{"id": "a", "text": "Rarity"}], "correctAnswerId": "a"}
+
+
+def test_key_ignores_whitespace_and_unused_correctness():
+    key = summary_cache_key("3.2", "TF-IDF  weighs\nterms.", QUESTION, None, True)
+    assert key == summary_cache_key("3.2", "TF-IDF weighs terms.", QUESTION, None, False)
+    assert key != summary_cache_key("3.2", "TF-IDF weighs terms.", QUESTION, "a", True)
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    cache = SummaryCache()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "summary"
+
+    async def scenario():
+        first = await asyncio.gather(*(cache.get_or_create("k", factory) for _ in range(3)))
+        return first, await cache.get_or_create("k", factory)
+
+    first, again = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(status for _, status in first) == ["coalesced", "coalesced", "miss"]
+    assert again == ("summary", "hit")
+    assert cache.stats()["inflight"] == 0
+
+
+def test_failed_call_is_not_cached():
+    cache = SummaryCache()
+
+    async def factory():
+        raise RuntimeError("upstream failed")
+
+    async def scenario():
+        try:
+            await cache.get_or_create("k", factory)
+        except RuntimeError:
+            pass
+        return cache.get("k")
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_entries_persist_across_restarts(tmp_path):
+    path = str(tmp_path / "summaries.json")
+
+    async def scenario():
+        cache = SummaryCache(path=path)
+        await cache.start()
+        cache.set("kept", "summary")
+        cache.set("expired", "old")
+        cache._entries["expired"] = (time.time() - 1, "old")
+        await cache.close()
+        restored = SummaryCache(path=path)
+        await restored.start()
+        try:
+            return restored.get("kept"), restored.stats()["entries"]
+        finally:
+            await restored.close()
+
+    assert asyncio.run(scenario()) == ("summary", 1)
@@ -0,0 +1,123 @@
+import asyncio
+
+import httpx
+import pytest
+
+import main
+from admission import AdmissionRejected
+from summary_cache import SummaryCache
+from summary_jobs import DONE, FAILED, SummaryJobQueue
+
+SUMMARY_REQUEST = {
+    "sectionId": "3.2",
+    "sectionContent": "TF-IDF weighs terms by how rare they are.",
+    "checkpointQuestion": {
+        "question": "What does IDF measure?",
+        "options": [{"id": "a", "text": "Rarity"}, {"id": "b", "text": "Length"}],
+        "correctAnswerId": "a",
+    },
+    "userAnswer": "a",
+    "isCorrect": True,
+}
+
+
+async def wait_finished(queue: SummaryJobQueue, job_id: str):
+    for _ in range(100):
+        job = queue.get(job_id)
+        if job.finished():
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_jobs_with_the_same_key_run_once():
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        return {"summary": "done"}
+
+    async def scenario():
+        queue = SummaryJobQueue(workers=1)
+        await queue.start()
+        try:
+            first = queue.submit(factory, dedupe_key="k")
+            second = queue.submit(factory, dedupe_key="k")
+            return first, second, await wait_finished(queue, first.id), queue.stats()
+        finally:
+            await queue.close()
+
+    first, second, job, stats = asyncio.run(scenario())
+    assert first is second
+    assert job.to_dict()["summary"] == "done"
+    assert len(calls) == 1
+    assert (stats["submitted"], stats["deduplicated"], stats["completed"]) == (1, 1, 1)
+
+
+def test_failed_job_records_error_and_can_be_resubmitted():
+    async def factory():
+        raise httpx.HTTPStatusError("error", request=httpx.Request("POST", "http://upstream.test"),
+                                    response=httpx.Response(502))
+
+    async def scenario():
+        queue = SummaryJobQueue(workers=1)
+        await queue.start()
+        try:
+            job = await wait_finished(queue, queue.submit(factory, dedupe_key="k").id)
+            return job, queue.submit(factory, dedupe_key="k")
+        finally:
+            await queue.close()
+
+    job, retry = asyncio.run(scenario())
+    assert job.status == FAILED and job.error_status == 502
+    assert retry is not job
+
+
+def test_full_queue_rejects_with_503():
+    async def scenario():
+        queue = SummaryJobQueue(max_queue=1)
+        queue.submit(lambda: asyncio.sleep(0))
+        with pytest.raises(AdmissionRejected) as error:
+            queue.submit(lambda: asyncio.sleep(0))
+        return error.value, queue.stats()["rejected"]
+
+    error, rejected = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert rejected == 1
+
+
+def test_async_summary_returns_status_url_and_stores_the_summary(api, upstream, session_id, monkeypatch):
+    jobs = SummaryJobQueue(workers=1)
+    monkeypatch.setattr(main, "summary_jobs", jobs)
+    monkeypatch.setattr(main, "summary_cache", SummaryCache())
+    upstream.reply = lambda body: httpx.Response(200, json={"choices": [{"message": {"content": "IDF summary"}}]})
+
+    async def steps(client):
+        await jobs.start()
+        try:
+            body = {**SUMMARY_REQUEST, "sessionId": session_id}
+            accepted = await client.post("/api/summary", params={"mode": "async"}, json=body)
+            duplicate = await client.post("/api/summary", params={"mode": "async"}, json=body)
+            await wait_finished(jobs, accepted.json()["jobId"])
+            status = await client.get(accepted.json()["statusUrl"])
+            return accepted, duplicate, status, await main.session_store.get_summary(session_id, "3.2")
+        finally:
+            await jobs.close()
+
+    accepted, duplicate, status, summary = api(steps)
+    assert accepted.status_code == 202
+    data = accepted.json()
+    assert data["statusUrl"] == f"/api/summary/jobs/{data['jobId']}?sessionId={session_id}"
+    assert accepted.headers["location"] == data["statusUrl"]
+    assert duplicate.json()["jobId"] == data["jobId"]
+    assert status.json()["status"] == DONE
+    assert status.json()["summary"] == "IDF summary"
+    assert summary == "IDF summary"
+    assert len(upstream.requests) == 1
+
+
+def test_unknown_job_returns_404(api):
+    async def steps(client):
+        return await client.get("/api/summary/jobs/missing")
+
+    assert api(steps).status_code == 404
@@ -0,0 +1,48 @@
+from session_store import StoredMessage
+from tokens import MESSAGE_OVERHEAD_TOKENS, TokenBudget, estimate_tokens, message_tokens, select_history
+
+
+def message(seq: int, role: str = "user", tokens: int = 10) -> StoredMessage:
+    return StoredMessage(seq, role, f"message {seq}", tokens)
+
+
+def test_estimate_tokens_counts_ascii_and_cjk_differently():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("逆文档频率") == 5
+    assert estimate_tokens("TF-IDF 逆文档频率") == 2 + 5
+
+
+def test_message_tokens_prefers_stored_count():
+    assert message_tokens(StoredMessage(1, "user", "abcd" * 10, 3)) == 3 + MESSAGE_OVERHEAD_TOKENS
+    assert message_tokens(StoredMessage(1, "user", "abcd" * 10)) == 10 + MESSAGE_OVERHEAD_TOKENS
+
+
+def test_history_budget_subtracts_reserve_and_system_prompt():
+    assert TokenBudget(context_tokens=8000, response_reserve=1000).history_budget(500) == 6500
+
+
+def test_select_history_keeps_newest_messages_within_budget():
+    messages = [message(seq) for seq in range(1, 11)]
+    cost = 10 + MESSAGE_OVERHEAD_TOKENS
+    selected, used = select_history(messages, cost * 4)
+    assert [m.seq for m in selected] == [7, 8, 9, 10]
+    assert used == cost * 4
+
+
+def test_select_history_always_keeps_system_and_latest_message():
+    messages = [message(1, "system", 50), message(2), message(3), message(4, tokens=500)]
+    selected, used = select_history(messages, 100)
+    assert [m.seq for m in selected] == [1, 4]
+    assert used == 50 + 500 + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def test_select_history_stops_at_first_message_over_budget():
+    # 较早的短消息不会越过一条放不下的消息被选中，保持对话连续
+    messages = [message(1, tokens=1), message(2, tokens=100), message(3, tokens=1)]
+    selected, _ = select_history(messages, 20)
+    assert [m.seq for m in selected] == [3]
+
+
+def test_select_history_empty():
+    assert select_history([], 100) == ([], 0)
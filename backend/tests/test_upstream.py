@@ -0,0 +1,147 @@
+import asyncio
+
+import httpx
+import pytest
+
+from upstream import RetryBudget, UpstreamClient, UpstreamConfig
+from upstream_pool import UpstreamEndpoint, UpstreamPool
+
+URL = "http://upstream.test/v1/chat/completions"
+
+
+# 单端点的客户端，上游请求交给 handler 处理
+def mock_client(config: UpstreamConfig, handler) -> UpstreamClient:
+    client = UpstreamClient(config, UpstreamPool([UpstreamEndpoint("a", URL, "key")]))
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def responses(*statuses):
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        if isinstance(status, Exception):
+            raise status
+        return httpx.Response(status, json={"ok": status == 200})
+
+    return handler, calls
+
+
+def test_retry_budget_limits_withdrawals():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    assert budget.exhausted == 1
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_retry_budget_refills_over_time():
+    budget = RetryBudget(ratio=0, min_per_second=2, max_tokens=3)
+    budget.tokens = 0
+    budget._updated_at -= 1
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    # 补充不超过上限
+    budget._updated_at -= 100
+    budget._refill()
+    assert budget.tokens == 3
+
+
+def test_post_retries_retryable_status():
+    handler, calls = responses(503, 200)
+    client = mock_client(UpstreamConfig(retry_base_delay=0, retry_max_delay=0), handler)
+    response = asyncio.run(client.post({"model": "m"}, {}))
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert calls[0].headers["authorization"] == "Bearer key"
+    assert client.resilience_stats()["retries"] == 1
+
+
+def test_post_retries_connection_errors():
+    handler, calls = responses(httpx.ConnectError("refused"), 200)
+    client = mock_client(UpstreamConfig(retry_base_delay=0, retry_max_delay=0), handler)
+    assert asyncio.run(client.post({}, {})).status_code == 200
+    assert len(calls) == 2
+
+
+def test_post_does_not_retry_client_errors():
+    handler, calls = responses(400)
+    client = mock_client(UpstreamConfig(), handler)
+    assert asyncio.run(client.post({}, {})).status_code == 400
+    assert len(calls) == 1
+
+
+def test_post_stops_after_max_retries():
+    handler, calls = responses(503)
+    client = mock_client(UpstreamConfig(retry_base_delay=0, retry_max_delay=0, max_retries=2), handler)
+    assert asyncio.run(client.post({}, {})).status_code == 503
+    assert len(calls) == 3
+
+
+def test_post_stops_when_retry_budget_is_exhausted():
+    handler, calls = responses(503)
+    config = UpstreamConfig(max_retries=5, retry_budget_ratio=0, retry_budget_min_per_second=0)
+    client = mock_client(config, handler)
+    client.retry_budget.tokens = 0
+    assert asyncio.run(client.post({}, {})).status_code == 503
+    assert len(calls) == 1
+    assert client.retry_budget.exhausted == 1
+
+
+def test_post_raises_when_connection_errors_persist():
+    handler, calls = responses(httpx.ConnectError("refused"))
+    client = mock_client(UpstreamConfig(retry_base_delay=0, retry_max_delay=0, max_retries=1), handler)
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(client.post({}, {}))
+    assert len(calls) == 2
+    assert client.pool.endpoints[0].outstanding == 0
+
+
+def test_slow_request_is_hedged_and_loser_cancelled():
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+            return httpx.Response(200, json={"attempt": 1})
+        return httpx.Response(200, json={"attempt": 2})
+
+    client = mock_client(UpstreamConfig(hedge=True, hedge_max_delay=0.05), handler)
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        response = await client.post({}, {})
+        return response, asyncio.get_running_loop().time() - started
+
+    response, elapsed = asyncio.run(scenario())
+    assert response.json() == {"attempt": 2}
+    assert elapsed < 2
+    stats = client.resilience_stats()
+    assert (stats["hedges"], stats["hedgeWins"]) == (1, 1)
+    assert client.pool.endpoints[0].outstanding == 0
+
+
+def test_fast_request_is_not_hedged():
+    handler, calls = responses(200)
+    client = mock_client(UpstreamConfig(hedge=True, hedge_max_delay=1), handler)
+    assert asyncio.run(client.post({}, {})).status_code == 200
+    assert len(calls) == 1
+    assert client.resilience_stats()["hedges"] == 0
+
+
+def test_hedge_delay_uses_latency_percentile_once_warmed_up():
+    handler, _ = responses(200)
+    config = UpstreamConfig(hedge=True, hedge_min_samples=3, hedge_min_delay=0.01, hedge_max_delay=10, hedge_percentile=0.5)
+    client = mock_client(config, handler)
+    assert client.hedge_delay("chat") == 10
+    asyncio.run(client.post({}, {}))
+    assert client.hedge_delay("chat") == 10
+    for _ in range(2):
+        asyncio.run(client.post({}, {}))
+    assert 0.01 <= client.hedge_delay("chat") < 10
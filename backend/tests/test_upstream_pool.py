@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from upstream_pool import CLOSED, HALF_OPEN, OPEN, UpstreamEndpoint, UpstreamPool
+
+
+def endpoint(name: str) -> UpstreamEndpoint:
+    return UpstreamEndpoint(name, f"http://{name}.test/v1/chat/completions", "key")
+
+
+def fail(pool: UpstreamPool, target: UpstreamEndpoint, times: int) -> None:
+    for _ in range(times):
+        target.outstanding += 1
+        pool.release(target, 0.1, ok=False)
+
+
+def expire_cooldown(pool: UpstreamPool, target: UpstreamEndpoint) -> None:
+    target.opened_at = time.monotonic() - pool.cooldown - 1
+
+
+def test_breaker_opens_after_consecutive_failures():
+    a = endpoint("a")
+    pool = UpstreamPool([a], failure_threshold=3, cooldown=30)
+    fail(pool, a, 2)
+    a.outstanding += 1
+    pool.release(a, 0.1, ok=True)
+    assert a.state == CLOSED and a.consecutive_failures == 0
+    fail(pool, a, 3)
+    assert a.state == OPEN
+    assert a.ejections == 1
+
+
+def test_open_endpoint_is_skipped_until_cooldown():
+    a, b = endpoint("a"), endpoint("b")
+    pool = UpstreamPool([a, b], failure_threshold=1, cooldown=30)
+    fail(pool, a, 1)
+    assert all(pool.acquire() is b for _ in range(20))
+    assert a.selected == 0
+
+
+def test_half_open_admits_a_single_probe():
+    a, b = endpoint("a"), endpoint("b")
+    pool = UpstreamPool([a, b], failure_threshold=1, cooldown=30)
+    fail(pool, a, 1)
+    expire_cooldown(pool, a)
+    # b 上的进行中请求让 a 的得分更低，探测请求选中 a
+    b.outstanding = 10
+    probe = pool.acquire()
+    assert probe is a and a.state == HALF_OPEN and a.probing
+    assert pool.acquire() is b
+    pool.release(a, 0.1, ok=True)
+    assert a.state == CLOSED and not a.probing
+
+
+def test_failed_probe_reopens_the_breaker():
+    a = endpoint("a")
+    pool = UpstreamPool([a], failure_threshold=1, cooldown=30)
+    fail(pool, a, 1)
+    expire_cooldown(pool, a)
+    assert pool.acquire() is a and a.state == HALF_OPEN
+    pool.release(a, 0.1, ok=False)
+    assert a.state == OPEN
+    assert a.ejections == 2
+    assert time.monotonic() - a.opened_at < 1
+
+
+def test_cancelled_request_does_not_affect_breaker_or_latency():
+    a = endpoint("a")
+    pool = UpstreamPool([a], failure_threshold=1, cooldown=30)
+    fail(pool, a, 1)
+    expire_cooldown(pool, a)
+    pool.acquire()
+    pool.release(a, None, ok=None)
+    assert a.state == HALF_OPEN and not a.probing
+    assert a.outstanding == 0
+    assert a.failures == 1
+
+
+def test_all_open_falls_back_to_longest_open_endpoint():
+    a, b = endpoint("a"), endpoint("b")
+    pool = UpstreamPool([a, b], failure_threshold=1, cooldown=30)
+    fail(pool, b, 1)
+    fail(pool, a, 1)
+    b.opened_at -= 5
+    assert pool.acquire() is b
+
+
+def test_ewma_tracks_successes_and_ignores_fast_failures():
+    a = endpoint("a")
+    pool = UpstreamPool([a], ewma_alpha=0.5, failure_threshold=10)
+    for latency, ok in ((1.0, True), (0.5, True), (0.01, False)):
+        pool.acquire()
+        pool.release(a, latency, ok=ok)
+    assert a.ewma == pytest.approx(0.75)
+
+
+def test_power_of_two_choices_prefers_lower_load():
+    a, b = endpoint("a"), endpoint("b")
+    pool = UpstreamPool([a, b])
+    a.ewma, b.ewma = 0.1, 1.0
+    assert pool.acquire() is a
+    # 进行中请求数足够多时改选较慢但空闲的端点
+    a.outstanding = 20
+    assert pool.acquire() is b
+
+
+def test_from_env_reads_endpoint_list(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "default-key")
+    monkeypatch.setenv("EU_KEY", "eu-key")
+    monkeypatch.setenv("UPSTREAMS", '[{"name": "us", "url": "http://us.test", "apiKey": "us-key"},'
+                                    ' {"url": "http://eu.test", "apiKeyEnv": "EU_KEY", "weight": 2}]')
+    monkeypatch.setenv("UPSTREAM_BREAKER_FAILURES", "7")
+    pool = UpstreamPool.from_env()
+    assert [(e.name, e.api_key, e.weight) for e in pool.endpoints] == [("us", "us-key", 1.0), ("upstream-1", "eu-key", 2.0)]
+    assert pool.failure_threshold == 7
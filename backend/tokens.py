@@ -0,0 +1,74 @@
+import math
+from typing import List, Sequence, Tuple, TYPE_CHECKING
+
+from env import env_int
+
+if TYPE_CHECKING:
+    from session_store import StoredMessage
+
+# 每条消息在聊天格式中的额外开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+# 快速的本地token估算：ASCII文本约4个字符一个token，非ASCII字符（如中文）约一个字符一个token
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+# 历史消息的token数在写入会话存储时已经算好，这里直接使用
+def message_tokens(message: "StoredMessage") -> int:
+    tokens = message.tokens if message.tokens is not None else estimate_tokens(message.content)
+    return tokens + MESSAGE_OVERHEAD_TOKENS
+
+
+# 聊天上下文的token预算配置
+class TokenBudget:
+    def __init__(self, context_tokens: int = 8000, response_reserve: int = 1024, history_scan: int = 200):
+        self.context_tokens = context_tokens
+        self.response_reserve = response_reserve
+        self.history_scan = history_scan
+
+    @classmethod
+    def from_env(cls) -> "TokenBudget":
+        return cls(
+            context_tokens=env_int("CHAT_CONTEXT_TOKENS", 8000),
+            response_reserve=env_int("CHAT_RESPONSE_RESERVE", 1024),
+            history_scan=env_int("CHAT_HISTORY_SCAN", 200),
+        )
+
+    def history_budget(self, system_tokens: int) -> int:
+        return self.context_tokens - self.response_reserve - system_tokens
+
+
+# 在预算内选择最新的历史消息；系统消息（章节总结）总是保留，最新一条消息总是保留。
+# 返回按时间顺序排列的消息和它们占用的token数。
+def select_history(messages: Sequence["StoredMessage"], budget: int) -> Tuple[List["StoredMessage"], int]:
+    if not messages:
+        return [], 0
+
+    keep = [False] * len(messages)
+    used = 0
+    for i, message in enumerate(messages):
+        if message.role == "system":
+            keep[i] = True
+            used += message_tokens(message)
+
+    last = len(messages) - 1
+    if not keep[last]:
+        keep[last] = True
+        used += message_tokens(messages[last])
+
+    # 从新到旧加入对话消息，直到预算用完
+    for i in range(last - 1, -1, -1):
+        if keep[i]:
+            continue
+        cost = message_tokens(messages[i])
+        if used + cost > budget:
+            break
+        keep[i] = True
+        used += cost
+
+    return [message for i, message in enumerate(messages) if keep[i]], used
@@ -0,0 +1,422 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Deque
+
+import httpx
+
+from env import env_bool, env_float, env_int
+from metrics import metrics
+from upstream_pool import UpstreamPool, UpstreamEndpoint, FAILURE_STATUS_CODES
+
+logger = logging.getLogger(__name__)
+
+# 可以安全重试的上游状态码和传输错误（请求没有产生副作用，重复发送只会多一次计费）
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.WriteError, httpx.RemoteProtocolError)
+
+
+# 上游HTTP客户端配置，从环境变量读取
+class UpstreamConfig:
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 5.0,
+        max_retries: int = 2,
+        retry_base_delay: float = 0.25,
+        retry_max_delay: float = 4.0,
+        retry_budget_ratio: float = 0.1,
+        retry_budget_min_per_second: float = 1.0,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_delay: float = 0.5,
+        hedge_max_delay: float = 10.0,
+        hedge_min_samples: int = 20,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.retry_budget_ratio = retry_budget_ratio
+        self.retry_budget_min_per_second = retry_budget_min_per_second
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.hedge_min_samples = hedge_min_samples
+
+    @classmethod
+    def from_env(cls) -> "UpstreamConfig":
+        return cls(
+            max_connections=env_int("UPSTREAM_MAX_CONNECTIONS", 100),
+            max_keepalive_connections=env_int("UPSTREAM_MAX_KEEPALIVE", 20),
+            keepalive_expiry=env_float("UPSTREAM_KEEPALIVE_EXPIRY", 30.0),
+            http2=env_bool("UPSTREAM_HTTP2", False),
+            connect_timeout=env_float("UPSTREAM_CONNECT_TIMEOUT", 5.0),
+            read_timeout=env_float("UPSTREAM_READ_TIMEOUT", 60.0),
+            write_timeout=env_float("UPSTREAM_WRITE_TIMEOUT", 10.0),
+            pool_timeout=env_float("UPSTREAM_POOL_TIMEOUT", 5.0),
+            max_retries=env_int("UPSTREAM_MAX_RETRIES", 2),
+            retry_base_delay=env_float("UPSTREAM_RETRY_BASE_DELAY", 0.25),
+            retry_max_delay=env_float("UPSTREAM_RETRY_MAX_DELAY", 4.0),
+            retry_budget_ratio=env_float("UPSTREAM_RETRY_BUDGET_RATIO", 0.1),
+            retry_budget_min_per_second=env_float("UPSTREAM_RETRY_BUDGET_MIN_PER_SECOND", 1.0),
+            hedge=env_bool("UPSTREAM_HEDGE", False),
+            hedge_percentile=env_float("UPSTREAM_HEDGE_PERCENTILE", 0.95),
+            hedge_min_delay=env_float("UPSTREAM_HEDGE_MIN_DELAY", 0.5),
+            hedge_max_delay=env_float("UPSTREAM_HEDGE_MAX_DELAY", 10.0),
+            hedge_min_samples=env_int("UPSTREAM_HEDGE_MIN_SAMPLES", 20),
+        )
+
+
+# 全局重试预算：每个请求存入 ratio 个令牌，每次重试或对冲取出一个，
+# 另外每秒补充少量令牌保证低流量时也能重试。上游整体故障时重试量最多是正常流量的 ratio 倍
+class RetryBudget:
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._updated_at = time.monotonic()
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._updated_at) * self.min_per_second)
+        self._updated_at = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        self.exhausted += 1
+        return False
+
+
+# 最近成功请求的延迟窗口，用来计算对冲延迟
+class LatencyWindow:
+    def __init__(self, size: int = 500):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, value: float) -> None:
+        self._samples.append(value)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _http2_available() -> bool:
+    # HTTP/2 需要可选依赖 h2（pip install httpx[http2]）
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# 包装流式响应体，响应关闭时回调一次（用于释放端点的进行中计数）
+class _ReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            on_close()
+        await self._stream.aclose()
+
+
+# 应用级共享的上游客户端，由 FastAPI lifespan 创建和关闭
+class UpstreamClient:
+    def __init__(self, config: Optional[UpstreamConfig] = None, pool: Optional[UpstreamPool] = None):
+        self.config = config or UpstreamConfig.from_env()
+        # 上游端点池（地址 + 密钥）；每次尝试（包括重试和对冲）都会重新选择端点
+        self.pool = pool if pool is not None else UpstreamPool.from_env()
+        self.http2 = self.config.http2 and _http2_available()
+        if self.config.http2 and not self.http2:
+            logger.warning("UPSTREAM_HTTP2 is enabled but the 'h2' package is not installed, falling back to HTTP/1.1")
+        self._client: Optional[httpx.AsyncClient] = None
+        self.retry_budget = RetryBudget(self.config.retry_budget_ratio, self.config.retry_budget_min_per_second)
+        self._latency: Dict[str, LatencyWindow] = {}
+        self._counts: Dict[str, int] = {"requests": 0, "retries": 0, "hedges": 0, "hedgeWins": 0}
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        cfg = self.config
+        self._client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive_connections,
+                keepalive_expiry=cfg.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=cfg.connect_timeout,
+                read=cfg.read_timeout,
+                write=cfg.write_timeout,
+                pool=cfg.pool_timeout,
+            ),
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError("Upstream client is not started")
+        return self._client
+
+    # 重试前的等待时间：指数退避 + full jitter；429/503 带 Retry-After 时优先使用它
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        cfg = self.config
+        if response is not None:
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit() and int(retry_after) <= cfg.retry_max_delay:
+                return float(retry_after)
+        return random.uniform(0, min(cfg.retry_max_delay, cfg.retry_base_delay * (2 ** attempt)))
+
+    def _can_retry(self, attempt: int, kind: str, reason: str) -> bool:
+        if attempt >= self.config.max_retries:
+            return False
+        if not self.retry_budget.withdraw():
+            metrics.inc("upstream_retry_budget_exhausted_total", {"kind": kind})
+            return False
+        self._counts["retries"] += 1
+        metrics.inc("upstream_retries_total", {"kind": kind, "reason": reason})
+        logger.info("Retrying upstream request", extra={"kind": kind, "reason": reason, "attempt": attempt + 1})
+        return True
+
+    # 对冲延迟：最近成功请求延迟的高分位数；样本不足时使用上限
+    def hedge_delay(self, kind: str) -> float:
+        cfg = self.config
+        window = self._latency.get(kind)
+        if window is None or len(window) < cfg.hedge_min_samples:
+            return cfg.hedge_max_delay
+        return min(cfg.hedge_max_delay, max(cfg.hedge_min_delay, window.percentile(cfg.hedge_percentile)))
+
+    # 发起请求并读取完整响应；可重试的失败按退避重试，开启对冲时慢请求会并行发出第二次尝试
+    async def post(self, json: Dict[str, Any], headers: Dict[str, str], kind: str = "chat") -> httpx.Response:
+        self._counts["requests"] += 1
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = await self._hedged(json, headers, kind)
+            except RETRYABLE_ERRORS as e:
+                if not self._can_retry(attempt, kind, type(e).__name__):
+                    raise
+                delay = self._retry_delay(attempt)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or not self._can_retry(attempt, kind, str(response.status_code)):
+                    return response
+                delay = self._retry_delay(attempt, response)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _hedged(self, json: Dict[str, Any], headers: Dict[str, str], kind: str) -> httpx.Response:
+        if not self.config.hedge:
+            return await self._attempt(json, headers, kind)
+
+        primary = asyncio.create_task(self._attempt(json, headers, kind))
+        hedge: Optional[asyncio.Task] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay(kind))
+            if done or not self.retry_budget.withdraw():
+                return await primary
+
+            self._counts["hedges"] += 1
+            metrics.inc("upstream_hedges_total", {"kind": kind})
+            hedge = asyncio.create_task(self._attempt(json, headers, kind))
+            pending = {primary, hedge}
+            result: Optional[asyncio.Task] = None
+            # 取先成功完成的一次尝试；一次失败时继续等另一次
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task
+                    if task.exception() is None and task.result().status_code not in RETRYABLE_STATUS_CODES:
+                        if task is hedge:
+                            self._counts["hedgeWins"] += 1
+                            metrics.inc("upstream_hedge_wins_total", {"kind": kind})
+                        return task.result()
+            return result.result()
+        finally:
+            # 取消仍在进行的尝试，它们的响应会在 _attempt 中关闭
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    # 单次上游尝试：读取完整响应，记录首字节时间和总耗时
+    async def _attempt(self, json: Dict[str, Any], headers: Dict[str, str], kind: str) -> httpx.Response:
+        endpoint = self.pool.acquire()
+        labels = {"kind": kind}
+        start = time.perf_counter()
+        try:
+            request = self._build_request(endpoint, json, headers)
+            response = await self.client.send(request, stream=True)
+            metrics.observe("upstream_ttfb_seconds", time.perf_counter() - start, labels)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+        except httpx.HTTPError as e:
+            self.pool.release(endpoint, time.perf_counter() - start, ok=False)
+            metrics.inc("upstream_errors_total", {**labels, "upstream": endpoint.name, "error": type(e).__name__})
+            raise
+        except BaseException:
+            # 被取消（例如对冲中输掉的一方）
+            self.pool.release(endpoint, None, ok=None)
+            raise
+        finally:
+            metrics.observe("upstream_request_duration_seconds", time.perf_counter() - start, labels)
+        elapsed = time.perf_counter() - start
+        self.pool.release(endpoint, elapsed, ok=response.status_code not in FAILURE_STATUS_CODES)
+        metrics.inc("upstream_responses_total", {**labels, "upstream": endpoint.name, "status": str(response.status_code)})
+        if response.is_success:
+            self._latency.setdefault(kind, LatencyWindow()).add(elapsed)
+        return response
+
+    def _build_request(self, endpoint: UpstreamEndpoint, json: Dict[str, Any], headers: Dict[str, str]) -> httpx.Request:
+        headers = {**headers, "Authorization": f"Bearer {endpoint.api_key}"}
+        return self.client.build_request("POST", endpoint.url, json=json, headers=headers)
+
+    # 发起流式请求，返回尚未读取响应体的响应；调用方负责 aclose()
+    # 在收到响应体之前失败的尝试可以安全重试；流式请求不做对冲
+    async def open_stream(self, json: Dict[str, Any], headers: Dict[str, str], kind: str = "chat_stream") -> httpx.Response:
+        self._counts["requests"] += 1
+        self.retry_budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                response = await self._open_stream_attempt(json, headers, kind)
+            except RETRYABLE_ERRORS as e:
+                if not self._can_retry(attempt, kind, type(e).__name__):
+                    raise
+                delay = self._retry_delay(attempt)
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or not self._can_retry(attempt, kind, str(response.status_code)):
+                    return response
+                delay = self._retry_delay(attempt, response)
+                await response.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _open_stream_attempt(self, json: Dict[str, Any], headers: Dict[str, str], kind: str) -> httpx.Response:
+        endpoint = self.pool.acquire()
+        labels = {"kind": kind}
+        start = time.perf_counter()
+        try:
+            request = self._build_request(endpoint, json, headers)
+            response = await self.client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            self.pool.release(endpoint, time.perf_counter() - start, ok=False)
+            metrics.inc("upstream_errors_total", {**labels, "upstream": endpoint.name, "error": type(e).__name__})
+            raise
+        except BaseException:
+            self.pool.release(endpoint, None, ok=None)
+            raise
+        ttfb = time.perf_counter() - start
+        metrics.observe("upstream_ttfb_seconds", ttfb, labels)
+        metrics.inc("upstream_responses_total", {**labels, "upstream": endpoint.name, "status": str(response.status_code)})
+        # 流式请求以首字节时间计入延迟，流关闭时才释放进行中计数
+        release = lambda: self.pool.release(endpoint, ttfb, ok=response.status_code not in FAILURE_STATUS_CODES)
+        if response.is_closed:
+            release()
+        else:
+            response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    # 重试和对冲统计
+    def resilience_stats(self) -> Dict[str, Any]:
+        cfg = self.config
+        requests = self._counts["requests"]
+        return {
+            **self._counts,
+            "retryRate": round(self._counts["retries"] / requests, 4) if requests else 0.0,
+            "hedgeRate": round(self._counts["hedges"] / requests, 4) if requests else 0.0,
+            "maxRetries": cfg.max_retries,
+            "retryBudgetTokens": round(self.retry_budget.tokens, 3),
+            "retryBudgetExhausted": self.retry_budget.exhausted,
+            "hedgeEnabled": cfg.hedge,
+            "hedgeDelays": {kind: round(self.hedge_delay(kind), 3) for kind in self._latency} if cfg.hedge else {},
+        }
+
+    # 连接池统计信息
+    def stats(self) -> Dict[str, Any]:
+        cfg = self.config
+        stats: Dict[str, Any] = {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "limits": {
+                "maxConnections": cfg.max_connections,
+                "maxKeepaliveConnections": cfg.max_keepalive_connections,
+                "keepaliveExpiry": cfg.keepalive_expiry,
+            },
+            "timeouts": {
+                "connect": cfg.connect_timeout,
+                "read": cfg.read_timeout,
+                "write": cfg.write_timeout,
+                "pool": cfg.pool_timeout,
+            },
+            "connections": 0,
+            "idle": 0,
+            "active": 0,
+            "http2Connections": 0,
+            "pendingRequests": 0,
+            "resilience": self.resilience_stats(),
+        }
+        if self._client is None:
+            return stats
+
+        # httpx 没有公开连接池统计接口，这里读取 httpcore 连接池的状态
+        pool = getattr(self._client._transport, "_pool", None)
+        if pool is None:
+            return stats
+        connections = list(getattr(pool, "connections", []))
+        stats["connections"] = len(connections)
+        for connection in connections:
+            if connection.is_idle():
+                stats["idle"] += 1
+            else:
+                stats["active"] += 1
+            if "HTTP/2" in repr(connection):
+                stats["http2Connections"] += 1
+        stats["pendingRequests"] = sum(
+            1 for request in list(getattr(pool, "_requests", [])) if request.is_queued()
+        )
+        return stats
@@ -0,0 +1,171 @@
+import json
+import os
+import random
+import time
+from typing import Optional, Dict, Any, List
+
+from env import env_float, env_int
+
+# 计入熔断的上游状态码：鉴权失败（密钥失效）、限流和服务端错误
+FAILURE_STATUS_CODES = frozenset({401, 403, 429, 500, 502, 503, 504})
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+# 单个上游端点（地址 + 密钥），带EWMA延迟、进行中请求数和熔断器状态
+class UpstreamEndpoint:
+    def __init__(self, name: str, url: str, api_key: str, weight: float = 1.0):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.weight = weight
+        self.ewma: Optional[float] = None
+        self.outstanding = 0
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.selected = 0
+        self.successes = 0
+        self.failures = 0
+        self.ejections = 0
+
+    # 负载得分：EWMA延迟 ×（进行中请求数 + 1）/ 权重；没有延迟样本时使用默认延迟
+    def score(self, default_latency: float) -> float:
+        latency = self.ewma if self.ewma is not None else default_latency
+        return latency * (self.outstanding + 1) / self.weight
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "weight": self.weight,
+            "state": self.state,
+            "ewmaMs": round(self.ewma * 1000, 3) if self.ewma is not None else None,
+            "outstanding": self.outstanding,
+            "selected": self.selected,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutiveFailures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "openForSeconds": round(now - self.opened_at, 3) if self.state != CLOSED else None,
+        }
+
+
+# 上游端点池：power-of-two-choices 按负载得分选择端点，连续失败的端点被熔断，冷却后放行一个探测请求
+class UpstreamPool:
+    def __init__(
+        self,
+        endpoints: List[UpstreamEndpoint],
+        ewma_alpha: float = 0.3,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+    ):
+        self.endpoints = endpoints
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+    # UPSTREAMS 为JSON数组，例如 [{"name": "a", "url": "...", "apiKey": "..."}, {"url": "...", "apiKeyEnv": "KEY_B", "weight": 2}]
+    # 没有配置时使用 OPENAI_BASE_URL 和 OPENAI_API_KEY 作为唯一端点
+    @classmethod
+    def from_env(cls) -> "UpstreamPool":
+        default_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1/chat/completions")
+        endpoints = []
+        raw = os.getenv("UPSTREAMS", "").strip()
+        if raw:
+            for i, item in enumerate(json.loads(raw)):
+                api_key = item.get("apiKey") or os.getenv(item.get("apiKeyEnv", ""), "") or os.getenv("OPENAI_API_KEY", "")
+                if api_key:
+                    endpoints.append(UpstreamEndpoint(
+                        name=item.get("name") or f"upstream-{i}",
+                        url=item.get("url") or default_url,
+                        api_key=api_key,
+                        weight=float(item.get("weight", 1.0)),
+                    ))
+        elif os.getenv("OPENAI_API_KEY"):
+            endpoints.append(UpstreamEndpoint("default", default_url, os.getenv("OPENAI_API_KEY")))
+        return cls(
+            endpoints,
+            ewma_alpha=env_float("UPSTREAM_EWMA_ALPHA", 0.3),
+            failure_threshold=env_int("UPSTREAM_BREAKER_FAILURES", 5),
+            cooldown=env_float("UPSTREAM_BREAKER_COOLDOWN", 30.0),
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self.endpoints)
+
+    def _available(self, endpoint: UpstreamEndpoint, now: float) -> bool:
+        if endpoint.state == CLOSED:
+            return True
+        if endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown:
+            endpoint.state = HALF_OPEN
+        # 半开状态同时只放行一个探测请求
+        return endpoint.state == HALF_OPEN and not endpoint.probing
+
+    # 选择一个端点并计入进行中请求；调用方必须在请求结束后调用 release()
+    def acquire(self) -> UpstreamEndpoint:
+        if not self.endpoints:
+            raise RuntimeError("No upstream endpoints are configured")
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if self._available(e, now)]
+        if not candidates:
+            # 所有端点都被熔断时，尝试熔断时间最长的端点，而不是直接拒绝所有请求
+            endpoint = min(self.endpoints, key=lambda e: e.opened_at)
+        elif len(candidates) == 1:
+            endpoint = candidates[0]
+        else:
+            # 没有延迟样本的端点按已知端点的平均延迟计算，冷启动时按进行中请求数分摊
+            known = [e.ewma for e in candidates if e.ewma is not None]
+            default_latency = sum(known) / len(known) if known else 1.0
+            first, second = random.sample(candidates, 2)
+            endpoint = first if first.score(default_latency) <= second.score(default_latency) else second
+
+        if endpoint.state == HALF_OPEN:
+            endpoint.probing = True
+        endpoint.selected += 1
+        endpoint.outstanding += 1
+        return endpoint
+
+    # ok 为 None 表示请求被取消，只释放进行中计数，不影响延迟和熔断状态
+    def release(self, endpoint: UpstreamEndpoint, latency: Optional[float], ok: Optional[bool]) -> None:
+        endpoint.outstanding -= 1
+        if endpoint.state == HALF_OPEN:
+            endpoint.probing = False
+        if ok is None:
+            return
+
+        if latency is not None:
+            if endpoint.ewma is None:
+                if ok:
+                    endpoint.ewma = latency
+            elif ok:
+                endpoint.ewma += self.ewma_alpha * (latency - endpoint.ewma)
+            else:
+                # 快速失败（如连接被拒绝）不应让端点看起来更快
+                endpoint.ewma = max(endpoint.ewma, latency)
+
+        if ok:
+            endpoint.successes += 1
+            endpoint.consecutive_failures = 0
+            endpoint.state = CLOSED
+            return
+
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        # 探测失败立即重新熔断；熔断之前发出、之后才结束的请求不重复计时
+        if endpoint.state == HALF_OPEN or (endpoint.state == CLOSED and endpoint.consecutive_failures >= self.failure_threshold):
+            endpoint.state = OPEN
+            endpoint.opened_at = time.monotonic()
+            endpoint.ejections += 1
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "ewmaAlpha": self.ewma_alpha,
+            "failureThreshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+            "endpoints": [endpoint.stats(now) for endpoint in self.endpoints],
+        }
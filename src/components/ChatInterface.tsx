@@ -63,6 +63,12 @@ const ChatInterface = ({
   const [apiStatus, setApiStatus] = useState<"unknown" | "connected" | "error">("unknown");
   const [processingAutoMessage, setProcessingAutoMessage] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // 已注册章节的内容哈希，键为章节ID + 内容 + 检查点问题
+  const sectionHashes = useRef<Map<string, string>>(new Map());
+  // 会话的WebSocket连接：上下文只在变化时发送一次，回复逐块推送
+  const socketRef = useRef<WebSocket | null>(null);
+  const socketContextKey = useRef<string>("");
+  const socketWaiter = useRef<((frame: Record<string, any>) => void) | null>(null);
 
   // 当props中的sessionId变化时，更新本地的sessionId
   useEffect(() => {
@@ -71,6 +77,15 @@ const ChatInterface = ({
     }
   }, [propSessionId]);
 
+  // 会话变化或组件卸载时关闭WebSocket
+  useEffect(() => {
+    return () => {
+      socketRef.current?.close();
+      socketRef.current = null;
+      socketContextKey.current = "";
+    };
+  }, [sessionId]);
+
   // 自动滚动到最新消息
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -182,31 +197,185 @@ const ChatInterface = ({
     showSuccess("Chat messages cleared");
   };
 
-  // 发送消息到API
-  const sendMessageToAPI = async (content: string) => {
+  // 注册当前章节内容，返回内容哈希；同一章节只注册一次，失败时返回null
+  const registerSection = async (forceRefresh = false): Promise<string | null> => {
+    if (!currentSection || !sectionContent) {
+      return null;
+    }
+    const key = JSON.stringify([currentSection, sectionContent, lastCheckpointQuestion || null]);
+    if (!forceRefresh && sectionHashes.current.has(key)) {
+      return sectionHashes.current.get(key)!;
+    }
     try {
-      console.log(`Sending message to ${apiEndpoint}:`, content);
-      
-      // 准备发送到API的数据，包括上下文信息
-      const requestData = {
+      const response = await fetch("/api/sections", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+          sectionId: currentSection,
+          sectionContent: sectionContent,
+          checkpointQuestion: lastCheckpointQuestion || null,
+          sessionId: sessionId,
+        }),
+      });
+      if (!response.ok) {
+        return null;
+      }
+      const data = await response.json();
+      sectionHashes.current.set(key, data.sectionHash);
+      return data.sectionHash;
+    } catch (error) {
+      console.warn("Section registration failed, sending full section content:", error);
+      return null;
+    }
+  };
+
+  // 准备发送到API的数据：已注册的章节只发送哈希，否则发送完整的上下文信息
+  const buildRequestData = (content: string, sectionHash: string | null) => {
+    if (sectionHash) {
+      return {
         message: content,
         sessionId: sessionId,
         currentSection: currentSection || "",
-        sectionContent: sectionContent || "",
-        lastCheckpointQuestion: lastCheckpointQuestion || null,
+        sectionHash: sectionHash,
         userChoices: userChoices
       };
+    }
+    return {
+      message: content,
+      sessionId: sessionId,
+      currentSection: currentSection || "",
+      sectionContent: sectionContent || "",
+      lastCheckpointQuestion: lastCheckpointQuestion || null,
+      userChoices: userChoices
+    };
+  };
+
+  const postChat = (requestData: Record<string, any>) =>
+    fetch(apiEndpoint, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify(requestData),
+    });
+
+  // 建立（或复用）WebSocket连接；浏览器不支持或连接失败时返回null，改用HTTP
+  const connectSocket = (): Promise<WebSocket | null> => {
+    const existing = socketRef.current;
+    if (existing && existing.readyState === WebSocket.OPEN) {
+      return Promise.resolve(existing);
+    }
+    if (typeof WebSocket === "undefined") {
+      return Promise.resolve(null);
+    }
+    return new Promise((resolve) => {
+      const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
+      const socket = new WebSocket(`${protocol}//${window.location.host}${apiEndpoint}/ws?sessionId=${encodeURIComponent(sessionId)}`);
+      socket.onopen = () => {
+        socketRef.current = socket;
+        socketContextKey.current = "";
+        resolve(socket);
+      };
+      socket.onerror = () => resolve(null);
+      socket.onclose = () => {
+        if (socketRef.current === socket) {
+          socketRef.current = null;
+        }
+        socketWaiter.current?.({ type: "error", status: 0, detail: "WebSocket closed" });
+      };
+      socket.onmessage = (event) => {
+        const frame = JSON.parse(event.data);
+        if (frame.type === "ping") {
+          socket.send(JSON.stringify({ type: "pong" }));
+        } else if (frame.type === "summary") {
+          console.log(`Section ${frame.sectionId} summary is ready`);
+        } else {
+          socketWaiter.current?.(frame);
+        }
+      };
+    });
+  };
+
+  // 通过WebSocket发送消息并流式显示回复；回复开始之前失败时返回null，由调用方用同一个turnId改用HTTP
+  const sendViaSocket = async (content: string, turnId: string): Promise<string | null> => {
+    const socket = await connectSocket();
+    if (!socket) {
+      return null;
+    }
+    const sectionHash = await registerSection();
+    const context: Record<string, any> = { ...buildRequestData(content, sectionHash) };
+    delete context.message;
+    const contextKey = JSON.stringify(context);
+    
+    return new Promise((resolve) => {
+      let chunks = "";
+      let started = false;
+      const finish = (result: string | null) => {
+        socketWaiter.current = null;
+        resolve(result);
+      };
+      socketWaiter.current = (frame) => {
+        if (frame.type === "ready") {
+          socketContextKey.current = contextKey;
+          socket.send(JSON.stringify({ type: "message", message: content, id: turnId }));
+        } else if (frame.type === "start") {
+          started = true;
+          setMessages(prev => [...prev, { id: turnId, content: "", isUser: false, timestamp: new Date() }]);
+        } else if (frame.type === "delta") {
+          chunks += frame.delta;
+          setMessages(prev => prev.map(m => m.id === turnId ? { ...m, content: chunks } : m));
+        } else if (frame.type === "done") {
+          setMessages(prev => prev.map(m => m.id === turnId ? { ...m, content: frame.response } : m));
+          setApiStatus("connected");
+          finish(frame.response);
+        } else if (frame.type === "error") {
+          console.warn("WebSocket chat failed:", frame.status, frame.detail);
+          if (!started) {
+            // 回复开始之前失败（如章节哈希失效、上游错误）时改用HTTP重新发送
+            finish(null);
+            return;
+          }
+          // 回复已经开始，服务端已记录这一轮，重发会重复用户消息；保留已收到的部分并提示错误
+          const partial = chunks || generateFallbackResponse(content);
+          setMessages(prev => prev.map(m => m.id === turnId ? { ...m, content: partial } : m));
+          setApiStatus("error");
+          showError("The reply was interrupted. Please try again.");
+          finish(partial);
+        }
+      };
+      if (socketContextKey.current === contextKey) {
+        socket.send(JSON.stringify({ type: "message", message: content, id: turnId }));
+      } else {
+        socket.send(JSON.stringify({ type: "context", ...context }));
+      }
+    });
+  };
+
+  // 发送消息到API
+  const sendMessageToAPI = async (content: string) => {
+    // 同一条消息的WebSocket和HTTP请求使用同一个turnId，服务端据此去重
+    const turnId = Date.now().toString();
+    const socketResponse = await sendViaSocket(content, turnId).catch(() => null);
+    if (socketResponse !== null) {
+      return socketResponse;
+    }
+    
+    try {
+      console.log(`Sending message to ${apiEndpoint}:`, content);
+      
+      const requestData = { ...buildRequestData(content, await registerSection()), turnId };
       
       console.log("Sending context data:", JSON.stringify(requestData, null, 2));
       
       // 调用API
-      const response = await fetch(apiEndpoint, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify(requestData),
-      });
+      let response = await postChat(requestData);
+      
+      // 服务端不再有该章节（被淘汰或服务重启），重新注册后重试一次
+      if (response.status === 409 && "sectionHash" in requestData) {
+        response = await postChat({ ...buildRequestData(content, await registerSection(true)), turnId });
+      }
       
       console.log("API response status:", response.status);
       
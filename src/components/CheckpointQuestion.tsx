@@ -5,6 +5,7 @@ import { RadioGroup, RadioGroupItem } from "@/components/ui/radio-group";
 import { Label } from "@/components/ui/label";
 import { Check, Loader2 } from "lucide-react";
 import { showSuccess, showError } from "@/utils/toast";
+import { loadCheckpointBank } from "@/utils/checkpointBank";
 
 interface Option {
   id: string;
@@ -48,23 +49,16 @@ const CheckpointQuestion = ({
     setIsLoading(true);
     
     try {
-      // 尝试从API获取问题
-      const response = await fetch("/api/checkpoint", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ sectionId }),
-      });
+      // 从页面已经加载的题库中取问题，不再为每个章节单独请求
+      const bank = await loadCheckpointBank();
 
       let questionData: QuestionData;
       
-      if (response.ok) {
-        // 如果API调用成功，使用API返回的数据
-        questionData = await response.json();
+      if (bank && bank[sectionId]) {
+        questionData = bank[sectionId];
       } else {
-        // 如果API调用失败，使用本地数据
-        console.warn("API call failed, using local fallback data");
+        // 题库加载失败或没有该章节时，使用本地数据
+        console.warn("Checkpoint question not in bank, using local fallback data");
         questionData = getLocalQuestionData(sectionId);
       }
       
@@ -73,6 +67,9 @@ const CheckpointQuestion = ({
       setOptions(questionData.options);
       setCorrectAnswerId(questionData.correctAnswerId);
       
+      // 章节打开时让服务端预生成与答案无关的章节总结（服务端未开启时忽略）
+      pregenerateSummary(questionData);
+      
       // 重置状态
       setSelectedOption("");
       setIsCorrect(null);
@@ -98,6 +95,25 @@ const CheckpointQuestion = ({
     }
   };
 
+  // 预生成章节总结，不等待结果
+  const pregenerateSummary = (questionData: QuestionData) => {
+    if (!sectionContent) {
+      return;
+    }
+    fetch("/api/summary/pregenerate", {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+      },
+      body: JSON.stringify({
+        sessionId,
+        sectionId,
+        sectionContent,
+        checkpointQuestion: questionData
+      }),
+    }).catch((error) => console.warn("Failed to pregenerate summary:", error));
+  };
+
   // 组件加载时获取问题
   useEffect(() => {
     fetchQuestion();
@@ -120,8 +136,8 @@ const CheckpointQuestion = ({
         correctAnswerId
       };
       
-      // 调用summary API
-      const response = await fetch("/api/summary", {
+      // 调用summary API（异步模式：服务端立即返回任务ID，总结生成后之后的聊天会自动使用）
+      const response = await fetch("/api/summary?mode=async", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -136,7 +152,10 @@ const CheckpointQuestion = ({
         }),
       });
       
-      if (response.ok) {
+      if (response.status === 202) {
+        const data = await response.json();
+        console.log("Summary job queued:", data.jobId);
+      } else if (response.ok) {
         const data = await response.json();
         console.log("Summary created successfully:", data.summary);
       } else {
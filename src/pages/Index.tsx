@@ -8,6 +8,7 @@ import ChatInterface from "@/components/ChatInterface";
 import CheckpointQuestion from "@/components/CheckpointQuestion";
 import ApiStatus from "@/components/ApiStatus";
 import { showError, showSuccess } from "@/utils/toast";
+import { loadCheckpointBank } from "@/utils/checkpointBank";
 
 // 定义章节结构
 interface Section {
@@ -188,6 +189,12 @@ const Index = () => {
   // 获取检查点问题
   const fetchCheckpointQuestion = async (sectionId: string) => {
     try {
+      const bank = await loadCheckpointBank();
+      if (bank && bank[sectionId]) {
+        setLastCheckpointQuestion(bank[sectionId]);
+        return;
+      }
+      
       const response = await fetch("/api/checkpoint", {
         method: "POST",
         headers: {
@@ -0,0 +1,27 @@
+// 检查点问题结构
+export interface CheckpointOption {
+  id: string;
+  text: string;
+}
+
+export interface CheckpointQuestionData {
+  question: string;
+  options: CheckpointOption[];
+  correctAnswerId: string;
+}
+
+let checkpointBank: Promise<Record<string, CheckpointQuestionData> | null> | null = null;
+
+// 批量获取整个课程的检查点问题（整个页面只请求一次，页面和检查点组件共用）
+export const loadCheckpointBank = () => {
+  if (!checkpointBank) {
+    checkpointBank = fetch("/api/checkpoints")
+      .then(response => response.ok ? response.json() : null)
+      .then(data => data ? data.questions as Record<string, CheckpointQuestionData> : null)
+      .catch(error => {
+        console.warn("Failed to prefetch checkpoint questions:", error);
+        return null;
+      });
+  }
+  return checkpointBank;
+};
@@ -13,6 +13,8 @@ export default defineConfig(() => ({
         target: 'http://localhost:8000',
         changeOrigin: true,
         secure: false,
+        // 同时代理 /api/chat/ws 的WebSocket连接
+        ws: true,
         rewrite: (path) => path,
         configure: (proxy, _options) => {
           proxy.on('error', (err, _req, _res) => {